@@ -0,0 +1,115 @@
+"""
+JSON catalog API.
+
+Clients pick the fields they need (``?fields=id,name,price``) and page
+through medicines with the storefront's keyset cursor (``?after=<id>``), or
+fetch up to a page of them by id (``?ids=3,1,2``). Rows are read with
+``values_list`` over exactly the requested columns and zipped straight
+into dicts for the JSON encoder, so no model instances are built. The
+category name is joined into the same query, and images, when requested,
+come from one more query for the whole page: two queries at most, whatever
+the page size. Each image is the processed JPEG/WebP variant set the
+storefront cards use (``images.picture``); uploads not processed yet are
+left out, since nothing serves them.
+
+Stock is left out on purpose. It changes with every order, and the catalog
+version behind these responses' ETags (see ``catalog.py``) does not.
+"""
+from django.conf import settings
+
+from .catalog import parse_page_args
+from .images import picture
+from .models import Category, Medicine, ProductImage
+
+MEDICINE_FIELDS = (
+    ('id', 'id'),
+    ('sku', 'sku'),
+    ('name', 'name'),
+    ('price', 'price'),
+    ('description', 'description'),
+    ('category_id', 'category_id'),
+    ('category', 'category__name'),
+)
+
+# Not a column: filled from ProductImage after the page is read.
+IMAGES = 'images'
+
+CATEGORY_FIELDS = (
+    ('id', 'id'),
+    ('name', 'name'),
+)
+
+
+class BadQuery(ValueError):
+    pass
+
+
+def parse_fields(value, columns, extra=()):
+    """The requested field names in order (all of them if ``value`` is empty)."""
+    known = [name for name, _ in columns] + list(extra)
+    if not value:
+        return known
+    fields = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in known]
+    if unknown:
+        raise BadQuery(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def parse_ids(value):
+    try:
+        ids = list(dict.fromkeys(int(part) for part in value.split(',') if part.strip()))
+    except ValueError:
+        raise BadQuery("ids must be comma-separated integers")
+    if len(ids) > settings.MEDSTORE_CATALOG_MAX_PAGE_SIZE:
+        raise BadQuery(f"At most {settings.MEDSTORE_CATALOG_MAX_PAGE_SIZE} ids per request")
+    return ids
+
+
+def _medicine_rows(qs, fields):
+    # Rows always carry the id, which keys the images and the cursor;
+    # callers project them down to ``fields``.
+    columns = dict(MEDICINE_FIELDS)
+    names = ['id'] + [name for name in fields if name in columns and name != 'id']
+    rows = [dict(zip(names, row)) for row in qs.values_list(*(columns[name] for name in names))]
+    if IMAGES in fields and rows:
+        images = {row['id']: [] for row in rows}
+        for med_id, variants in ProductImage.objects.filter(medicine_id__in=list(images)).exclude(digest='') \
+                .order_by('id').values_list('medicine_id', 'variants'):
+            image = picture(variants)
+            if image:
+                images[med_id].append(image)
+        for row in rows:
+            row[IMAGES] = images[row['id']]
+    return rows
+
+
+def _only(row, fields):
+    return {name: row[name] for name in fields}
+
+
+def medicine_page(params):
+    """``{'results': [...], 'next': cursor}`` for a page of the catalog."""
+    fields = parse_fields(params.get('fields'), MEDICINE_FIELDS, [IMAGES])
+    after, size = parse_page_args(params)
+    rows = _medicine_rows(Medicine.objects.filter(id__gt=after).order_by('id')[:size + 1], fields)
+    next_cursor = rows[size - 1]['id'] if len(rows) > size else None
+    return {'results': [_only(row, fields) for row in rows[:size]], 'next': next_cursor}
+
+
+def medicines_by_id(params):
+    """``{'results': [...], 'missing': [...]}`` in the order the ids were asked for."""
+    fields = parse_fields(params.get('fields'), MEDICINE_FIELDS, [IMAGES])
+    ids = parse_ids(params['ids'])
+    found = {row['id']: row for row in _medicine_rows(Medicine.objects.filter(id__in=ids), fields)}
+    return {
+        'results': [_only(found[med_id], fields) for med_id in ids if med_id in found],
+        'missing': [med_id for med_id in ids if med_id not in found],
+    }
+
+
+def categories(params):
+    fields = parse_fields(params.get('fields'), CATEGORY_FIELDS)
+    columns = dict(CATEGORY_FIELDS)
+    rows = Category.objects.order_by('id').values_list(*(columns[name] for name in fields))
+    return {'results': [dict(zip(fields, row)) for row in rows]}
@@ -0,0 +1,98 @@
+"""
+Async views for ASGI deployments (see ``MEDSTORE_ASYNC_VIEWS``).
+
+They share templates, helpers and responses with ``views.py`` but use the
+async ORM and await the password hash pool, so a slow client or a slow hash
+does not hold a worker thread. Querysets are fully read before rendering,
+because templates run synchronously and must not touch the database.
+"""
+import asyncio
+
+from django.shortcuts import render, redirect
+
+from .catalog import parse_page_args, apage_ids, aget_cards, assemble_cards, conditional_catalog
+from .inbox import parse_inbox_args, ainbox_page
+from .models import ContactMessage
+from .passwords import averify_password, PasswordCheckBusy
+from .reports import parse_report_args, aorder_report
+from .stats import adashboard_stats
+from .users import afind_user
+from .views import admin_required, login_success
+
+
+@conditional_catalog()
+async def show_home_page(request):
+    after, size = parse_page_args(request.GET)
+    ids, next_cursor = await apage_ids(after, size)
+    cards = assemble_cards(request, await aget_cards(ids, request.catalog_version))
+    return render(request, 'medstore_app/home.html', {
+        'cards': cards,
+        'next_cursor': next_cursor,
+        'page_size': size if request.GET.get('size') else None,
+        'user': request.medstore_user,
+    })
+
+
+async def show_login_page(request):
+    if request.method == "GET":
+        if request.medstore_user:
+            return redirect('medstore_app:home')
+        return render(request, 'medstore_app/login.html')
+    return await login(request)
+
+
+async def login(request):
+    identifier = request.POST.get('identifier')
+    password = request.POST.get('password')
+
+    if not identifier or not password:
+        return render(request, 'medstore_app/login.html', {"error": "All fields are required"})
+
+    user = await afind_user(identifier)
+
+    if not user:
+        return render(request, 'medstore_app/login.html', {"error": "User not found. Please signup."})
+
+    try:
+        if not await averify_password(user, password):
+            return render(request, 'medstore_app/login.html', {"error": "Invalid login details"})
+    except PasswordCheckBusy as exc:
+        return render(request, 'medstore_app/login.html', {"error": str(exc)})
+
+    return login_success(request, user)
+
+
+async def _recent_messages(limit=5):
+    return [m async for m in ContactMessage.objects.order_by('-created_at')[:limit].aiterator()]
+
+
+@admin_required
+async def admin_dashboard(request):
+    # The counters and the recent messages are independent reads.
+    stats, recent_messages = await asyncio.gather(adashboard_stats(), _recent_messages())
+    return render(request, 'medstore_app/admin_dashboard.html', {
+        **stats,
+        'recent_messages': recent_messages
+    })
+
+
+@admin_required
+async def admin_view_messages(request):
+    args = parse_inbox_args(request.GET)
+    msgs, next_cursor = await ainbox_page(**args)
+    return render(request, 'medstore_app/admin_view_messages.html', {
+        'messages': msgs,
+        'next_cursor': next_cursor,
+        'filters': args,
+    })
+
+
+@admin_required
+async def admin_view_orders(request):
+    args = parse_report_args(request.GET)
+    orders, next_cursor = await aorder_report(**args)
+    return render(request, 'medstore_app/admin_view_orders.html', {
+        'orders': orders,
+        'next_cursor': next_cursor,
+        'filters': args,
+    })
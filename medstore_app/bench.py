@@ -0,0 +1,185 @@
+"""
+Helpers shared by the ``bench_*`` and ``run_benchmarks`` management commands.
+
+Benchmarks never touch real data: ``scratch_database`` builds a throwaway
+test database (the same way ``manage.py test`` does) and tears it down again.
+``seed_store`` fills it with bulk factories, and ``compare_to_baseline``
+checks a run against a stored JSON baseline.
+"""
+import importlib
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections
+from django.test.utils import override_settings
+from django.urls import clear_url_caches
+
+
+@contextmanager
+def scratch_database(alias='default', on_disk=False):
+    """
+    A throwaway test database for the duration of the block. SQLite test
+    databases live in shared-cache memory, where concurrent writers lock
+    whole tables. ``on_disk`` puts it in a temporary file instead, so load
+    tests see WAL behaviour like production.
+    """
+    creation = connections[alias].creation
+    old_name = connections[alias].settings_dict['NAME']
+    old_test_name = connections[alias].settings_dict['TEST']['NAME']
+    tmpdir = None
+    if on_disk and connections[alias].vendor == 'sqlite':
+        tmpdir = tempfile.TemporaryDirectory(prefix='medstore-bench-')
+        connections[alias].settings_dict['TEST']['NAME'] = os.path.join(tmpdir.name, 'bench.sqlite3')
+    creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    # Point test mirrors (the read replica) at the scratch database too.
+    mirrors = {
+        other: connections[other].settings_dict['NAME'] for other in connections
+        if connections[other].settings_dict.get('TEST', {}).get('MIRROR') == alias
+    }
+    for other in mirrors:
+        connections[other].close()
+        connections[other].creation.set_as_test_mirror(connections[alias].settings_dict)
+    try:
+        yield
+    finally:
+        for other, name in mirrors.items():
+            connections[other].close()
+            connections[other].settings_dict['NAME'] = name
+        creation.destroy_test_db(old_name, verbosity=0)
+        connections[alias].settings_dict['TEST']['NAME'] = old_test_name
+        if tmpdir:
+            tmpdir.cleanup()
+
+
+def _reload_urls():
+    from medstore_app import urls
+    importlib.reload(urls)
+    clear_url_caches()
+
+
+@contextmanager
+def async_views(enabled=True):
+    """Serve the sync or async view variants in-process, as under WSGI/ASGI."""
+    try:
+        with override_settings(MEDSTORE_ASYNC_VIEWS=enabled):
+            _reload_urls()
+            yield
+    finally:
+        _reload_urls()
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    """``{'p50': ..., 'p95': ..., 'p99': ..., 'mean': ...}`` in milliseconds."""
+    ordered = sorted(samples)
+    result = {}
+    for p in points:
+        index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+        result[f'p{p}'] = ordered[index] * 1000
+    result['mean'] = statistics.fmean(ordered) * 1000
+    return result
+
+
+def time_calls(fn, args_list):
+    """Call ``fn(*args)`` for each entry and return the per-call wall times (seconds)."""
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def format_row(label, stats):
+    return f"{label:<24} " + "  ".join(f"{k}={v:8.3f}ms" for k, v in stats.items())
+
+
+def bulk_insert(model, rows, batch_size=10000):
+    """``bulk_create`` an iterable of unsaved instances in batches without holding them all."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            model.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+
+
+def seed_store(users=1000, categories=20, medicines=5000, orders=20000, items_per_order=3, seed=1,
+               password='bench'):
+    """
+    Fill the (scratch) database with a store of the given size using bulk
+    inserts, then rebuild the dashboard counters the inserts bypassed. Every
+    user's password is ``password``.
+    """
+    from .models import User, Category, Medicine, Order, OrderItem
+    from .stats import expected_stats, write_stats
+
+    rng = random.Random(seed)
+    encoded = make_password(password)
+    bulk_insert(User, (
+        User(username=f'user{i}', email=f'user{i}@example.com', mobile=f'9{i:09d}', password=encoded)
+        for i in range(users)
+    ))
+    cats = Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(categories)])
+    bulk_insert(Medicine, (
+        Medicine(name=f'Medicine {i}', price=Decimal(rng.randint(100, 50000)) / 100,
+                 stock=rng.randint(0, 500), description=f'Description of medicine {i}',
+                 category=rng.choice(cats))
+        for i in range(medicines)
+    ))
+    customers = list(User.objects.values_list('id', 'username', 'email'))
+    meds = list(Medicine.objects.values_list('id', 'price', 'name', 'category__name'))
+    statuses = ['placed', 'placed', 'pending', 'delivered']
+    for start in range(0, orders, 5000):
+        lines, batch = [], []
+        for _ in range(min(5000, orders - start)):
+            picked = [(rng.choice(meds), rng.randint(1, 3)) for _ in range(items_per_order)]
+            lines.append(picked)
+            user_id, username, email = rng.choice(customers)
+            batch.append(Order(user_id=user_id, customer_name=username, customer_email=email,
+                               status=rng.choice(statuses),
+                               total_amount=sum(med[1] * qty for med, qty in picked)))
+        created = Order.objects.bulk_create(batch)
+        bulk_insert(OrderItem, (
+            OrderItem(order_id=order.id, medicine_id=med_id, price=price, quantity=qty,
+                      medicine_name=name, category_name=category)
+            for order, picked in zip(created, lines) for (med_id, price, name, category), qty in picked
+        ))
+    write_stats(expected_stats(User, Medicine, Order))
+
+
+COMPARED_METRICS = ('p50', 'p95', 'queries', 'rps')
+
+
+def compare_to_baseline(baseline, current, tolerance, query_tolerance=0):
+    """
+    Regressions of ``current`` against ``baseline``, as messages. Both map
+    ``scenario -> {metric: value}``. Latencies (ms) may grow by a factor of
+    ``tolerance``, throughput (``rps``) may shrink by it, and query counts may
+    grow by at most ``query_tolerance`` queries. Only ``COMPARED_METRICS`` are
+    checked (tail percentiles are too noisy); scenarios or metrics missing from
+    either side are skipped.
+    """
+    problems = []
+    for scenario, metrics in sorted(current.items()):
+        base = baseline.get(scenario, {})
+        for metric, value in sorted(metrics.items()):
+            if metric not in base or metric not in COMPARED_METRICS:
+                continue
+            was = base[metric]
+            if metric == 'queries':
+                failed = value > was + query_tolerance
+            elif metric == 'rps':
+                failed = value < was * (1 - tolerance)
+            else:
+                failed = value > was * (1 + tolerance)
+            if failed:
+                problems.append(f"{scenario}.{metric}: {value:g} vs baseline {was:g}")
+    return problems
@@ -0,0 +1,50 @@
+"""
+Session-backed shopping cart.
+
+The cart lives in the session as ``{medicine_id: quantity}`` (keys are
+strings, since sessions are JSON-serialised) and is only turned into an
+order by ``orders.checkout``.
+"""
+from django.conf import settings
+
+CART_SESSION_KEY = 'cart'
+
+
+class Cart:
+
+    def __init__(self, session):
+        self.session = session
+        self._lines = session.get(CART_SESSION_KEY) or {}
+
+    def _save(self):
+        self.session[CART_SESSION_KEY] = self._lines
+        self.session.modified = True
+
+    def lines(self):
+        """The cart as ``{medicine_id: quantity}`` with int keys."""
+        return {int(med_id): qty for med_id, qty in self._lines.items()}
+
+    def add(self, med_id, qty=1):
+        return self.set(med_id, self._lines.get(str(med_id), 0) + qty)
+
+    def set(self, med_id, qty):
+        """Set a line's quantity (removing it below 1). False if the cart is full."""
+        if qty < 1:
+            self.remove(med_id)
+            return True
+        if str(med_id) not in self._lines and len(self._lines) >= settings.MEDSTORE_CART_MAX_LINES:
+            return False
+        self._lines[str(med_id)] = min(qty, settings.MEDSTORE_CART_MAX_QUANTITY)
+        self._save()
+        return True
+
+    def remove(self, med_id):
+        if self._lines.pop(str(med_id), None) is not None:
+            self._save()
+
+    def clear(self):
+        self._lines = {}
+        self._save()
+
+    def __len__(self):
+        return len(self._lines)
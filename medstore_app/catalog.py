@@ -0,0 +1,225 @@
+"""
+Storefront catalog: keyset pagination and the cached product-card layer.
+
+Pages are addressed by the last medicine id already shown (``?after=<id>``)
+so every page is a single indexed range scan on the primary key, no matter
+how deep into the catalog the visitor is. ``apage_ids`` and ``aget_cards``
+are the same steps on the async ORM and cache APIs.
+
+The catalog version is a microsecond timestamp in the single
+``CatalogVersion`` row. It moves forward inside the transaction of every
+write to a medicine, category or product image (see ``signals.py``), and
+of every catalog import batch. Being in the database, it is the same for
+every worker process, and a reader that sees the new rows also sees the
+new version.
+
+Each product card is rendered once and cached under its medicine id and
+the catalog version, so a write makes every cached card unreachable in
+every process at once, whatever cache backend is configured.
+``conditional_catalog`` derives ``ETag`` and ``Last-Modified`` from the
+version and answers a matching revalidation with 304 before the view
+runs, after a single primary-key lookup.
+"""
+import datetime as dt
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db.models import F, Prefetch
+from django.db.models.functions import Greatest
+from django.template.loader import render_to_string
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+from django.middleware.csrf import get_token
+from django.views.decorators.http import condition
+
+from .images import picture
+from .models import CatalogVersion, Medicine, ProductImage
+
+CARD_KEY = 'medstore:card:%s:%s'
+
+# Cards are shared between visitors, so the per-visitor CSRF input is cut
+# out of the cached HTML and spliced back in when the page is assembled.
+CSRF_PLACEHOLDER = '<!--medstore-csrf-->'
+
+
+def card_key(med_id, version):
+    return CARD_KEY % (med_id, version)
+
+
+def parse_page_args(params):
+    """Return ``(after_id, page_size)`` from a GET querydict, clamped to sane values."""
+    try:
+        after = max(0, int(params.get('after') or 0))
+    except ValueError:
+        after = 0
+    try:
+        size = int(params.get('size') or settings.MEDSTORE_CATALOG_PAGE_SIZE)
+    except ValueError:
+        size = settings.MEDSTORE_CATALOG_PAGE_SIZE
+    size = min(max(1, size), settings.MEDSTORE_CATALOG_MAX_PAGE_SIZE)
+    return after, size
+
+
+def page_ids(after=0, size=None):
+    """Ids of the next page after ``after`` and the cursor for the page after it."""
+    size = size or settings.MEDSTORE_CATALOG_PAGE_SIZE
+    ids = list(
+        Medicine.objects.filter(id__gt=after)
+        .order_by('id')
+        .values_list('id', flat=True)[:size + 1]
+    )
+    next_cursor = ids[size - 1] if len(ids) > size else None
+    return ids[:size], next_cursor
+
+
+async def apage_ids(after=0, size=None):
+    size = size or settings.MEDSTORE_CATALOG_PAGE_SIZE
+    qs = Medicine.objects.filter(id__gt=after).order_by('id').values_list('id', flat=True)[:size + 1]
+    ids = [med_id async for med_id in qs.aiterator()]
+    next_cursor = ids[size - 1] if len(ids) > size else None
+    return ids[:size], next_cursor
+
+
+def card_queryset(ids):
+    """The medicines for ``ids`` with their processed images (two queries)."""
+    images = ProductImage.objects.exclude(digest='').order_by('id').only('medicine_id', 'variants')
+    return Medicine.objects.filter(id__in=ids).prefetch_related(
+        Prefetch('productimage_set', queryset=images, to_attr='processed_images')
+    )
+
+
+def render_card(med):
+    images = getattr(med, 'processed_images', None)
+    return render_to_string('medstore_app/product_card.html', {
+        'p': med,
+        'image': picture(images[0].variants) if images else None,
+        'csrf_input': mark_safe(CSRF_PLACEHOLDER),
+    })
+
+
+def get_cards(ids, version):
+    """
+    Rendered card HTML for ``ids`` in order, as of catalog ``version``.
+    Cached cards come back in one cache round-trip; only the misses are
+    loaded from the DB and rendered.
+    """
+    keys = {med_id: card_key(med_id, version) for med_id in ids}
+    cached = cache.get_many(keys.values())
+    missing = [med_id for med_id in ids if keys[med_id] not in cached]
+    if missing:
+        fresh = {}
+        for med in card_queryset(missing):
+            fresh[keys[med.id]] = render_card(med)
+        cache.set_many(fresh, settings.MEDSTORE_CARD_CACHE_TIMEOUT)
+        cached.update(fresh)
+    return [cached[keys[med_id]] for med_id in ids if keys[med_id] in cached]
+
+
+async def aget_cards(ids, version):
+    keys = {med_id: card_key(med_id, version) for med_id in ids}
+    cached = await cache.aget_many(keys.values())
+    missing = [med_id for med_id in ids if keys[med_id] not in cached]
+    if missing:
+        fresh = {}
+        async for med in card_queryset(missing).aiterator(chunk_size=len(missing)):
+            fresh[keys[med.id]] = render_card(med)
+        await cache.aset_many(fresh, settings.MEDSTORE_CARD_CACHE_TIMEOUT)
+        cached.update(fresh)
+    return [cached[keys[med_id]] for med_id in ids if keys[med_id] in cached]
+
+
+def assemble_cards(request, cards):
+    csrf_input = format_html(
+        '<input type="hidden" name="csrfmiddlewaretoken" value="{}">', get_token(request)
+    )
+    return [mark_safe(card.replace(CSRF_PLACEHOLDER, csrf_input)) for card in cards]
+
+
+def _now():
+    return time.time_ns() // 1000
+
+
+def _version_row():
+    return CatalogVersion.objects.filter(pk=1).values_list('version', flat=True)
+
+
+def catalog_version():
+    """The current catalog version; a missing row starts one now."""
+    version = _version_row().first()
+    if version is None:
+        version = CatalogVersion.objects.get_or_create(pk=1, defaults={'version': _now()})[0].version
+    return version
+
+
+async def acatalog_version():
+    version = await _version_row().afirst()
+    if version is None:
+        version = (await CatalogVersion.objects.aget_or_create(pk=1, defaults={'version': _now()}))[0].version
+    return version
+
+
+def bump_catalog_version():
+    """
+    Move the catalog version forward. Call it inside the transaction that
+    writes the catalog, so the new rows and the new version commit together.
+    """
+    now = _now()
+    if not CatalogVersion.objects.filter(pk=1).update(version=Greatest(F('version') + 1, now)):
+        CatalogVersion.objects.get_or_create(pk=1, defaults={'version': now})
+
+
+def _personal_variant(request):
+    # The storefront greets the customer and embeds their CSRF token, so
+    # its validators also depend on who is asking. Pages carrying one-off
+    # flash messages are never served from a validator.
+    if len(messages.get_messages(request)):
+        return None
+    user = getattr(request, 'medstore_user', None)
+    who = f"{user.pk if user else ''}:{request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')}"
+    return hashlib.blake2b(who.encode(), digest_size=8).hexdigest()
+
+
+def conditional_catalog(personal=True):
+    """
+    Decorate a GET view whose output depends only on the catalog (plus the
+    visitor, when ``personal``). The ETag is weak: personal pages embed a
+    freshly masked CSRF token, so they are equivalent rather than identical.
+    Last-Modified is only offered for pages that are the same for everyone,
+    since If-Modified-Since cannot tell visitors apart. The view finds the
+    version it is answering for in ``request.catalog_version``.
+    """
+    def etag(request, *args, **kwargs):
+        version = request.catalog_version
+        if not personal:
+            return f'W/"{version}"'
+        variant = _personal_variant(request)
+        return f'W/"{version}-{variant}"' if variant else None
+
+    def last_modified(request, *args, **kwargs):
+        if personal and (getattr(request, 'medstore_user', None) or _personal_variant(request) is None):
+            return None
+        return dt.datetime.fromtimestamp(request.catalog_version / 1e6, dt.timezone.utc)
+
+    def decorator(view_func):
+        conditional = condition(etag_func=etag, last_modified_func=last_modified)(view_func)
+        # The version is read once, up front, and kept on the request for
+        # the validators and the view; async views read it on the async ORM.
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def wrapper(request, *args, **kwargs):
+                request.catalog_version = await acatalog_version()
+                return await conditional(request, *args, **kwargs)
+        else:
+            @wraps(view_func)
+            def wrapper(request, *args, **kwargs):
+                request.catalog_version = catalog_version()
+                return conditional(request, *args, **kwargs)
+        return wrapper
+
+    return decorator
+
@@ -0,0 +1,102 @@
+"""
+Streaming CSV / JSONL exports for the admin.
+
+Rows come straight from ``values_list(...).iterator(chunk_size=...)`` and are
+encoded and sent a chunk at a time, so memory stays flat whether the export
+covers a hundred rows or millions. Order exports are flattened to one row
+per order line.
+"""
+import csv
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .models import OrderItem, ContactMessage
+from .inbox import filter_messages
+from .reports import filter_orders, filter_days
+
+ORDER_COLUMNS = (
+    ('order_id', 'order_id'),
+    ('datetime', 'order__datetime'),
+    ('status', 'order__status'),
+    ('customer', 'order__customer_name'),
+    ('email', 'order__customer_email'),
+    ('order_total', 'order__total_amount'),
+    ('item_id', 'id'),
+    ('medicine_id', 'medicine_id'),
+    ('medicine', 'medicine_name'),
+    ('category', 'category_name'),
+    ('quantity', 'quantity'),
+    ('price', 'price'),
+)
+
+MESSAGE_COLUMNS = (
+    ('id', 'id'),
+    ('created_at', 'created_at'),
+    ('name', 'name'),
+    ('email', 'email'),
+    ('message', 'message'),
+)
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """File-like object whose ``write`` hands back the line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def order_rows(status=None, date_from=None, date_to=None):
+    qs = filter_orders(OrderItem.objects.all(), status, date_from, date_to, prefix='order__')
+    return qs.order_by('order_id', 'id').values_list(*(field for _, field in ORDER_COLUMNS)) \
+        .iterator(chunk_size=settings.MEDSTORE_EXPORT_CHUNK_SIZE)
+
+
+def message_rows(date_from=None, date_to=None, email=None, state=None):
+    qs = filter_messages(filter_days(ContactMessage.objects.all(), 'created_at', date_from, date_to), email, state)
+    return qs.order_by('id').values_list(*(field for _, field in MESSAGE_COLUMNS)) \
+        .iterator(chunk_size=settings.MEDSTORE_EXPORT_CHUNK_SIZE)
+
+
+def encode_csv(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in columns])
+    chunk = []
+    for row in rows:
+        chunk.append(writer.writerow(row))
+        if len(chunk) >= settings.MEDSTORE_EXPORT_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def encode_jsonl(columns, rows):
+    names = [name for name, _ in columns]
+    encoder = DjangoJSONEncoder()
+    chunk = []
+    for row in rows:
+        chunk.append(encoder.encode(dict(zip(names, row))) + '\n')
+        if len(chunk) >= settings.MEDSTORE_EXPORT_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+ENCODERS = {
+    'csv': encode_csv,
+    'jsonl': encode_jsonl,
+}
+
+
+def export_response(filename, fmt, columns, rows):
+    response = StreamingHttpResponse(ENCODERS[fmt](columns, rows), content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
@@ -0,0 +1,91 @@
+"""
+SQLite FTS5 index behind medicine search (see search.py).
+
+The index is a standalone FTS5 table kept in sync by triggers on the
+medicine and category tables. SQLite rebuilds a table for most ALTERs, which
+drops that table's triggers and fails on triggers elsewhere that name it, so
+any migration that alters ``Medicine`` or ``Category`` must wrap its
+operations in ``without_triggers(...)``.
+"""
+from django.db import migrations
+
+FTS_TABLE = 'medstore_medicine_fts'
+
+CREATE_TABLE = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        name, description, category, category_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4'
+    )
+    """,
+    # bm25 column weights: name, description, category.
+    f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 1.0, 4.0)')",
+]
+
+_INDEX_ROW = f"""
+    INSERT INTO {FTS_TABLE} (rowid, name, description, category, category_id)
+    VALUES (new.id, new.name, coalesce(new.description, ''),
+            coalesce((SELECT name FROM medstore_app_category WHERE id = new.category_id), ''),
+            new.category_id);
+"""
+
+TRIGGERS = {
+    'medstore_medicine_fts_ai': f"""
+        CREATE TRIGGER medstore_medicine_fts_ai AFTER INSERT ON medstore_app_medicine BEGIN
+            {_INDEX_ROW}
+        END
+    """,
+    'medstore_medicine_fts_au': f"""
+        CREATE TRIGGER medstore_medicine_fts_au
+        AFTER UPDATE OF name, description, category_id ON medstore_app_medicine BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+            {_INDEX_ROW}
+        END
+    """,
+    'medstore_medicine_fts_ad': f"""
+        CREATE TRIGGER medstore_medicine_fts_ad AFTER DELETE ON medstore_app_medicine BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        END
+    """,
+    'medstore_category_fts_au': f"""
+        CREATE TRIGGER medstore_category_fts_au AFTER UPDATE OF name ON medstore_app_category BEGIN
+            UPDATE {FTS_TABLE} SET category = new.name
+            WHERE rowid IN (SELECT id FROM medstore_app_medicine WHERE category_id = new.id);
+        END
+    """,
+}
+
+REINDEX = [
+    f"DELETE FROM {FTS_TABLE}",
+    f"""
+    INSERT INTO {FTS_TABLE} (rowid, name, description, category, category_id)
+    SELECT m.id, m.name, coalesce(m.description, ''), coalesce(c.name, ''), m.category_id
+    FROM medstore_app_medicine m LEFT JOIN medstore_app_category c ON c.id = m.category_id
+    """,
+]
+
+
+def _sqlite_only(statements):
+    def apply(apps, schema_editor):
+        if schema_editor.connection.vendor == 'sqlite':
+            for sql in statements:
+                schema_editor.execute(sql)
+    return apply
+
+
+create_index = _sqlite_only(CREATE_TABLE + list(TRIGGERS.values()) + REINDEX)
+drop_index = _sqlite_only(
+    [f"DROP TRIGGER IF EXISTS {name}" for name in TRIGGERS] + [f"DROP TABLE IF EXISTS {FTS_TABLE}"]
+)
+create_triggers = _sqlite_only(list(TRIGGERS.values()) + REINDEX)
+drop_triggers = _sqlite_only([f"DROP TRIGGER IF EXISTS {name}" for name in TRIGGERS])
+
+
+def without_triggers(*operations):
+    """Migration operations bracketed by dropping and re-creating the FTS triggers (and reindexing)."""
+    return [
+        migrations.RunPython(drop_triggers, create_triggers),
+        *operations,
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
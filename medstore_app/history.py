@@ -0,0 +1,55 @@
+"""
+Customer order history.
+
+``customer_orders`` pages through one customer's orders, newest first, with
+a keyset cursor on ``(datetime, id)``. Each page is an index range scan on
+``order_user_datetime_idx`` plus one prefetch of the page's items through
+the ``OrderItem.order`` foreign key index. That makes two queries whatever
+the length of the history, and item names come from the order snapshot, so
+neither query joins.
+"""
+import datetime as dt
+
+from django.conf import settings
+from django.db.models import Prefetch, Q
+
+from .models import Order, OrderItem
+
+EPOCH = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
+MICROSECOND = dt.timedelta(microseconds=1)
+
+
+def encode_cursor(order):
+    return f'{(order.datetime - EPOCH) // MICROSECOND}-{order.id}'
+
+
+def decode_cursor(value):
+    """``(datetime, id)`` from a cursor, or ``None`` if it is missing or malformed."""
+    try:
+        micros, order_id = (int(part) for part in (value or '').split('-'))
+    except ValueError:
+        return None
+    return EPOCH + micros * MICROSECOND, order_id
+
+
+def parse_history_args(params):
+    try:
+        size = int(params.get('size') or settings.MEDSTORE_HISTORY_PAGE_SIZE)
+    except ValueError:
+        size = settings.MEDSTORE_HISTORY_PAGE_SIZE
+    return decode_cursor(params.get('before')), min(max(1, size), settings.MEDSTORE_HISTORY_MAX_PAGE_SIZE)
+
+
+def customer_orders(user, before=None, size=None):
+    """One page of ``user``'s orders with their items, and the cursor for the next page."""
+    size = size or settings.MEDSTORE_HISTORY_PAGE_SIZE
+    qs = Order.objects.filter(user=user)
+    if before:
+        placed, order_id = before
+        qs = qs.filter(Q(datetime__lt=placed) | Q(datetime=placed, id__lt=order_id))
+    qs = qs.order_by('-datetime', '-id').prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.order_by('id'))
+    )
+    orders = list(qs[:size + 1])
+    next_cursor = encode_cursor(orders[size - 1]) if len(orders) > size else None
+    return orders[:size], next_cursor
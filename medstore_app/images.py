@@ -0,0 +1,176 @@
+"""
+Product image pipeline.
+
+``process_images`` reads each pending upload (a ``ProductImage`` whose
+``digest`` is empty), crops it to every size in ``MEDSTORE_IMAGE_SIZES``
+and writes a JPEG and a WebP of each. Decoding and encoding are CPU-bound,
+so the work runs on a process pool, one upload per task. Only the results
+come back to the parent, which records them with one ``bulk_update`` per
+batch.
+
+A variant's file name is the SHA-256 of its bytes, so a URL always
+returns the same content. The web server can cache those files for a year
+and never revalidate them, and Python is not involved in serving images.
+
+Pillow is an optional dependency, needed only to process images. Pages
+only read what the pipeline recorded.
+"""
+import hashlib
+import io
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+FORMATS = (
+    # (variant suffix, Pillow format, extension)
+    ('', 'JPEG', 'jpg'),
+    ('_webp', 'WEBP', 'webp'),
+)
+
+
+class PillowMissing(ImportError):
+    pass
+
+
+def _pillow():
+    try:
+        from PIL import Image, ImageOps
+    except ImportError as exc:
+        raise PillowMissing("Processing product images needs Pillow: pip install Pillow") from exc
+    return Image, ImageOps
+
+
+def image_url(path):
+    return settings.MEDSTORE_IMAGE_URL + path
+
+
+def picture(variants):
+    """
+    ``<img>``/``<source>`` attributes for a processed image: the JPEG and
+    WebP variants as width-described srcsets, smallest JPEG as the fallback.
+    """
+    jpegs = sorted((v for name, v in variants.items() if not name.endswith('_webp')), key=lambda v: v['width'])
+    if not jpegs:
+        return None
+    webps = sorted((v for name, v in variants.items() if name.endswith('_webp')), key=lambda v: v['width'])
+
+    def srcset(group):
+        return ', '.join(f"{image_url(v['path'])} {v['width']}w" for v in group)
+
+    return {
+        'src': image_url(jpegs[0]['path']),
+        'width': jpegs[0]['width'],
+        'height': jpegs[0]['height'],
+        'srcset': srcset(jpegs),
+        'webp_srcset': srcset(webps),
+    }
+
+
+def _store(data, ext, root):
+    """Write ``data`` under its content hash (once) and return the relative path."""
+    digest = hashlib.sha256(data).hexdigest()
+    relative = f'{digest[:2]}/{digest}.{ext}'
+    target = Path(root) / relative
+    if not target.exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=target.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp, target)
+    return relative
+
+
+def process_upload(source, root, sizes, quality):
+    """
+    Make every variant of the image file ``source``. This runs in a pool
+    worker, so it takes plain arguments and returns a plain dict.
+    """
+    Image, ImageOps = _pillow()
+    raw = Path(source).read_bytes()
+    with Image.open(io.BytesIO(raw)) as img:
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        result = {
+            'width': img.width, 'height': img.height,
+            'digest': hashlib.sha256(raw).hexdigest(), 'variants': {},
+        }
+        for name, box in sizes.items():
+            variant = ImageOps.fit(img, tuple(box), Image.Resampling.LANCZOS)
+            for suffix, fmt, ext in FORMATS:
+                out = io.BytesIO()
+                variant.save(out, fmt, quality=quality, optimize=fmt == 'JPEG')
+                result['variants'][name + suffix] = {
+                    'path': _store(out.getvalue(), ext, root),
+                    'width': variant.width,
+                    'height': variant.height,
+                }
+    return result
+
+
+def _run(job):
+    image_id, source, root, sizes, quality = job
+    try:
+        return image_id, process_upload(source, root, sizes, quality), None
+    except PillowMissing:
+        raise
+    except Exception as exc:  # a bad upload must not stop the batch
+        return image_id, None, f'{type(exc).__name__}: {exc}'
+
+
+# Pool workers import this module without setting Django up, so models
+# are imported inside the functions that run in the parent.
+
+def pending_images(reprocess=False):
+    from .models import ProductImage
+
+    qs = ProductImage.objects.order_by('id')
+    return qs if reprocess else qs.filter(digest='')
+
+
+def process_images(images, workers=None, batch_size=100, on_error=None):
+    """
+    Process ``images`` (a ``ProductImage`` queryset) on a pool of
+    ``workers`` processes. Returns ``(processed, failed)``.
+    """
+    from .models import ProductImage
+
+    _pillow()  # fail before starting a pool
+    root = str(settings.MEDSTORE_IMAGE_ROOT)
+    sizes = dict(settings.MEDSTORE_IMAGE_SIZES)
+    upload_root = Path(settings.MEDSTORE_IMAGE_UPLOAD_ROOT)
+    processed = failed = 0
+    rows = list(images.values_list('id', 'image_path'))
+    with ProcessPoolExecutor(max_workers=workers or settings.MEDSTORE_IMAGE_WORKERS) as pool:
+        for start in range(0, len(rows), batch_size):
+            jobs = [
+                (image_id, str(upload_root / path), root, sizes, settings.MEDSTORE_IMAGE_QUALITY)
+                for image_id, path in rows[start:start + batch_size]
+            ]
+            done = []
+            for image_id, result, error in pool.map(_run, jobs):
+                if error:
+                    failed += 1
+                    if on_error:
+                        on_error(image_id, error)
+                else:
+                    done.append(ProductImage(id=image_id, **result))
+            _record(done)
+            processed += len(done)
+    return processed, failed
+
+
+def _record(images):
+    from .catalog import bump_catalog_version
+    from .models import ProductImage
+    from .viewcache import invalidate_tags
+
+    if not images:
+        return
+    with transaction.atomic():
+        ProductImage.objects.bulk_update(images, ['width', 'height', 'digest', 'variants'])
+        # bulk_update sends no signals: move the catalog on here.
+        bump_catalog_version()
+    invalidate_tags('medicine')
@@ -0,0 +1,183 @@
+"""
+Bulk catalog import.
+
+``CatalogImporter`` streams rows from a CSV or JSONL file and upserts them
+into ``Medicine`` keyed on ``sku``, one ``bulk_create(update_conflicts=True)``
+per batch inside its own transaction. Categories are resolved through an
+in-memory name -> id map that is loaded once; unknown names are created in
+bulk per batch. Bad rows are rejected one by one instead of aborting the run.
+
+Fields: ``sku`` and ``name`` are required; ``price``, ``stock``,
+``description`` and ``category`` (a name) are optional. An existing
+medicine only has the fields its row carries updated, so a stock-only
+feed leaves prices, descriptions and categories alone. A field that is
+present but blank resets it (no category, no description, zero).
+"""
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from functools import partial
+
+from django.db import transaction
+
+from . import stats
+from .catalog import bump_catalog_version
+from .models import Category, Medicine
+from .viewcache import invalidate_tags
+
+OPTIONAL_FIELDS = ['price', 'description', 'stock', 'category']
+
+
+class RowRejected(ValueError):
+    pass
+
+
+def read_rows(path, fmt=None):
+    """
+    Yield ``(line_number, raw_row)`` from a CSV file with a header row (raw
+    rows are dicts) or a JSONL file (raw rows are undecoded lines).
+    """
+    fmt = fmt or ('jsonl' if str(path).endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as fh:
+        if fmt == 'csv':
+            reader = csv.DictReader(fh)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for number, line in enumerate(fh, start=1):
+                if line.strip():
+                    yield number, line
+
+
+def clean_row(raw):
+    """Validate one raw row into the fields ``Medicine`` needs, or raise ``RowRejected``."""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            raise RowRejected('invalid JSON')
+        if not isinstance(raw, dict):
+            raise RowRejected('not a JSON object')
+
+    sku = str(raw.get('sku') or '').strip()
+    name = str(raw.get('name') or '').strip()
+    if not sku:
+        raise RowRejected('missing sku')
+    if len(sku) > 64:
+        raise RowRejected('sku longer than 64 characters')
+    if not name:
+        raise RowRejected('missing name')
+    if len(name) > 255:
+        raise RowRejected('name longer than 255 characters')
+    row = {'sku': sku, 'name': name}
+    if 'price' in raw:
+        try:
+            row['price'] = Decimal(str(raw['price'] or 0)).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise RowRejected(f"bad price {raw['price']!r}")
+        if row['price'] < 0 or row['price'] >= Decimal('1e8'):
+            raise RowRejected(f"price out of range {raw['price']!r}")
+    if 'stock' in raw:
+        try:
+            row['stock'] = int(raw['stock'] or 0)
+        except (TypeError, ValueError):
+            raise RowRejected(f"bad stock {raw['stock']!r}")
+        if row['stock'] < 0:
+            raise RowRejected('negative stock')
+    if 'description' in raw:
+        row['description'] = str(raw['description'] or '')
+    if 'category' in raw:
+        row['category'] = str(raw['category'] or '').strip() or None
+        if row['category'] and len(row['category']) > 100:
+            raise RowRejected('category longer than 100 characters')
+    return row
+
+
+class CatalogImporter:
+    """
+    Upsert medicines from ``(line_number, raw_row)`` pairs.
+
+    ``on_batch(importer)`` is called after every committed batch and
+    ``on_reject(line_number, reason)`` for every rejected row.
+    """
+
+    def __init__(self, batch_size=1000, create_categories=True, on_batch=None, on_reject=None):
+        self.batch_size = batch_size
+        self.create_categories = create_categories
+        self.on_batch = on_batch
+        self.on_reject = on_reject
+        self.categories = {}
+        self.imported = 0
+        self.rejected = 0
+        self.started = None
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+    def run(self, rows):
+        self.started = time.perf_counter()
+        # Earliest category wins if names are duplicated.
+        self.categories = dict(Category.objects.order_by('-id').values_list('name', 'id'))
+        batch = {}
+        for number, raw in rows:
+            try:
+                row = clean_row(raw)
+            except RowRejected as exc:
+                self.reject(number, str(exc))
+                continue
+            # A sku repeated within a batch keeps its last row; one upsert
+            # statement may not touch the same row twice.
+            batch.pop(row['sku'], None)
+            batch[row['sku']] = (number, row)
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = {}
+        if batch:
+            self.flush(batch)
+        stats.refresh_catalog_counts()
+        return self
+
+    def reject(self, number, reason):
+        self.rejected += 1
+        if self.on_reject:
+            self.on_reject(number, reason)
+
+    def flush(self, batch):
+        with transaction.atomic():
+            self._resolve_categories(row.get('category') for _, row in batch.values())
+            # Rows carrying the same fields share one upsert that updates just those.
+            groups = {}
+            for number, row in batch.values():
+                if 'category' in row:
+                    category = row.pop('category')
+                    if category and category not in self.categories:
+                        self.reject(number, f'unknown category {category!r}')
+                        continue
+                    row['category_id'] = self.categories.get(category)
+                fields = tuple(f for f in OPTIONAL_FIELDS if f in row or f'{f}_id' in row)
+                groups.setdefault(fields, []).append(Medicine(**row))
+            meds = []
+            for fields, group in groups.items():
+                Medicine.objects.bulk_create(
+                    group, update_conflicts=True, unique_fields=['sku'], update_fields=['name', *fields],
+                )
+                meds += group
+            bump_catalog_version()
+        transaction.on_commit(partial(invalidate_tags, 'medicine', 'category'))
+        self.imported += len(meds)
+        if self.on_batch:
+            self.on_batch(self)
+
+    def _resolve_categories(self, names):
+        if not self.create_categories:
+            return
+        missing = {name for name in names if name and name not in self.categories}
+        if missing:
+            for cat in Category.objects.bulk_create([Category(name=name) for name in sorted(missing)]):
+                self.categories[cat.name] = cat.id
@@ -0,0 +1,126 @@
+"""
+Admin inbox for contact messages.
+
+``inbox_page`` pages through messages newest first with a keyset cursor on
+``(created_at, id)``, the same cursor format as the order history. The
+email and read/unread filters each have their own index. A page is one
+range scan of ``size + 1`` rows, however many messages a spam flood left
+behind. ``mark_read`` flags any number of messages in one UPDATE.
+
+``archive_messages`` keeps the table small. It moves messages older than
+the retention period into ``MessageArchive`` a batch at a time, oldest
+first. Each batch becomes one row of zlib-compressed JSON lines and is
+deleted from ``ContactMessage`` in the same transaction. ``archived_rows``
+reads a batch back.
+"""
+import datetime as dt
+import json
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .history import EPOCH, MICROSECOND, decode_cursor
+from .models import ContactMessage, MessageArchive
+
+READ, UNREAD = 'read', 'unread'
+
+ARCHIVE_FIELDS = ('id', 'name', 'email', 'message', 'created_at', 'is_read')
+
+
+def encode_cursor(msg):
+    return f'{(msg.created_at - EPOCH) // MICROSECOND}-{msg.id}'
+
+
+def parse_inbox_args(params):
+    """Pull ``email``, ``state``, ``before`` and ``size`` out of a GET querydict."""
+    try:
+        size = int(params.get('size') or settings.MEDSTORE_INBOX_PAGE_SIZE)
+    except ValueError:
+        size = settings.MEDSTORE_INBOX_PAGE_SIZE
+    state = params.get('state')
+    return {
+        'email': (params.get('email') or '').strip() or None,
+        'state': state if state in (READ, UNREAD) else None,
+        'before': decode_cursor(params.get('before')),
+        'size': min(max(1, size), settings.MEDSTORE_INBOX_MAX_PAGE_SIZE),
+    }
+
+
+def filter_messages(qs, email=None, state=None):
+    """Narrow ``qs`` to one sender's messages and/or to read or unread ones."""
+    if email:
+        qs = qs.filter(email=email)
+    if state:
+        qs = qs.filter(is_read=state == READ)
+    return qs
+
+
+def _inbox_queryset(email=None, state=None, before=None):
+    qs = filter_messages(ContactMessage.objects.all(), email, state)
+    if before:
+        created, msg_id = before
+        qs = qs.filter(Q(created_at__lt=created) | Q(created_at=created, id__lt=msg_id))
+    return qs.order_by('-created_at', '-id')
+
+
+def _cut_page(msgs, size):
+    next_cursor = encode_cursor(msgs[size - 1]) if len(msgs) > size else None
+    return msgs[:size], next_cursor
+
+
+def inbox_page(email=None, state=None, before=None, size=None):
+    """One page of messages, newest first, and the cursor for the next page."""
+    size = size or settings.MEDSTORE_INBOX_PAGE_SIZE
+    return _cut_page(list(_inbox_queryset(email, state, before)[:size + 1]), size)
+
+
+async def ainbox_page(email=None, state=None, before=None, size=None):
+    """``inbox_page`` on the async ORM."""
+    size = size or settings.MEDSTORE_INBOX_PAGE_SIZE
+    return _cut_page([msg async for msg in _inbox_queryset(email, state, before)[:size + 1]], size)
+
+
+def mark_read(ids):
+    """Flag the messages ``ids`` as read; returns how many were unread."""
+    return ContactMessage.objects.filter(id__in=ids, is_read=False).update(is_read=True)
+
+
+# -------------------------
+# Archiving
+# -------------------------
+def _compress(rows):
+    lines = (json.dumps(dict(zip(ARCHIVE_FIELDS, row)), default=str) for row in rows)
+    return zlib.compress('\n'.join(lines).encode(), 6)
+
+
+def archived_rows(archive):
+    """The messages in ``archive`` as dicts, oldest first."""
+    return [json.loads(line) for line in zlib.decompress(archive.data).decode().splitlines()]
+
+
+def archive_messages(older_than_days=None, batch_size=1000, now=None, on_batch=None):
+    """
+    Move messages created more than ``older_than_days`` ago into the
+    archive, ``batch_size`` per transaction. Returns how many were moved.
+    """
+    days = settings.MEDSTORE_MESSAGE_RETENTION_DAYS if older_than_days is None else older_than_days
+    cutoff = (now or timezone.now()) - dt.timedelta(days=days)
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                ContactMessage.objects.filter(created_at__lt=cutoff).order_by('created_at', 'id')
+                .values_list(*ARCHIVE_FIELDS)[:batch_size]
+            )
+            if not rows:
+                return moved
+            MessageArchive.objects.create(
+                first_created_at=rows[0][4], last_created_at=rows[-1][4], count=len(rows), data=_compress(rows),
+            )
+            ContactMessage.objects.filter(id__in=[row[0] for row in rows]).delete()
+        moved += len(rows)
+        if on_batch:
+            on_batch(len(rows), rows[-1][4])
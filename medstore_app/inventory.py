@@ -0,0 +1,135 @@
+"""
+Stock reservations.
+
+Adding to a cart places a short-lived ``StockHold`` on the medicine, and
+``Medicine.reserved`` carries the running total of live holds, so
+``stock - reserved`` is what can still be sold. Every operation is a fixed
+number of set-based statements, whatever the number of lines or holds:
+
+* ``set_holds`` moves a cart's holds to new quantities with one conditional
+  UPDATE on ``reserved`` (``WHERE stock - reserved >= growth``) and one upsert.
+  If any line lacks stock, the whole change is refused.
+* ``release_held`` returns one cart's holds, ``free_stock`` the expired
+  holds on some medicines (plus the buyer's own, at checkout), and
+  ``release_expired`` every expired hold in one sweep.
+  Each subtracts per-medicine sums from ``reserved`` with a correlated
+  subquery, then deletes the rows.
+
+Both releases lock the hold rows first (``select_for_update``), so a sweep
+and a checkout cannot return the same hold twice. Checkout releases the
+buyer's holds in the same transaction as the stock decrement.
+
+Expired holds do not depend on the sweep to stop counting.
+``set_holds`` and checkout first release any expired holds on the
+medicines they touch (``free_stock``), in the same transaction as their
+availability check. That costs one locking read when nothing has
+expired. Abandoned carts therefore never block a sale, even if
+``release_expired_holds`` is not scheduled or runs late.
+"""
+import datetime as dt
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Medicine, StockHold
+
+
+class HoldRejected(Exception):
+    pass
+
+
+def _hold_expiry():
+    return timezone.now() + dt.timedelta(seconds=settings.MEDSTORE_HOLD_SECONDS)
+
+
+def set_holds(holder, lines):
+    """
+    Hold exactly ``{medicine_id: quantity}`` for ``holder`` (0 drops a line)
+    and restart those holds' expiry. Raises ``HoldRejected`` if any line
+    needs more than is available; then nothing changes.
+    """
+    if not lines:
+        return
+    with transaction.atomic():
+        free_stock(lines)
+        held = dict(
+            StockHold.objects.select_for_update()
+            .filter(holder=holder, medicine_id__in=list(lines))
+            .values_list('medicine_id', 'quantity')
+        )
+        deltas = {med_id: qty - held.get(med_id, 0) for med_id, qty in lines.items()}
+        fits = Q()
+        for med_id, delta in deltas.items():
+            fits |= Q(id=med_id, stock__gte=F('reserved') + delta) if delta > 0 else Q(id=med_id)
+        updated = Medicine.objects.filter(fits).update(reserved=Case(
+            *[When(id=med_id, then=F('reserved') + delta) for med_id, delta in deltas.items()],
+            default=F('reserved'),
+        ))
+        if updated < len(deltas):
+            raise HoldRejected('Not enough stock available.')
+        expires_at = _hold_expiry()
+        StockHold.objects.bulk_create(
+            [StockHold(holder=holder, medicine_id=med_id, quantity=qty, expires_at=expires_at)
+             for med_id, qty in lines.items() if qty > 0],
+            update_conflicts=True, unique_fields=['holder', 'medicine'], update_fields=['quantity', 'expires_at'],
+        )
+        dropped = [med_id for med_id, qty in lines.items() if qty <= 0]
+        if dropped:
+            StockHold.objects.filter(holder=holder, medicine_id__in=dropped).delete()
+
+
+def _release(holds):
+    # ``holds`` is a StockHold queryset; call inside a transaction. The rest
+    # works on the locked ids, so holds placed meanwhile are left alone.
+    ids = list(holds.select_for_update().values_list('id', flat=True))
+    if not ids:
+        return 0
+    holds = StockHold.objects.filter(id__in=ids)
+    per_medicine = holds.filter(medicine_id=OuterRef('id')).order_by() \
+        .values('medicine_id').annotate(total=Sum('quantity')).values('total')
+    Medicine.objects.filter(id__in=holds.values('medicine_id')).update(
+        reserved=F('reserved') - Coalesce(Subquery(per_medicine, output_field=IntegerField()), Value(0))
+    )
+    deleted, _ = holds.delete()
+    return deleted
+
+
+def release_held(holder, medicine_ids=None):
+    """Return ``holder``'s holds (only on ``medicine_ids`` if given) to sellable stock."""
+    holds = StockHold.objects.filter(holder=holder)
+    if medicine_ids is not None:
+        holds = holds.filter(medicine_id__in=list(medicine_ids))
+    with transaction.atomic():
+        return _release(holds)
+
+
+def free_stock(medicine_ids, holder=None, now=None):
+    """
+    Release the expired holds on ``medicine_ids`` (and ``holder``'s own
+    holds on them, if given) before their availability is checked. Call
+    inside a transaction.
+    """
+    stale = Q(expires_at__lte=now or timezone.now())
+    if holder:
+        stale |= Q(holder=holder)
+    return _release(StockHold.objects.filter(stale, medicine_id__in=list(medicine_ids)))
+
+
+def release_expired(now=None):
+    """Sweep every hold that expired by ``now``; returns how many were released."""
+    with transaction.atomic():
+        return _release(StockHold.objects.filter(expires_at__lte=now or timezone.now()))
+
+
+def low_stock(threshold=None, limit=100):
+    """Medicines at or below ``threshold`` units, lowest first: a range scan on ``medicine_stock_idx``."""
+    if threshold is None:
+        threshold = settings.MEDSTORE_LOW_STOCK_THRESHOLD
+    return list(
+        Medicine.objects.filter(stock__lte=threshold).order_by('stock', 'id')
+        .annotate(available=F('stock') - F('reserved'))
+        .values('id', 'name', 'stock', 'reserved', 'available')[:limit]
+    )
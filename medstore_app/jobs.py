@@ -0,0 +1,144 @@
+"""
+Durable background jobs.
+
+``enqueue`` inserts a ``Job`` row. Call it inside the transaction that
+makes the change the job follows up on. The job then exists exactly when
+the change committed, with no window where one is saved without the other.
+
+``manage.py run_worker`` runs them. Each round, a worker claims a batch of
+ready jobs in one transaction: it marks them running, stamps its name and
+a lease (``MEDSTORE_JOB_LEASE_SECONDS``), and bumps their attempt count.
+On PostgreSQL the claim skips rows another worker has locked. On SQLite
+the IMMEDIATE transaction serialises claims. Before each job runs, its
+lease is restarted, and the job is skipped if another worker has taken it
+over in the meantime. The job is marked done as soon as it finishes. A
+failure is retried after an exponential backoff until
+``MEDSTORE_JOB_MAX_ATTEMPTS``, then marked failed with its error. If a
+worker dies, its lease runs out and another worker takes the jobs over.
+Every state change checks ``locked_by``, so a worker that lost its lease
+cannot overwrite the new owner's result.
+
+Handlers are registered with ``@handler('kind')`` (see tasks.py) and get
+the payload as keyword arguments. They run with no transaction open. On
+SQLite a transaction holds the write lock, so a handler waiting on the
+network must not open one around the wait. Handlers must still be safe
+to run twice, since a worker can die after the work and before the
+result is recorded.
+"""
+import datetime as dt
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import Job
+
+HANDLERS = {}
+
+
+def handler(kind):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def enqueue(kind, delay=0, **payload):
+    return Job.objects.create(
+        kind=kind, payload=payload, run_after=timezone.now() + dt.timedelta(seconds=delay),
+    )
+
+
+def claim(worker, batch_size=None, lease=None, now=None):
+    """Take up to ``batch_size`` ready jobs for ``worker``, oldest first."""
+    now = now or timezone.now()
+    batch_size = batch_size or settings.MEDSTORE_JOB_BATCH_SIZE
+    lease = lease or settings.MEDSTORE_JOB_LEASE_SECONDS
+    expired = Q(status=Job.RUNNING, locked_until__lt=now)
+    with transaction.atomic():
+        # Jobs whose last attempt died with its worker and have none left.
+        Job.objects.filter(expired, attempts__gte=settings.MEDSTORE_JOB_MAX_ATTEMPTS).update(
+            status=Job.FAILED, finished_at=now, locked_until=None,
+            last_error='Lease expired on the last attempt.',
+        )
+        ready = Job.objects.filter(Q(status=Job.QUEUED, run_after__lte=now) | expired).order_by('run_after', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            ready = ready.select_for_update(skip_locked=True)
+        ids = list(ready.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return []
+        Job.objects.filter(id__in=ids).update(
+            status=Job.RUNNING, locked_by=worker, locked_until=now + dt.timedelta(seconds=lease),
+            attempts=F('attempts') + 1, started_at=now,
+        )
+        return list(Job.objects.filter(id__in=ids).order_by('id'))
+
+
+def retry_delay(attempts):
+    return min(settings.MEDSTORE_JOB_RETRY_MAX, settings.MEDSTORE_JOB_RETRY_BASE * 2 ** (attempts - 1))
+
+
+def run_jobs(worker, jobs, lease=None):
+    """
+    Run claimed ``jobs`` one by one and record each outcome as it happens.
+    Returns the ``(done, failed)`` ids; jobs this worker no longer holds are
+    skipped.
+    """
+    lease = lease or settings.MEDSTORE_JOB_LEASE_SECONDS
+    done, failed = [], []
+    for job in jobs:
+        mine = Job.objects.filter(id=job.id, locked_by=worker, status=Job.RUNNING)
+        if not mine.update(locked_until=timezone.now() + dt.timedelta(seconds=lease)):
+            continue
+        fn = HANDLERS.get(job.kind)
+        try:
+            if fn is None:
+                raise LookupError(f"No handler for job kind {job.kind!r}")
+            fn(**job.payload)
+        except Exception as exc:
+            failed.append(job.id)
+            _record_failure(worker, job, exc, retry=fn is not None)
+        else:
+            done.append(job.id)
+            mine.update(status=Job.DONE, finished_at=timezone.now(), locked_until=None, last_error='')
+    return done, failed
+
+
+def _record_failure(worker, job, exc, retry=True):
+    now = timezone.now()
+    error = f'{type(exc).__name__}: {exc}'
+    mine = Job.objects.filter(id=job.id, locked_by=worker)
+    if retry and job.attempts < settings.MEDSTORE_JOB_MAX_ATTEMPTS:
+        mine.update(status=Job.QUEUED, locked_until=None, last_error=error,
+                    run_after=now + dt.timedelta(seconds=retry_delay(job.attempts)))
+    else:
+        mine.update(status=Job.FAILED, locked_until=None, last_error=error, finished_at=now)
+
+
+def prune(older_than=None):
+    """Delete jobs that finished (done) more than ``older_than`` seconds ago."""
+    older_than = settings.MEDSTORE_JOB_RETENTION if older_than is None else older_than
+    cutoff = timezone.now() - dt.timedelta(seconds=older_than)
+    deleted, _ = Job.objects.filter(status=Job.DONE, finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def queue_stats(now=None, window=60):
+    """
+    Jobs per status, the lag of the oldest ready job (seconds it has been
+    waiting past ``run_after``), and jobs finished in the last ``window``
+    seconds.
+    """
+    now = now or timezone.now()
+    counts = dict.fromkeys((Job.QUEUED, Job.RUNNING, Job.DONE, Job.FAILED), 0)
+    counts.update(Job.objects.values_list('status').annotate(n=Count('id')).order_by())
+    oldest = Job.objects.filter(status=Job.QUEUED, run_after__lte=now) \
+        .order_by('run_after').values_list('run_after', flat=True).first()
+    finished = Job.objects.filter(status=Job.DONE, finished_at__gte=now - dt.timedelta(seconds=window)).count()
+    return {
+        'counts': counts,
+        'lag': (now - oldest).total_seconds() if oldest else 0.0,
+        'finished': finished,
+        'window': window,
+    }
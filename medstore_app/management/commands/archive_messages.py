@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from medstore_app.inbox import archive_messages
+
+
+class Command(BaseCommand):
+    help = (
+        "Move contact messages older than the retention period into the compressed "
+        "archive table, one batch per transaction, oldest first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.MEDSTORE_MESSAGE_RETENTION_DAYS,
+                            help="Archive messages older than this many days.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **opts):
+        if opts['days'] < 0 or opts['batch_size'] < 1:
+            raise CommandError("--days must be >= 0 and --batch-size >= 1.")
+
+        def on_batch(count, last):
+            if opts['verbosity'] > 1:
+                self.stdout.write(f"Archived {count} messages up to {last:%Y-%m-%d %H:%M}")
+
+        moved = archive_messages(opts['days'], opts['batch_size'], on_batch=on_batch)
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} message(s) older than {opts['days']} days."))
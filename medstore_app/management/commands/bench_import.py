@@ -0,0 +1,42 @@
+import csv
+import os
+import random
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from medstore_app.bench import scratch_database
+from medstore_app.importer import CatalogImporter, read_rows
+
+CATEGORIES = ['Pain relief', 'Vitamins', 'Cold & flu', 'Allergy', 'Digestive', 'Skin care', 'First aid']
+
+
+class Command(BaseCommand):
+    help = "Measure import_catalog throughput (fresh inserts, then a full re-import as updates)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50_000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts['seed'])
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        try:
+            with os.fdopen(fd, 'w', newline='') as fh:
+                writer = csv.writer(fh)
+                writer.writerow(['sku', 'name', 'price', 'stock', 'category', 'description'])
+                for i in range(opts['rows']):
+                    writer.writerow([
+                        f'SKU{i:08d}', f'Medicine {i}', f'{rng.uniform(1, 500):.2f}',
+                        rng.randint(0, 500), rng.choice(CATEGORIES), 'Imported by bench_import',
+                    ])
+            with scratch_database():
+                for label in ('insert', 'upsert'):
+                    importer = CatalogImporter(batch_size=opts['batch_size']).run(read_rows(path))
+                    self.stdout.write(
+                        f"{label:<8} {importer.imported} rows in {importer.elapsed:6.2f}s  "
+                        f"{importer.rate:10,.0f} rows/s"
+                    )
+        finally:
+            os.unlink(path)
@@ -0,0 +1,43 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+
+from medstore_app.bench import scratch_database, percentiles, time_calls, format_row, bulk_insert
+from medstore_app.models import User
+from medstore_app.users import find_user
+
+
+def sequential_lookup(identifier):
+    # The lookup login used before find_user: up to three round-trips.
+    return User.objects.filter(email=identifier).first() \
+        or User.objects.filter(username=identifier).first() \
+        or User.objects.filter(mobile=identifier).first()
+
+
+class Command(BaseCommand):
+    help = "Benchmark login identifier lookups against a large scratch User table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000)
+        parser.add_argument('--lookups', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts['seed'])
+        n = opts['users']
+        with scratch_database():
+            self.stdout.write(f"Seeding {n} users...")
+            password = make_password('bench')
+            bulk_insert(User, (
+                User(username=f'user{i}', email=f'user{i}@example.com', mobile=f'9{i:09d}', password=password)
+                for i in range(n)
+            ))
+            identifiers = []
+            for _ in range(opts['lookups']):
+                i = rng.randrange(n)
+                identifiers.append((rng.choice([f'user{i}@example.com', f'user{i}', f'9{i:09d}']),))
+
+            for label, fn in (('sequential (3 queries)', sequential_lookup), ('find_user (1 query)', find_user)):
+                fn(*identifiers[0])  # warm up
+                self.stdout.write(format_row(label, percentiles(time_calls(fn, identifiers))))
@@ -0,0 +1,70 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, AsyncClient
+from django.test.utils import override_settings
+
+from medstore_app.bench import scratch_database, percentiles, format_row, bulk_insert, async_views
+from medstore_app.models import User
+
+
+class Command(BaseCommand):
+    help = "Compare login latency under concurrent logins for the sync (WSGI) and async (ASGI) login views."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=50)
+
+    def handle(self, *args, **opts):
+        with scratch_database(), override_settings(ALLOWED_HOSTS=['testserver']):
+            password = make_password('bench')
+            bulk_insert(User, (
+                User(username=f'user{i}', email=f'user{i}@example.com', mobile=f'9{i:09d}', password=password)
+                for i in range(opts['users'])
+            ))
+            logins = [f"user{i % opts['users']}" for i in range(opts['logins'])]
+            self.stdout.write(
+                f"{len(logins)} logins, {opts['concurrency']} concurrent, "
+                f"{settings.MEDSTORE_HASH_WORKERS} hash workers"
+            )
+            with async_views(False):
+                self.report('sync', *self.run_sync(logins, opts['concurrency']))
+            with async_views(True):
+                self.report('async', *asyncio.run(self.run_async(logins, opts['concurrency'])))
+
+    def report(self, label, samples, elapsed):
+        self.stdout.write(format_row(label, percentiles(samples)) + f"  {len(samples) / elapsed:7.1f} logins/s")
+
+    def run_sync(self, logins, concurrency):
+        def one(username):
+            start = time.perf_counter()
+            resp = Client().post('/login/', {'identifier': username, 'password': 'bench'})
+            took = time.perf_counter() - start
+            connection.close()
+            assert resp.status_code == 302, resp.status_code
+            return took
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(one, logins))
+        return samples, time.perf_counter() - start
+
+    async def run_async(self, logins, concurrency):
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one(username):
+            async with gate:
+                start = time.perf_counter()
+                resp = await AsyncClient().post('/login/', {'identifier': username, 'password': 'bench'})
+                assert resp.status_code == 302, resp.status_code
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        samples = await asyncio.gather(*(one(u) for u in logins))
+        return samples, time.perf_counter() - start
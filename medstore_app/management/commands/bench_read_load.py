@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, AsyncClient
+from django.test.utils import override_settings
+
+from medstore_app.bench import scratch_database, seed_store, percentiles, format_row, bulk_insert, async_views
+from medstore_app.models import ContactMessage
+from medstore_app.views import ADMIN_EMAIL
+
+READ_PATHS = ('/', '/admin-panel/dashboard/', '/admin-panel/messages/', '/admin-panel/orders/')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the read views served through Django's WSGI handler (a fixed pool of worker "
+        "threads, as under gunicorn) and its ASGI handler (one task per connection, as under "
+        "uvicorn) with many connections open at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000,
+                            help="Requests in flight at once.")
+        parser.add_argument('--requests', type=int, default=2000,
+                            help="Total requests, spread over the read views.")
+        parser.add_argument('--wsgi-threads', type=int, default=32,
+                            help="WSGI worker threads; other connections wait for one.")
+        parser.add_argument('--medicines', type=int, default=2000)
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--messages', type=int, default=200)
+
+    def handle(self, *args, **opts):
+        jobs = [READ_PATHS[n % len(READ_PATHS)] for n in range(opts['requests'])]
+        if opts['verbosity'] < 2:
+            # Queued requests are all "slow"; keep the report readable.
+            logging.getLogger('medstore.slow_requests').setLevel(logging.ERROR)
+        with scratch_database(on_disk=True), override_settings(ALLOWED_HOSTS=['testserver']):
+            seed_store(users=200, categories=20, medicines=opts['medicines'], orders=opts['orders'])
+            bulk_insert(ContactMessage, (
+                ContactMessage(name=f'Visitor {i}', email=f'visitor{i}@example.com', message='Do you stock this?')
+                for i in range(opts['messages'])
+            ))
+            self.stdout.write(
+                f"{len(jobs)} requests over {len(READ_PATHS)} read views, "
+                f"{opts['connections']} connections"
+            )
+            with async_views(False):
+                self.report(f"wsgi x{opts['wsgi_threads']} threads",
+                            *self.run_wsgi(jobs, opts['connections'], opts['wsgi_threads']))
+            with async_views(True):
+                self.report('asgi', *asyncio.run(self.run_asgi(jobs, opts['connections'])))
+
+    def report(self, label, samples, elapsed, threads):
+        self.stdout.write(
+            format_row(label, percentiles(samples))
+            + f"  {len(samples) / elapsed:7.1f} req/s  peak threads={threads}"
+        )
+
+    def client(self, client_class):
+        client = client_class()
+        client.cookies['admin_email'] = ADMIN_EMAIL
+        return client
+
+    # Connections are accepted ``concurrency`` at a time, as from a listen
+    # backlog, and latency runs from acceptance: time a request spends
+    # waiting for a free WSGI thread counts, as it does for the client.
+
+    def run_wsgi(self, jobs, concurrency, threads):
+        def one(job):
+            path, accepted = job
+            try:
+                resp = self.client(Client).get(path)
+            finally:
+                connections.close_all()
+            if resp.status_code != 200:
+                raise CommandError(f"{path} returned {resp.status_code}")
+            return time.perf_counter() - accepted
+
+        samples = []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for first in range(0, len(jobs), concurrency):
+                accepted = time.perf_counter()
+                samples += pool.map(one, [(path, accepted) for path in jobs[first:first + concurrency]])
+            peak = threading.active_count()
+        return samples, time.perf_counter() - start, peak
+
+    async def run_asgi(self, jobs, concurrency):
+        peak = threading.active_count()
+
+        async def one(path, accepted):
+            nonlocal peak
+            resp = await self.client(AsyncClient).get(path)
+            peak = max(peak, threading.active_count())
+            if resp.status_code != 200:
+                raise CommandError(f"{path} returned {resp.status_code}")
+            return time.perf_counter() - accepted
+
+        samples = []
+        start = time.perf_counter()
+        for first in range(0, len(jobs), concurrency):
+            accepted = time.perf_counter()
+            samples += await asyncio.gather(*(one(path, accepted) for path in jobs[first:first + concurrency]))
+        return samples, time.perf_counter() - start, peak
@@ -0,0 +1,56 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from medstore_app.bench import scratch_database, percentiles, time_calls, format_row, bulk_insert
+from medstore_app.models import Category, Medicine
+from medstore_app.search import search_medicines, icontains_filter
+
+SYLLABLES = ['am', 'ox', 'ci', 'lin', 'pra', 'zol', 'met', 'for', 'min', 'ate', 'ben', 'zo', 'cal',
+             'dex', 'tra', 'mol', 'par', 'ceta', 'ibu', 'pro', 'fen', 'as', 'pir', 'in', 'vit']
+WORDS = ['tablet', 'syrup', 'capsule', 'relief', 'pain', 'fever', 'cold', 'allergy', 'children',
+         'adult', 'daily', 'immune', 'support', 'extended', 'release', 'chewable', 'sugar', 'free']
+
+
+def fake_name(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize() \
+        + f" {rng.choice([5, 10, 50, 100, 250, 500])}mg"
+
+
+class Command(BaseCommand):
+    help = "Benchmark FTS5 medicine search against naive icontains on a large scratch catalog."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500_000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **opts):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The FTS5 index only exists on SQLite.")
+        rng = random.Random(opts['seed'])
+        with scratch_database():
+            cats = Category.objects.bulk_create([Category(name=f'{w.capitalize()} care') for w in WORDS])
+            self.stdout.write(f"Seeding {opts['rows']} medicines...")
+            bulk_insert(Medicine, (
+                Medicine(
+                    name=fake_name(rng),
+                    description=' '.join(rng.choice(WORDS) for _ in range(12)),
+                    category=rng.choice(cats),
+                    price=rng.randint(1, 500),
+                    stock=rng.randint(0, 100),
+                )
+                for _ in range(opts['rows'])
+            ))
+            terms = [(rng.choice(SYLLABLES) + rng.choice(SYLLABLES),) for _ in range(opts['queries'])]
+            terms += [(f"{rng.choice(WORDS)[:4]} {rng.choice(SYLLABLES)}",) for _ in range(opts['queries'])]
+
+            def naive(text):
+                # Same shape as the fallback search: filtered, ordered, first page.
+                return list(Medicine.objects.filter(icontains_filter(text)).order_by('name')
+                            .values_list('id', 'name')[:20])
+
+            for label, fn in (('fts5 (prefix, ranked)', search_medicines), ('icontains', naive)):
+                fn(*terms[0])  # warm up
+                self.stdout.write(format_row(label, percentiles(time_calls(fn, terms))))
@@ -0,0 +1,59 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from medstore_app.importer import CatalogImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = "Upsert medicines (keyed on sku), categories and stock from a CSV or JSONL file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Default: guessed from the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--no-create-categories', action='store_true',
+                            help="Reject rows whose category does not exist yet.")
+        parser.add_argument('--rejects', help="Write rejected rows (line, reason) to this CSV file.")
+        parser.add_argument('--progress-every', type=int, default=10, help="Report progress every N batches.")
+
+    def handle(self, *args, **opts):
+        rejects_file = open(opts['rejects'], 'w', newline='') if opts['rejects'] else None
+        rejects = csv.writer(rejects_file) if rejects_file else None
+        if rejects:
+            rejects.writerow(['line', 'reason'])
+        batches = 0
+
+        def on_batch(importer):
+            nonlocal batches
+            batches += 1
+            if batches % opts['progress_every'] == 0:
+                self.stdout.write(
+                    f"{importer.imported} rows imported, {importer.rejected} rejected, "
+                    f"{importer.rate:,.0f} rows/s"
+                )
+
+        def on_reject(number, reason):
+            if rejects:
+                rejects.writerow([number, reason])
+            elif opts['verbosity'] > 1:
+                self.stderr.write(f"line {number}: {reason}")
+
+        importer = CatalogImporter(
+            batch_size=opts['batch_size'],
+            create_categories=not opts['no_create_categories'],
+            on_batch=on_batch,
+            on_reject=on_reject,
+        )
+        try:
+            importer.run(read_rows(opts['path'], opts['format']))
+        except OSError as exc:
+            raise CommandError(exc)
+        finally:
+            if rejects_file:
+                rejects_file.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {importer.imported} rows in {importer.elapsed:.1f}s "
+            f"({importer.rate:,.0f} rows/s); {importer.rejected} rejected."
+        ))
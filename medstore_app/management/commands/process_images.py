@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from medstore_app.images import PillowMissing, pending_images, process_images
+
+
+class Command(BaseCommand):
+    help = (
+        "Make the thumbnail and WebP variants of uploaded product images on a process pool "
+        "and record them on ProductImage. Only unprocessed uploads unless --all."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Reprocess every image.")
+        parser.add_argument('--workers', type=int, help="Worker processes (default MEDSTORE_IMAGE_WORKERS).")
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **opts):
+        def on_error(image_id, error):
+            self.stderr.write(f"image {image_id}: {error}")
+
+        try:
+            processed, failed = process_images(
+                pending_images(opts['all']), workers=opts['workers'],
+                batch_size=opts['batch_size'], on_error=on_error,
+            )
+        except PillowMissing as exc:
+            raise CommandError(exc)
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} images; {failed} failed."))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from medstore_app.models import Order
+from medstore_app.rollups import rebuild
+
+
+def _day(value):
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise CommandError(f"Not a date (YYYY-MM-DD): {value}")
+    return day
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily sales rollups from the order history, a chunk of days per "
+        "transaction. Safe to rerun over the same range."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=_day, help="First day to rebuild (default: the first order).")
+        parser.add_argument('--until', type=_day, help="Last day to rebuild (default: today).")
+        parser.add_argument('--chunk-days', type=int, default=7)
+
+    def handle(self, *args, **opts):
+        until = opts['until'] or timezone.localdate()
+        since = opts['since']
+        if since is None:
+            first = Order.objects.order_by('datetime').values_list('datetime', flat=True).first()
+            if first is None:
+                self.stdout.write("No orders yet; nothing to rebuild.")
+                return
+            since = timezone.localdate(first)
+        if since > until:
+            raise CommandError(f"--since {since} is after --until {until}.")
+        if opts['chunk_days'] < 1:
+            raise CommandError("--chunk-days must be at least 1.")
+
+        def on_chunk(start, end):
+            if opts['verbosity'] > 1:
+                self.stdout.write(f"Rebuilt {start}..{end}")
+
+        chunks = rebuild(since, until, opts['chunk_days'], on_chunk)
+        days = (until - since).days + 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {days} days of rollups ({since}..{until}) in {chunks} chunks."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from medstore_app.models import User, Medicine, Order
+from medstore_app.stats import expected_stats, stats_drift, write_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the dashboard counters from the source tables and report drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report drift; exit non-zero if any counter is off.",
+        )
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            expected = expected_stats(User, Medicine, Order)
+            drift = stats_drift(expected)
+            for key in sorted(drift):
+                have, want = drift[key]
+                self.stdout.write(f"{key}: stored {have}, actual {want}")
+            if opts['check']:
+                if drift:
+                    raise CommandError(f"{len(drift)} counter(s) drifted.")
+                self.stdout.write(self.style.SUCCESS("All counters match."))
+                return
+            write_stats(expected)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(expected)} counters ({len(drift)} corrected)."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from medstore_app.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = "Return every expired cart stock hold to sellable stock in one batched sweep."
+
+    def handle(self, *args, **opts):
+        released = release_expired()
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired hold(s)."))
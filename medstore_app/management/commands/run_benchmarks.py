@@ -0,0 +1,153 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from medstore_app.bench import scratch_database, seed_store, percentiles, format_row, compare_to_baseline
+from medstore_app.models import User, Medicine
+from medstore_app.users import USER_COOKIE, sign_user_token
+from medstore_app.views import ADMIN_EMAIL
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+SIZE_OPTIONS = ('users', 'categories', 'medicines', 'orders')
+
+
+class Scenarios:
+    """One request per call for each benchmarked flow; ``n`` varies the target."""
+
+    def __init__(self):
+        self.users = list(User.objects.order_by('id')[:100])
+        self.medicine_ids = list(Medicine.objects.filter(stock__gt=0).values_list('id', flat=True)[:100])
+
+    def client(self, name, n):
+        client = Client()
+        if name.startswith('admin_'):
+            client.cookies['admin_email'] = ADMIN_EMAIL
+        elif name == 'create_order':
+            client.cookies[USER_COOKIE] = sign_user_token(self.users[n % len(self.users)])
+        return client
+
+    def request(self, name, n):
+        client = self.client(name, n)
+        if name == 'home':
+            return client.get('/')
+        if name == 'login':
+            user = self.users[n % len(self.users)]
+            return client.post('/login/', {'identifier': user.username, 'password': 'bench'})
+        if name == 'create_order':
+            return client.post(f'/order/{self.medicine_ids[n % len(self.medicine_ids)]}/', {'quantity': 1})
+        if name == 'admin_dashboard':
+            return client.get('/admin-panel/dashboard/')
+        if name == 'admin_view_orders':
+            return client.get('/admin-panel/orders/')
+        raise ValueError(name)
+
+    NAMES = ('home', 'login', 'create_order', 'admin_dashboard', 'admin_view_orders')
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch store, benchmark the storefront and admin flows sequentially and under "
+        "concurrent load, and compare latency percentiles and query counts to a JSON baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--medicines', type=int, default=5000)
+        parser.add_argument('--orders', type=int, default=20000)
+        parser.add_argument('--requests', type=int, default=50, help="Timed requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--update-baseline', action='store_true',
+                            help="Write this run as the new baseline instead of comparing.")
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help="Allowed relative latency growth / throughput drop (0.5 = 50%%).")
+        parser.add_argument('--query-tolerance', type=int, default=0,
+                            help="Allowed extra queries per request.")
+        parser.add_argument('--output', help="Also write this run's results to this JSON file.")
+
+    def handle(self, *args, **opts):
+        config = {key: opts[key] for key in SIZE_OPTIONS + ('requests', 'concurrency', 'seed')}
+        if opts['verbosity'] < 2:
+            # Every login is a "slow request"; keep the report readable.
+            logging.getLogger('medstore.slow_requests').setLevel(logging.ERROR)
+        run = {'config': config, 'results': self.measure(opts)}
+
+        if opts['output']:
+            Path(opts['output']).write_text(json.dumps(run, indent=2) + '\n')
+        baseline_path = Path(opts['baseline'])
+        if opts['update_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(run, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {baseline_path}."))
+            return
+        if not baseline_path.exists():
+            raise CommandError(f"No baseline at {baseline_path}; rerun with --update-baseline to record one.")
+        baseline = json.loads(baseline_path.read_text())
+        if baseline['config'] != config:
+            raise CommandError(
+                f"The baseline was recorded with {baseline['config']}; rerun with the same options "
+                f"or record a new baseline."
+            )
+        problems = compare_to_baseline(baseline['results'], run['results'], opts['tolerance'], opts['query_tolerance'])
+        if problems:
+            raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(problems))
+        self.stdout.write(self.style.SUCCESS("Within tolerance of the baseline."))
+
+    def measure(self, opts):
+        """Seed a scratch store and benchmark every scenario against it."""
+        with scratch_database(on_disk=True), override_settings(ALLOWED_HOSTS=['testserver']):
+            self.stdout.write("Seeding " + ", ".join(f"{opts[k]} {k}" for k in SIZE_OPTIONS) + "...")
+            seed_store(**{k: opts[k] for k in SIZE_OPTIONS}, seed=opts['seed'])
+            scenarios = Scenarios()
+            results = {name: self.run_sequential(scenarios, name, opts['requests']) for name in Scenarios.NAMES}
+            results['load'] = self.run_concurrent(scenarios, opts['requests'], opts['concurrency'])
+        return results
+
+    def run_sequential(self, scenarios, name, requests):
+        scenarios.request(name, 0)  # warm up
+        samples, queries = [], 0
+        for n in range(requests):
+            with ExitStack() as stack:
+                captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+                start = time.perf_counter()
+                resp = scenarios.request(name, n)
+                samples.append(time.perf_counter() - start)
+            if resp.status_code >= 400:
+                raise CommandError(f"{name} returned {resp.status_code}")
+            queries = max(queries, sum(len(c) for c in captured))
+        stats = percentiles(samples)
+        self.stdout.write(format_row(name, stats) + f"  queries={queries}")
+        return {**{k: round(v, 3) for k, v in stats.items()}, 'queries': queries}
+
+    def run_concurrent(self, scenarios, requests, concurrency):
+        jobs = [(name, n) for n in range(requests) for name in Scenarios.NAMES]
+
+        def one(job):
+            start = time.perf_counter()
+            try:
+                resp = scenarios.request(*job)
+            finally:
+                connections.close_all()
+            if resp.status_code >= 400:
+                raise CommandError(f"{job[0]} returned {resp.status_code} under load")
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(one, jobs))
+        elapsed = time.perf_counter() - start
+        stats = percentiles(samples)
+        self.stdout.write(format_row(f'mixed x{concurrency}', stats) + f"  {len(samples) / elapsed:7.1f} req/s")
+        return {**{k: round(v, 3) for k, v in stats.items()}, 'rps': round(len(samples) / elapsed, 1)}
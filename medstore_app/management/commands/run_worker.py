@@ -0,0 +1,86 @@
+import logging
+import os
+import signal
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from medstore_app.jobs import claim, run_jobs, prune
+
+log = logging.getLogger('medstore.jobs')
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs: claim them in batches under a lease, retry failures with "
+        "backoff, and log throughput and queue lag. Stops cleanly on SIGINT/SIGTERM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.MEDSTORE_JOB_BATCH_SIZE)
+        parser.add_argument('--lease', type=int, default=settings.MEDSTORE_JOB_LEASE_SECONDS,
+                            help="Seconds a claimed batch stays reserved for this worker.")
+        parser.add_argument('--poll', type=float, default=settings.MEDSTORE_JOB_POLL_SECONDS,
+                            help="Seconds to sleep when no job is ready.")
+        parser.add_argument('--once', action='store_true', help="Exit as soon as no job is ready.")
+        parser.add_argument('--report-every', type=float, default=60,
+                            help="Log throughput and lag every N seconds.")
+        parser.add_argument('--name', default=f'{socket.gethostname()}:{os.getpid()}')
+
+    def handle(self, *args, **opts):
+        self.stopping = False
+        previous = {signum: signal.signal(signum, self.stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            self.work(opts['name'][:64], opts)
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+    def work(self, worker, opts):
+        totals = {'done': 0, 'failed': 0}
+        window = self.new_window()
+        last_prune = 0.0
+        while not self.stopping:
+            close_old_connections()
+            jobs = claim(worker, opts['batch_size'], opts['lease'])
+            if jobs:
+                now = timezone.now()
+                for job in jobs:
+                    lag = max(0.0, (now - job.run_after).total_seconds())
+                    window['lag'] += lag
+                    window['max_lag'] = max(window['max_lag'], lag)
+                done, failed = run_jobs(worker, jobs, opts['lease'])
+                for key, ids in (('done', done), ('failed', failed)):
+                    window[key] += len(ids)
+                    totals[key] += len(ids)
+            if time.monotonic() - window['since'] >= opts['report_every']:
+                self.report(window)
+                window = self.new_window()
+            if time.monotonic() - last_prune >= 3600:
+                prune()
+                last_prune = time.monotonic()
+            if not jobs:
+                if opts['once']:
+                    break
+                time.sleep(opts['poll'])
+        self.stdout.write(f"Worker {worker} stopped: {totals['done']} jobs done, {totals['failed']} failed.")
+
+    def stop(self, signum, frame):
+        # Finish the batch in hand; its lease would only delay the jobs otherwise.
+        self.stopping = True
+
+    def new_window(self):
+        return {'done': 0, 'failed': 0, 'lag': 0.0, 'max_lag': 0.0, 'since': time.monotonic()}
+
+    def report(self, window):
+        elapsed = time.monotonic() - window['since']
+        ran = window['done'] + window['failed']
+        log.info(
+            "%d jobs in %.0fs (%.1f/s), %d failed; lag mean %.2fs max %.2fs",
+            ran, elapsed, ran / elapsed if elapsed else 0.0, window['failed'],
+            window['lag'] / ran if ran else 0.0, window['max_lag'],
+        )
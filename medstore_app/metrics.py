@@ -0,0 +1,267 @@
+"""
+Per-request performance metrics.
+
+``RequestMetricsMiddleware`` measures every request: wall time, number of SQL
+queries and time spent in them, template render time and response size. The
+figures go into per-view histograms, which ``admin-panel/metrics/`` serves in
+Prometheus text format.
+
+SQL is counted by an execute wrapper installed on every new DB connection (so
+both the ``default`` and ``replica`` aliases are covered). Templates are timed
+by ``TimedDjangoTemplates``, the configured template backend. Both report to
+the request being measured through a context variable. That also covers
+async views, whose ORM calls run on another thread.
+
+A request slower than ``MEDSTORE_SLOW_REQUEST_SECONDS`` is logged to the
+``medstore.slow_requests`` logger as one JSON object. The object includes every
+SQL statement the request ran more than once, which usually points at an N+1.
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+from .jobs import queue_stats
+from .orders import placement_stats
+from .users import user_cache
+from .viewcache import view_cache_stats
+
+slow_log = logging.getLogger('medstore.slow_requests')
+
+_current = contextvars.ContextVar('medstore_request_metrics', default=None)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class RequestMetrics:
+    """What one request spent, filled in as it runs."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.sql = Counter()
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        self.sql[sql] += 1
+
+    def duplicates(self):
+        return [{'sql': sql, 'count': n} for sql, n in self.sql.most_common() if n > 1]
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - start)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """``connection_created`` receiver: count this connection's queries."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# -------------------------
+# Histograms
+# -------------------------
+class Histogram:
+    """A Prometheus-style cumulative histogram with one series per label value."""
+
+    def __init__(self, name, help_text, buckets, label='view'):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label = label
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_value, (counts, total, count) in sorted(self._series.items()):
+                label = f'{self.label}="{_escape(label_value)}"'
+                for bound, n in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {n}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+                lines.append(f'{self.name}_sum{{{label}}} {total:g}')
+                lines.append(f'{self.name}_count{{{label}}} {count}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+HISTOGRAMS = {
+    'wall': Histogram('medstore_request_seconds', 'Request wall time.', SECONDS_BUCKETS),
+    'queries': Histogram('medstore_request_queries', 'SQL queries per request.', QUERY_BUCKETS),
+    'db': Histogram('medstore_request_db_seconds', 'Time spent in SQL per request.', SECONDS_BUCKETS),
+    'templates': Histogram('medstore_request_template_seconds', 'Template render time per request.', SECONDS_BUCKETS),
+    'bytes': Histogram('medstore_response_bytes', 'Response body size (buffered responses only).', BYTES_BUCKETS),
+}
+
+
+def clear():
+    for histogram in HISTOGRAMS.values():
+        histogram.clear()
+
+
+def _gauges():
+    lines = ['# HELP medstore_user_cache Per-process customer cache counters.', '# TYPE medstore_user_cache gauge']
+    for key, value in user_cache.stats().items():
+        lines.append(f'medstore_user_cache{{stat="{key}"}} {value:g}')
+    lines += ['# HELP medstore_orders_total Order placement outcomes in this process.',
+              '# TYPE medstore_orders_total counter']
+    for key, value in placement_stats.snapshot().items():
+        lines.append(f'medstore_orders_total{{outcome="{key}"}} {value}')
+    lines += ['# HELP medstore_view_cache_total Cached view lookups in this process by outcome.',
+              '# TYPE medstore_view_cache_total counter']
+    for key, value in view_cache_stats.snapshot().items():
+        lines.append(f'medstore_view_cache_total{{outcome="{key}"}} {value}')
+    jobs = queue_stats()
+    lines += ['# HELP medstore_jobs Background jobs per status (finished jobs until pruned).',
+              '# TYPE medstore_jobs gauge']
+    for status, n in sorted(jobs['counts'].items()):
+        lines.append(f'medstore_jobs{{status="{status}"}} {n}')
+    lines += ['# HELP medstore_job_lag_seconds How long the oldest ready job has been waiting.',
+              '# TYPE medstore_job_lag_seconds gauge',
+              f"medstore_job_lag_seconds {jobs['lag']:g}",
+              f"# HELP medstore_jobs_finished_recent Jobs finished in the last {jobs['window']} seconds.",
+              '# TYPE medstore_jobs_finished_recent gauge',
+              f"medstore_jobs_finished_recent {jobs['finished']}"]
+    return lines
+
+
+def exposition():
+    """Every metric in Prometheus text format."""
+    lines = []
+    for histogram in HISTOGRAMS.values():
+        lines += histogram.expose()
+    lines += _gauges()
+    return '\n'.join(lines) + '\n'
+
+
+# -------------------------
+# Middleware and template backend
+# -------------------------
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+def _finish(request, response, metrics):
+    wall = time.perf_counter() - metrics.started
+    view = _view_name(request)
+    HISTOGRAMS['wall'].observe(view, wall)
+    HISTOGRAMS['queries'].observe(view, metrics.queries)
+    HISTOGRAMS['db'].observe(view, metrics.db_time)
+    HISTOGRAMS['templates'].observe(view, metrics.template_time)
+    size = None if response.streaming else len(response.content)
+    if size is not None:
+        HISTOGRAMS['bytes'].observe(view, size)
+    if wall >= settings.MEDSTORE_SLOW_REQUEST_SECONDS:
+        slow_log.warning(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'wall_ms': round(wall * 1000, 1),
+            'db_ms': round(metrics.db_time * 1000, 1),
+            'template_ms': round(metrics.template_time * 1000, 1),
+            'queries': metrics.queries,
+            'bytes': size,
+            'duplicate_sql': metrics.duplicates(),
+        }))
+
+
+class RequestMetricsMiddleware:
+    """Measure each request; keep it first in ``MIDDLEWARE`` so it sees the whole stack."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        _finish(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        _finish(request, response, metrics)
+        return response
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template engine, with top-level renders timed into the current request's metrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:20
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicates(apps, schema_editor):
+    """
+    Blank mobiles become NULL, which the unique constraint allows more than
+    once. Duplicate usernames or mobiles are real accounts a person has to
+    merge, so stop here with a list of them instead of a bare IntegrityError.
+    """
+    db = schema_editor.connection.alias
+    User = apps.get_model('medstore_app', 'User')
+    User.objects.using(db).filter(mobile='').update(mobile=None)
+    problems = []
+    for field in ('username', 'mobile'):
+        dupes = (
+            User.objects.using(db).exclude(**{f'{field}__isnull': True}).values(field)
+            .annotate(n=Count('id')).filter(n__gt=1).order_by(field)
+        )
+        for row in dupes:
+            ids = User.objects.using(db).filter(**{field: row[field]}).order_by('id').values_list('id', flat=True)
+            problems.append(f"  {field} {row[field]!r}: user ids {', '.join(map(str, ids))}")
+    if problems:
+        raise RuntimeError(
+            "Cannot make username and mobile unique; merge or rename these accounts first:\n"
+            + '\n'.join(problems)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medstore_app', '0003_category_remove_contactmessage_date_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='user',
+            name='mobile',
+            field=models.CharField(blank=True, max_length=15, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='username',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:23
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def seed_stats(apps, schema_editor):
+    # The same keys as medstore_app.stats, counted here on the historical
+    # models so later changes to the app cannot change this migration.
+    db = schema_editor.connection.alias
+    User = apps.get_model('medstore_app', 'User')
+    Medicine = apps.get_model('medstore_app', 'Medicine')
+    Order = apps.get_model('medstore_app', 'Order')
+    StoreStat = apps.get_model('medstore_app', 'StoreStat')
+    medicines = Medicine.objects.using(db)
+    orders = Order.objects.using(db)
+    expected = {
+        'users': User.objects.using(db).count(),
+        'medicines': medicines.count(),
+        'orders': orders.count(),
+        'low_stock': medicines.filter(stock__lte=settings.MEDSTORE_LOW_STOCK_THRESHOLD).count(),
+    }
+    for status, n in orders.values_list('status').annotate(n=Count('id')).order_by():
+        expected[f'orders:status:{status}'] = n
+    revenue = orders.annotate(day=TruncDate('datetime')).values_list('day').annotate(total=Sum('total_amount'))
+    for day, total in revenue.order_by():
+        expected[f'revenue:{day.isoformat()}'] = total
+    StoreStat.objects.using(db).bulk_create([
+        StoreStat(key=key, value=Decimal(value)) for key, value in expected.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medstore_app', '0004_user_username_mobile_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.RunPython(seed_stats, migrations.RunPython.noop),
+    ]
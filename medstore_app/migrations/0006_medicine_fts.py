@@ -0,0 +1,18 @@
+from django.db import migrations
+
+from medstore_app import fts
+
+# SQLite only: an FTS5 index over medicine name, description and category
+# name, kept in sync by triggers (see medstore_app/fts.py). Other backends
+# fall back to icontains in medstore_app/search.py.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medstore_app', '0005_storestat'),
+    ]
+
+    operations = [
+        migrations.RunPython(fts.create_index, fts.drop_index),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:30
+
+from django.db import migrations, models
+
+from medstore_app import fts
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medstore_app', '0006_medicine_fts'),
+    ]
+
+    operations = fts.without_triggers(
+        migrations.AddField(
+            model_name='medicine',
+            name='sku',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    )
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:45
+
+from django.db import migrations, models, transaction
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 5000
+
+
+def _in_batches(model, db, update):
+    # One short transaction per id range, so a large backfill never holds
+    # the write lock for long.
+    ids = model.objects.using(db).order_by('id').values_list('id', flat=True)
+    last = ids.last()
+    if last is None:
+        return
+    for start in range(ids.first(), last + 1, BATCH_SIZE):
+        with transaction.atomic(using=db):
+            update(model.objects.using(db).filter(id__gte=start, id__lt=start + BATCH_SIZE))
+
+
+def backfill_snapshots(apps, schema_editor):
+    db = schema_editor.connection.alias
+    User = apps.get_model('medstore_app', 'User')
+    Medicine = apps.get_model('medstore_app', 'Medicine')
+    customer = User.objects.filter(id=OuterRef('user_id'))
+    medicine = Medicine.objects.filter(id=OuterRef('medicine_id'))
+    _in_batches(apps.get_model('medstore_app', 'Order'), db, lambda qs: qs.update(
+        customer_name=Coalesce(Subquery(customer.values('username')[:1]), Value('')),
+        customer_email=Coalesce(Subquery(customer.values('email')[:1]), Value('')),
+    ))
+    _in_batches(apps.get_model('medstore_app', 'OrderItem'), db, lambda qs: qs.update(
+        medicine_name=Coalesce(Subquery(medicine.values('name')[:1]), Value('')),
+        category_name=Coalesce(Subquery(medicine.values('category__name')[:1]), Value('')),
+    ))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('medstore_app', '0007_medicine_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='customer_email',
+            field=models.EmailField(blank=True, default='', max_length=254),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='customer_name',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='category_name',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='medicine_name',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+    ]
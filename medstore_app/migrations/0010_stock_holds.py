@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from medstore_app import fts
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medstore_app', '0009_order_user_datetime_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('holder', models.CharField(max_length=64)),
+                ('quantity', models.IntegerField()),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+        *fts.without_triggers(
+            migrations.AddField(
+                model_name='medicine',
+                name='reserved',
+                field=models.IntegerField(default=0),
+            ),
+            migrations.AddIndex(
+                model_name='medicine',
+                index=models.Index(fields=['stock'], name='medicine_stock_idx'),
+            ),
+        ),
+        migrations.AddField(
+            model_name='stockhold',
+            name='medicine',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='medstore_app.medicine'),
+        ),
+        migrations.AddIndex(
+            model_name='stockhold',
+            index=models.Index(fields=['expires_at'], name='stockhold_expires_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockhold',
+            constraint=models.UniqueConstraint(fields=('holder', 'medicine'), name='stockhold_holder_medicine_uniq'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def enable_wal(apps, schema_editor):
+    # Persistent in the database file; see medstore_pro/db.py. SQLite refuses
+    # to change the journal mode inside a transaction, hence atomic = False.
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+
+
+def disable_wal(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=DELETE')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('medstore_app', '0015_notified_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(enable_wal, disable_wal),
+    ]
@@ -1,9 +1,9 @@
 from django.db import models
 
 class User(models.Model):
-    username = models.CharField(max_length=100)
+    username = models.CharField(max_length=100, unique=True)
     email = models.EmailField(unique=True)
-    mobile = models.CharField(max_length=15, blank=True, null=True)
+    mobile = models.CharField(max_length=15, blank=True, null=True, unique=True)
     password = models.CharField(max_length=255)  # hashed password
 
     def __str__(self):
@@ -19,10 +19,19 @@ class Category(models.Model):
 
 class Medicine(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)  # distributor code; import key
     name = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
     description = models.TextField(blank=True, null=True)
     stock = models.IntegerField(default=0)
+    # Units held by carts (sum of live StockHold rows); stock - reserved can be sold.
+    reserved = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Low-stock listing: a range scan from the lowest stock up.
+            models.Index(fields=['stock'], name='medicine_stock_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -30,7 +39,13 @@ class Medicine(models.Model):
 
 class ProductImage(models.Model):
     medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
-    image_path = models.CharField(max_length=255)
+    image_path = models.CharField(max_length=255)  # the upload, relative to MEDSTORE_IMAGE_UPLOAD_ROOT
+    # Filled by process_images: the upload's size, its SHA-256, and
+    # {variant: {"path", "width", "height"}} under MEDSTORE_IMAGE_ROOT.
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    digest = models.CharField(max_length=64, blank=True, default='')
+    variants = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f"Image for {self.medicine.name}"
@@ -41,9 +56,22 @@ class Order(models.Model):
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
     status = models.CharField(max_length=50, default='pending')  # pending / placed / delivered
     datetime = models.DateTimeField(auto_now_add=True)
+    # Customer as they were when the order was placed, so listings need no join.
+    customer_name = models.CharField(max_length=100, blank=True, default='')
+    customer_email = models.EmailField(blank=True, default='')
+    # When the confirmation mail went out; guards the job against sending twice.
+    notified_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Order history: one customer's orders, newest first.
+            models.Index(fields=['user', '-datetime', '-id'], name='order_user_datetime_idx'),
+            # Date-range scans, e.g. rebuilding the sales rollups a chunk of days at a time.
+            models.Index(fields=['datetime'], name='order_datetime_idx'),
+        ]
 
     def __str__(self):
-        return f"Order {self.id} by {self.user.username}"
+        return f"Order {self.id} by {self.customer_name}"
 
 
 class OrderItem(models.Model):
@@ -51,9 +79,12 @@ class OrderItem(models.Model):
     medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Medicine as it was when the order was placed.
+    medicine_name = models.CharField(max_length=255, blank=True, default='')
+    category_name = models.CharField(max_length=100, blank=True, default='')
 
     def __str__(self):
-        return f"{self.medicine.name} x {self.quantity}"
+        return f"{self.medicine_name} x {self.quantity}"
 
 
 class ContactMessage(models.Model):
@@ -61,6 +92,153 @@ class ContactMessage(models.Model):
     email = models.EmailField()
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    is_read = models.BooleanField(default=False)
+    # When the admin was notified; guards the job against sending twice.
+    notified_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Admin inbox: newest first, paged by (created_at, id); also the archive cutoff.
+            models.Index(fields=['-created_at', '-id'], name='message_created_idx'),
+            models.Index(fields=['email', '-created_at', '-id'], name='message_email_idx'),
+            # Unread messages only, so the unread view skips everything already handled.
+            models.Index(
+                fields=['-created_at', '-id'], name='message_unread_idx', condition=models.Q(is_read=False),
+            ),
+        ]
 
     def __str__(self):
         return f"Message from {self.name}"
+
+
+class MessageArchive(models.Model):
+    # A batch of contact messages moved out of ContactMessage by
+    # `manage.py archive_messages`: zlib-compressed JSON lines, one per
+    # message. See medstore_app/inbox.py.
+    first_created_at = models.DateTimeField()
+    last_created_at = models.DateTimeField()
+    count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['first_created_at'], name='messagearchive_first_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.count} messages up to {self.last_created_at:%Y-%m-%d}"
+
+
+class StockHold(models.Model):
+    # Stock a cart (keyed by session) has set aside until expires_at; see
+    # medstore_app/inventory.py.
+    holder = models.CharField(max_length=64)
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
+    quantity = models.IntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['holder', 'medicine'], name='stockhold_holder_medicine_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='stockhold_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.medicine_id} held by {self.holder}"
+
+
+class StoreStat(models.Model):
+    # Running dashboard counters keyed like 'orders', 'orders:status:placed'
+    # or 'revenue:2025-11-23'; kept current by medstore_app/stats.py.
+    key = models.CharField(max_length=64, unique=True)
+    value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+
+class CatalogVersion(models.Model):
+    # A single row: the catalog version (a microsecond timestamp), moved
+    # forward inside every catalog write's transaction; see catalog.py.
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return str(self.version)
+
+
+class DailySales(models.Model):
+    # Sales rollups, one row per day (TIME_ZONE) and breakdown; kept current
+    # at checkout and rebuilt by `manage.py rebuild_rollups` (see rollups.py).
+    day = models.DateField(unique=True)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day}: {self.revenue}"
+
+
+class DailyMedicineSales(models.Model):
+    day = models.DateField()
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
+    medicine_name = models.CharField(max_length=255, blank=True, default='')
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'medicine'], name='dailymedicinesales_day_medicine_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.medicine_name}: {self.revenue}"
+
+
+class DailyCategorySales(models.Model):
+    day = models.DateField()
+    # The category name as snapshotted on the order lines ('' for none).
+    category_name = models.CharField(max_length=100, blank=True, default='')
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category_name'], name='dailycategorysales_day_category_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.category_name or 'uncategorised'}: {self.revenue}"
+
+
+class Job(models.Model):
+    # Deferred work run by `manage.py run_worker`; see medstore_app/jobs.py.
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+    kind = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField()
+    # Set while a worker holds the job; past this time another worker may take it over.
+    locked_by = models.CharField(max_length=64, blank=True, default='')
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Claiming: the oldest ready jobs of a status.
+            models.Index(fields=['status', 'run_after'], name='job_ready_idx'),
+            # Throughput and pruning of finished jobs.
+            models.Index(fields=['status', 'finished_at'], name='job_finished_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} ({self.status})"
@@ -0,0 +1,167 @@
+"""
+Order placement.
+
+Stock is never read into Python and written back. The decrement is a single
+conditional UPDATE (``stock = stock - qty WHERE stock - reserved >= qty``)
+covering every line of the order, so two buyers racing for the last units
+cannot both win: the loser's UPDATE matches fewer rows than it has lines and
+the order is rejected. Units other carts hold (see inventory.py) are not
+for sale; the buyer's own holds are released in the same transaction first.
+When SQLite reports the database as locked the whole transaction is retried
+with exponential backoff. The same transaction adds the order to the daily
+sales rollups (rollups.py) and queues its follow-up work, the confirmation
+email, as a job for ``manage.py run_worker``.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction, OperationalError
+from django.db.models import Case, F, Q, When
+
+from . import rollups, stats
+from .inventory import free_stock
+from .jobs import enqueue
+from .models import Medicine, Order, OrderItem
+
+
+class OrderRejected(Exception):
+    pass
+
+
+class OutOfStock(OrderRejected):
+    pass
+
+
+class MedicineNotFound(OrderRejected):
+    pass
+
+
+class PlacementStats:
+    """Process-wide counters for order placement outcomes."""
+
+    FIELDS = ('placed', 'rejected', 'retries', 'failed')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def incr(self, field, n=1):
+        with self._lock:
+            self._counts[field] += n
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+placement_stats = PlacementStats()
+
+
+def _is_lock_error(exc):
+    return 'locked' in str(exc).lower() or 'busy' in str(exc).lower()
+
+
+def run_with_retry(fn):
+    """
+    Call ``fn`` and retry it on lock contention, sleeping
+    ``base * 2**attempt`` (with jitter, capped) between attempts.
+    Gives up after ``MEDSTORE_ORDER_MAX_ATTEMPTS`` and re-raises.
+    """
+    attempts = settings.MEDSTORE_ORDER_MAX_ATTEMPTS
+    base = settings.MEDSTORE_ORDER_BACKOFF_BASE
+    cap = settings.MEDSTORE_ORDER_BACKOFF_MAX
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except OperationalError as exc:
+            if not _is_lock_error(exc) or attempt == attempts - 1:
+                raise
+            placement_stats.incr('retries')
+            time.sleep(min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+def _count_new_low_stock(lines):
+    # The decrement bypasses model signals, so update the dashboard's
+    # low-stock counter here: a line crossed the threshold if its new stock
+    # is at or below it but was above it before this order.
+    threshold = settings.MEDSTORE_LOW_STOCK_THRESHOLD
+    crossed = Q()
+    for med_id, qty in lines.items():
+        crossed |= Q(id=med_id, stock__lte=threshold, stock__gt=threshold - qty)
+    stats.bump({'low_stock': Medicine.objects.filter(crossed).count()})
+
+
+def _checkout(user, lines, holder=None):
+    ids = list(lines)
+    enough = Q()
+    for med_id, qty in lines.items():
+        enough |= Q(id=med_id, stock__gte=F('reserved') + qty)
+    with transaction.atomic():
+        # The buyer's own holds become the order; expired ones stop counting.
+        free_stock(ids, holder)
+        # Write first: the UPDATE takes the write lock up front, so SQLite
+        # never has to upgrade a read transaction (which cannot wait).
+        updated = Medicine.objects.filter(enough).update(stock=Case(
+            *[When(id=med_id, then=F('stock') - qty) for med_id, qty in lines.items()],
+            default=F('stock'),
+        ))
+        meds = {
+            med_id: (price, name, category or '')
+            for med_id, price, name, category in Medicine.objects.filter(id__in=ids)
+            .values_list('id', 'price', 'name', 'category__name')
+        }
+        if len(meds) < len(ids):
+            raise MedicineNotFound('Medicine not found.')
+        if updated < len(ids):
+            # Rolls back the decrements that did apply.
+            raise OutOfStock('Not enough stock available.')
+        _count_new_low_stock(lines)
+        total = sum(meds[med_id][0] * qty for med_id, qty in lines.items())
+        order = Order.objects.create(
+            user=user, total_amount=total, status='placed',
+            customer_name=user.username, customer_email=user.email,
+        )
+        items = OrderItem.objects.bulk_create([
+            OrderItem(order=order, medicine_id=med_id, quantity=qty, price=meds[med_id][0],
+                      medicine_name=meds[med_id][1], category_name=meds[med_id][2])
+            for med_id, qty in lines.items()
+        ])
+        rollups.record_order(order, items)
+        enqueue('order_placed', order_id=order.id)
+    return order
+
+
+def checkout(user, lines, holder=None):
+    """
+    Place one order for ``user`` covering every ``{medicine_id: quantity}``
+    line, in one transaction and a fixed number of statements however many
+    lines there are. Either every line is filled or nothing is. ``holder``'s
+    stock holds on those lines become part of the order.
+
+    Raises ``OrderRejected`` (``OutOfStock``/``MedicineNotFound``) when the
+    order cannot be filled, and ``OperationalError`` when the database stays
+    locked through every retry.
+    """
+    if not lines:
+        raise OrderRejected('Your cart is empty.')
+    try:
+        order = run_with_retry(lambda: _checkout(user, lines, holder))
+    except OrderRejected:
+        placement_stats.incr('rejected')
+        raise
+    except OperationalError:
+        placement_stats.incr('failed')
+        raise
+    placement_stats.incr('placed')
+    return order
+
+
+def place_order(user, medicine_id, quantity, holder=None):
+    """Place a one-line order; see ``checkout``."""
+    return checkout(user, {medicine_id: quantity}, holder)
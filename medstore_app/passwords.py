@@ -0,0 +1,96 @@
+"""
+Password hashing off the request thread.
+
+PBKDF2 is deliberately slow, and a login spike with the hash computed inline
+pins every worker. All hashing here goes through one small thread pool
+(``hashlib`` releases the GIL while it works), which bounds how much CPU
+password checks can take at once. A caller waits at most
+``MEDSTORE_HASH_TIMEOUT`` seconds for a slot before getting
+``PasswordCheckBusy``. The async variants await the same pool without
+holding a thread.
+
+A successful check against a hash made with outdated hasher parameters
+stores a fresh hash (Django's ``must_update``), so raising the iteration
+count upgrades accounts as their owners log in.
+"""
+import asyncio
+import concurrent.futures
+import threading
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+from .models import User
+from .users import user_cache
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PasswordCheckBusy(Exception):
+    pass
+
+
+def hash_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=settings.MEDSTORE_HASH_WORKERS, thread_name_prefix='medstore-hash'
+                )
+    return _pool
+
+
+def _check(raw_password, encoded):
+    # Returns (matches, new_hash); new_hash is set only when the stored hash
+    # matched but was made with outdated hasher parameters.
+    upgraded = []
+    ok = check_password(raw_password, encoded, setter=lambda raw: upgraded.append(make_password(raw)))
+    return ok, (upgraded[0] if upgraded else None)
+
+
+def _wait(future):
+    try:
+        return future.result(timeout=settings.MEDSTORE_HASH_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise PasswordCheckBusy('Too many logins right now. Please try again.')
+
+
+def _same_hash(user):
+    # Only replace the hash we verified against, in case it changed meanwhile.
+    return User.objects.filter(id=user.id, password=user.password)
+
+
+def _rehashed(user, new_hash):
+    user.password = new_hash
+    user_cache.invalidate(user.id)
+
+
+def verify_password(user, raw_password):
+    """Check ``raw_password`` against ``user`` on the hash pool, upgrading the hash if needed."""
+    ok, new_hash = _wait(hash_pool().submit(_check, raw_password, user.password))
+    if ok and new_hash:
+        _same_hash(user).update(password=new_hash)
+        _rehashed(user, new_hash)
+    return ok
+
+
+def hash_password(raw_password):
+    return _wait(hash_pool().submit(make_password, raw_password))
+
+
+async def averify_password(user, raw_password):
+    future = hash_pool().submit(_check, raw_password, user.password)
+    try:
+        ok, new_hash = await asyncio.wait_for(
+            asyncio.wrap_future(future), settings.MEDSTORE_HASH_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        future.cancel()
+        raise PasswordCheckBusy('Too many logins right now. Please try again.')
+    if ok and new_hash:
+        await _same_hash(user).aupdate(password=new_hash)
+        _rehashed(user, new_hash)
+    return ok
@@ -0,0 +1,103 @@
+"""
+Admin order reports.
+
+``order_report`` returns a page of orders with their line items already
+loaded: one query for orders and one for their items, however many orders
+or lines the page holds. Customer and medicine names come from the snapshot
+columns on ``Order``/``OrderItem``, so neither query joins.
+"""
+import datetime as dt
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Order, OrderItem
+
+
+def report_queryset():
+    items = OrderItem.objects.order_by('id')
+    return Order.objects.prefetch_related(Prefetch('items', queryset=items)).order_by('-id')
+
+
+def _day_start(day):
+    return timezone.make_aware(dt.datetime.combine(day, dt.time.min))
+
+
+def filter_orders(qs, status=None, date_from=None, date_to=None, prefix=''):
+    """
+    Narrow ``qs`` by status and an inclusive ``date_from``..``date_to`` day
+    range. ``prefix`` reaches the order through a relation, e.g. ``'order__'``.
+    """
+    if status:
+        qs = qs.filter(**{f'{prefix}status': status})
+    return filter_days(qs, f'{prefix}datetime', date_from, date_to)
+
+
+def filter_days(qs, field, date_from=None, date_to=None):
+    if date_from:
+        qs = qs.filter(**{f'{field}__gte': _day_start(date_from)})
+    if date_to:
+        qs = qs.filter(**{f'{field}__lt': _day_start(date_to + dt.timedelta(days=1))})
+    return qs
+
+
+def parse_day(value):
+    """A ``YYYY-MM-DD`` query parameter as a date, or ``None`` if missing or invalid."""
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+
+def parse_report_args(params):
+    """Pull ``status``, ``from``, ``to``, ``before`` and ``size`` out of a GET querydict."""
+    try:
+        before = int(params.get('before') or 0) or None
+    except ValueError:
+        before = None
+    try:
+        size = int(params.get('size') or settings.MEDSTORE_REPORT_PAGE_SIZE)
+    except ValueError:
+        size = settings.MEDSTORE_REPORT_PAGE_SIZE
+    return {
+        'status': (params.get('status') or '').strip() or None,
+        'date_from': parse_day(params.get('from')),
+        'date_to': parse_day(params.get('to')),
+        'before': before,
+        'size': min(max(1, size), settings.MEDSTORE_REPORT_MAX_PAGE_SIZE),
+    }
+
+
+def order_report(status=None, date_from=None, date_to=None, before=None, size=None):
+    """
+    One page of orders, newest first, and the cursor for the next page.
+
+    ``before`` is the id of the last order on the previous page. Pass
+    ``size=None`` to get every matching order (still two queries).
+    """
+    qs = _report_page(status, date_from, date_to, before)
+    if size is None:
+        return list(qs), None
+    return _cut_page(list(qs[:size + 1]), size)
+
+
+async def aorder_report(status=None, date_from=None, date_to=None, before=None, size=None):
+    """``order_report`` on the async ORM; the same two queries."""
+    qs = _report_page(status, date_from, date_to, before)
+    if size is None:
+        return [order async for order in qs], None
+    return _cut_page([order async for order in qs[:size + 1]], size)
+
+
+def _report_page(status, date_from, date_to, before):
+    qs = filter_orders(report_queryset(), status, date_from, date_to)
+    if before:
+        qs = qs.filter(id__lt=before)
+    return qs
+
+
+def _cut_page(orders, size):
+    next_cursor = orders[size - 1].id if len(orders) > size else None
+    return orders[:size], next_cursor
@@ -0,0 +1,161 @@
+"""
+Daily sales rollups.
+
+Three tables hold units, revenue and order count per day (in TIME_ZONE):
+``DailySales`` has the store totals, ``DailyMedicineSales`` one row per
+medicine and ``DailyCategorySales`` one per category. Checkout adds each
+order to them in its own transaction, with one upsert per table
+(``record_order``). Orders are counted when placed, whatever their later
+status.
+
+``rebuild`` recomputes a date range from ``OrderItem`` a few days at a
+time. Each chunk deletes its days and re-inserts them in one transaction,
+so running it again over the same range gives the same rows. The analytics
+page reads only these tables: a year of daily revenue is at most 365 rows
+on a unique-index range.
+"""
+import datetime as dt
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailySales, DailyMedicineSales, DailyCategorySales, OrderItem
+from .reports import filter_days, parse_day
+from .viewcache import invalidate_tags
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _add(model, keys, rows, replace=()):
+    """
+    Upsert ``rows`` (dicts) into ``model``'s table. ``units``, ``revenue``
+    and ``orders`` are added to an existing row, and the ``replace``
+    columns overwrite it.
+    """
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    columns = list(keys) + ['units', 'revenue', 'orders'] + list(replace)
+    updates = [f'{qn(c)} = {table}.{qn(c)} + excluded.{qn(c)}' for c in ('units', 'revenue', 'orders')]
+    updates += [f'{qn(c)} = excluded.{qn(c)}' for c in replace]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} ({", ".join(map(qn, columns))}) VALUES ({", ".join(["%s"] * len(columns))}) '
+            f'ON CONFLICT ({", ".join(map(qn, keys))}) DO UPDATE SET {", ".join(updates)}',
+            [[row[c] for c in columns] for row in rows],
+        )
+
+
+def record_order(order, items):
+    """Add a just-placed ``order`` and its ``items`` to the rollups (three statements)."""
+    day = timezone.localdate(order.datetime)
+    units = sum(item.quantity for item in items)
+    _add(DailySales, ['day'], [{'day': day, 'units': units, 'revenue': order.total_amount, 'orders': 1}])
+    medicines, categories = {}, {}
+    for item in items:
+        line = item.price * item.quantity
+        med = medicines.setdefault(item.medicine_id, {
+            'day': day, 'medicine_id': item.medicine_id, 'medicine_name': item.medicine_name,
+            'units': 0, 'revenue': Decimal(0), 'orders': 1,
+        })
+        cat = categories.setdefault(item.category_name, {
+            'day': day, 'category_name': item.category_name, 'units': 0, 'revenue': Decimal(0), 'orders': 1,
+        })
+        for row in (med, cat):
+            row['units'] += item.quantity
+            row['revenue'] += line
+    _add(DailyMedicineSales, ['day', 'medicine_id'], list(medicines.values()), replace=['medicine_name'])
+    _add(DailyCategorySales, ['day', 'category_name'], list(categories.values()))
+
+
+def _aggregate(items, *group):
+    return items.annotate(day=TruncDate('order__datetime')).values('day', *group).annotate(
+        units=Sum('quantity'),
+        revenue=Sum(F('price') * F('quantity'), output_field=MONEY),
+        orders=Count('order_id', distinct=True),
+    ).order_by()
+
+
+def rebuild_days(date_from, date_to):
+    """Recompute the rollups for ``date_from``..``date_to`` (inclusive) in one transaction."""
+    items = filter_days(OrderItem.objects.all(), 'order__datetime', date_from, date_to)
+    with transaction.atomic():
+        for model in (DailySales, DailyMedicineSales, DailyCategorySales):
+            model.objects.filter(day__gte=date_from, day__lte=date_to).delete()
+        DailySales.objects.bulk_create([DailySales(**row) for row in _aggregate(items)])
+        DailyMedicineSales.objects.bulk_create([
+            DailyMedicineSales(**row) for row in _aggregate(items, 'medicine_id').annotate(
+                medicine_name=Max('medicine_name'))
+        ])
+        DailyCategorySales.objects.bulk_create([
+            DailyCategorySales(**row) for row in _aggregate(items, 'category_name')
+        ])
+
+
+def rebuild(date_from, date_to, chunk_days=7, on_chunk=None):
+    """Rebuild ``date_from``..``date_to`` ``chunk_days`` at a time; returns the number of chunks."""
+    chunks = 0
+    start = date_from
+    while start <= date_to:
+        end = min(date_to, start + dt.timedelta(days=chunk_days - 1))
+        rebuild_days(start, end)
+        chunks += 1
+        if on_chunk:
+            on_chunk(start, end)
+        start = end + dt.timedelta(days=1)
+    # Pages built from the rollups are tagged with orders.
+    invalidate_tags('order')
+    return chunks
+
+
+# -------------------------
+# Reading
+# -------------------------
+def daily_series(date_from, date_to):
+    """One ``{'day', 'units', 'revenue', 'orders'}`` per day in the range, zeros included."""
+    rows = {
+        row['day']: row for row in DailySales.objects.filter(day__gte=date_from, day__lte=date_to)
+        .values('day', 'units', 'revenue', 'orders')
+    }
+    days = (date_to - date_from).days + 1
+    return [
+        rows.get(day, {'day': day, 'units': 0, 'revenue': Decimal('0.00'), 'orders': 0})
+        for day in (date_from + dt.timedelta(days=n) for n in range(days))
+    ]
+
+
+def _top(model, group, date_from, date_to, limit, **extra):
+    return list(
+        model.objects.filter(day__gte=date_from, day__lte=date_to).values(*group)
+        .annotate(units=Sum('units'), revenue=Sum('revenue'), **extra)
+        .order_by('-revenue', *group)[:limit]
+    )
+
+
+def top_medicines(date_from, date_to, limit=10):
+    return _top(DailyMedicineSales, ['medicine_id'], date_from, date_to, limit, name=Max('medicine_name'))
+
+
+def top_categories(date_from, date_to, limit=10):
+    return _top(DailyCategorySales, ['category_name'], date_from, date_to, limit)
+
+
+def parse_range(params, default_days=365):
+    """``(date_from, date_to)`` from ``from``/``to`` GET params; the last year by default."""
+    date_to = parse_day(params.get('to')) or timezone.localdate()
+    date_from = parse_day(params.get('from')) or date_to - dt.timedelta(days=default_days - 1)
+    return min(date_from, date_to), date_to
+
+
+def chart_points(values, width=800, height=200):
+    """SVG polyline points scaling ``values`` into a ``width`` x ``height`` box."""
+    if not values:
+        return ''
+    top = max(values) or 1
+    step = width / max(1, len(values) - 1)
+    return ' '.join(f'{n * step:.1f},{height - float(v) / float(top) * height:.1f}' for n, v in enumerate(values))
+
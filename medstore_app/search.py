@@ -0,0 +1,75 @@
+"""
+Medicine search.
+
+On SQLite, queries go to the ``medstore_medicine_fts`` FTS5 index (see
+fts.py). Every word is matched as a prefix, so partial input works
+for type-ahead. Results are ranked by the index's configured bm25 ``rank``,
+which weights name matches above category and description matches. Other
+databases fall back to ``icontains`` filters.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .fts import FTS_TABLE
+from .models import Medicine
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query of quoted prefix terms, or '' if it has no words."""
+    words = WORD_RE.findall(text)[:settings.MEDSTORE_SEARCH_MAX_TERMS]
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_medicines(text, category_id=None, limit=None):
+    """Up to ``limit`` matches as ``{'id', 'name', 'price', 'category'}`` dicts, best first."""
+    limit = limit or settings.MEDSTORE_SEARCH_LIMIT
+    if connection.vendor == 'sqlite':
+        return _search_fts(text, category_id, limit)
+    return _search_icontains(text, category_id, limit)
+
+
+def _search_fts(text, category_id, limit):
+    match = fts_query(text)
+    if not match:
+        return []
+    # Rank and cut inside the FTS table first, then fetch just those rows.
+    sql = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+    params = [match]
+    if category_id:
+        sql += " AND category_id = %s"
+        params.append(category_id)
+    sql += " ORDER BY rank LIMIT %s"
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        ids = [row[0] for row in cursor.fetchall()]
+    rows = {
+        row['id']: row for row in
+        Medicine.objects.filter(id__in=ids).values('id', 'name', 'price', 'category__name')
+    }
+    return [_result(rows[med_id]) for med_id in ids if med_id in rows]
+
+
+def _result(row):
+    return {'id': row['id'], 'name': row['name'], 'price': str(row['price']), 'category': row['category__name']}
+
+
+def icontains_filter(text):
+    match = Q()
+    for word in WORD_RE.findall(text)[:settings.MEDSTORE_SEARCH_MAX_TERMS]:
+        match &= Q(name__icontains=word) | Q(description__icontains=word) | Q(category__name__icontains=word)
+    return match
+
+
+def _search_icontains(text, category_id, limit):
+    if not WORD_RE.search(text):
+        return []
+    qs = Medicine.objects.filter(icontains_filter(text))
+    if category_id:
+        qs = qs.filter(category_id=category_id)
+    return [_result(row) for row in qs.order_by('name').values('id', 'name', 'price', 'category__name')[:limit]]
@@ -0,0 +1,119 @@
+from decimal import Decimal
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import stats
+from .catalog import bump_catalog_version
+from .models import User, Category, Medicine, ProductImage, Order
+from .users import user_cache
+from .viewcache import invalidate_tags
+
+
+@receiver([post_save, post_delete], sender=Medicine)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=ProductImage)
+def bump_catalog(sender, instance, **kwargs):
+    # In the write's own transaction, so the rows and the version commit together.
+    bump_catalog_version()
+
+
+@receiver([post_save, post_delete], sender=Medicine)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Order)
+def invalidate_view_tag(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_tags, sender._meta.model_name))
+
+
+@receiver([post_save, post_delete], sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+
+
+# -------------------------
+# Dashboard counters
+# -------------------------
+# Order saves apply the difference from the values loaded with the
+# instance (post_init); fields deferred at load time are unknown (None) and
+# skipped. Medicine stock also moves through bulk UPDATEs in orders.py, so
+# an in-memory instance may be stale: its stored stock is re-read before a
+# save or delete instead. rebuild_stats repairs anything missed.
+
+def _money(value):
+    return None if value is None else Decimal(str(value))
+
+
+def _stored_low(medicine):
+    stock = Medicine.objects.filter(pk=medicine.pk).values_list('stock', flat=True).first()
+    return stats.is_low(stock)
+
+
+@receiver(pre_save, sender=Medicine)
+def remember_stock(sender, instance, **kwargs):
+    instance._stats_low = None if instance._state.adding else _stored_low(instance)
+
+
+@receiver(pre_delete, sender=Medicine)
+def remember_stock_before_delete(sender, instance, **kwargs):
+    instance._stats_low = _stored_low(instance)
+
+
+@receiver(post_init, sender=Order)
+def remember_order(sender, instance, **kwargs):
+    instance._stats_status = instance.__dict__.get('status')
+    instance._stats_total = _money(instance.__dict__.get('total_amount'))
+
+
+@receiver(post_save, sender=User)
+def count_user(sender, instance, created, **kwargs):
+    if created:
+        stats.bump({'users': 1})
+
+
+@receiver(post_delete, sender=User)
+def uncount_user(sender, instance, **kwargs):
+    stats.bump({'users': -1})
+
+
+@receiver(post_save, sender=Medicine)
+def count_medicine(sender, instance, created, **kwargs):
+    deltas = {'medicines': 1} if created else {}
+    if created or instance._stats_low is not None:
+        deltas['low_stock'] = int(stats.is_low(instance.stock)) - int(bool(instance._stats_low))
+    stats.bump(deltas)
+
+
+@receiver(post_delete, sender=Medicine)
+def uncount_medicine(sender, instance, **kwargs):
+    stats.bump({'medicines': -1, 'low_stock': -int(instance._stats_low)})
+
+
+@receiver(post_save, sender=Order)
+def count_order(sender, instance, created, **kwargs):
+    day = stats.revenue_key(timezone.localdate(instance.datetime))
+    total = _money(instance.total_amount)
+    if created:
+        deltas = {'orders': 1, stats.status_key(instance.status): 1, day: total}
+    else:
+        deltas = {}
+        if instance._stats_total is not None:
+            deltas[day] = total - instance._stats_total
+        if instance._stats_status is not None and instance.status != instance._stats_status:
+            deltas[stats.status_key(instance._stats_status)] = -1
+            deltas[stats.status_key(instance.status)] = 1
+    stats.bump(deltas)
+    instance._stats_status = instance.status
+    instance._stats_total = total
+
+
+@receiver(post_delete, sender=Order)
+def uncount_order(sender, instance, **kwargs):
+    deltas = {'orders': -1}
+    if instance._stats_status is not None:
+        deltas[stats.status_key(instance._stats_status)] = -1
+    if instance._stats_total is not None:
+        deltas[stats.revenue_key(timezone.localdate(instance.datetime))] = -instance._stats_total
+    stats.bump(deltas)
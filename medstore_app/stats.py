@@ -0,0 +1,135 @@
+"""
+Incrementally maintained dashboard counters.
+
+Every counter is a ``StoreStat`` row. Model signals (and the order service,
+for stock it changes with bulk UPDATEs) apply deltas as they happen, so the
+admin dashboard reads everything it shows in one query instead of running
+COUNT(*) scans. ``manage.py rebuild_stats`` recomputes the rows from the
+source tables and reports any drift.
+
+Keys:
+    users, medicines, orders      row counts
+    orders:status:<status>        orders per status
+    revenue:<YYYY-MM-DD>          order totals per day (TIME_ZONE)
+    low_stock                     medicines with stock <= MEDSTORE_LOW_STOCK_THRESHOLD
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import StoreStat, Medicine
+
+STATUS_PREFIX = 'orders:status:'
+REVENUE_PREFIX = 'revenue:'
+
+
+def status_key(status):
+    return STATUS_PREFIX + status
+
+
+def revenue_key(day):
+    return REVENUE_PREFIX + day.isoformat()
+
+
+def is_low(stock):
+    return stock is not None and stock <= settings.MEDSTORE_LOW_STOCK_THRESHOLD
+
+
+def bump(deltas):
+    """Add ``{key: delta}`` to the counters, creating missing rows, in one upsert call."""
+    rows = [(key, delta) for key, delta in deltas.items() if delta]
+    if not rows:
+        return
+    table = connection.ops.quote_name(StoreStat._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} ("key", "value") VALUES (%s, %s) '
+            f'ON CONFLICT ("key") DO UPDATE SET "value" = {table}."value" + excluded."value"',
+            rows,
+        )
+
+
+def _dashboard_rows(today):
+    return StoreStat.objects.filter(
+        Q(key__in=['users', 'medicines', 'orders', 'low_stock', today])
+        | Q(key__startswith=STATUS_PREFIX)
+    ).values_list('key', 'value')
+
+
+def dashboard_stats():
+    """Every dashboard counter in one query."""
+    today = revenue_key(timezone.localdate())
+    return _dashboard_context(dict(_dashboard_rows(today)), today)
+
+
+async def adashboard_stats():
+    today = revenue_key(timezone.localdate())
+    return _dashboard_context({key: value async for key, value in _dashboard_rows(today).aiterator()}, today)
+
+
+def _dashboard_context(rows, today):
+    return {
+        'total_users': int(rows.get('users', 0)),
+        'total_products': int(rows.get('medicines', 0)),
+        'total_orders': int(rows.get('orders', 0)),
+        'low_stock': int(rows.get('low_stock', 0)),
+        'revenue_today': rows.get(today, Decimal('0.00')),
+        'orders_by_status': {
+            key[len(STATUS_PREFIX):]: int(value)
+            for key, value in sorted(rows.items()) if key.startswith(STATUS_PREFIX) and value
+        },
+    }
+
+
+def expected_stats(User, Medicine, Order):
+    """
+    The counters recomputed from the source tables. Migration 0005 seeds
+    the same keys from its historical models; keep the two in step.
+    """
+    expected = {
+        'users': User.objects.count(),
+        'medicines': Medicine.objects.count(),
+        'orders': Order.objects.count(),
+        'low_stock': Medicine.objects.filter(stock__lte=settings.MEDSTORE_LOW_STOCK_THRESHOLD).count(),
+    }
+    for status, n in Order.objects.values_list('status').annotate(n=Count('id')).order_by():
+        expected[status_key(status)] = n
+    revenue = Order.objects.annotate(day=TruncDate('datetime')).values_list('day') \
+        .annotate(total=Sum('total_amount')).order_by()
+    for day, total in revenue:
+        expected[revenue_key(day)] = total
+    return {key: Decimal(value) for key, value in expected.items()}
+
+
+def stats_drift(expected):
+    """``{key: (stored, expected)}`` for every counter that disagrees."""
+    stored = dict(StoreStat.objects.values_list('key', 'value'))
+    drift = {}
+    for key in set(stored) | set(expected):
+        have, want = stored.get(key, Decimal(0)), expected.get(key, Decimal(0))
+        if have != want:
+            drift[key] = (have, want)
+    return drift
+
+
+def write_stats(expected, prune=True):
+    """Store ``expected`` as the counters; ``prune`` deletes every other key."""
+    if prune:
+        StoreStat.objects.exclude(key__in=list(expected)).delete()
+    StoreStat.objects.bulk_create(
+        [StoreStat(key=key, value=value) for key, value in expected.items()],
+        update_conflicts=True, unique_fields=['key'], update_fields=['value'],
+    )
+
+
+def refresh_catalog_counts():
+    """Recount medicines and low-stock medicines after bulk writes that bypass signals."""
+    counts = {
+        'medicines': Medicine.objects.count(),
+        'low_stock': Medicine.objects.filter(stock__lte=settings.MEDSTORE_LOW_STOCK_THRESHOLD).count(),
+    }
+    write_stats(counts, prune=False)
@@ -0,0 +1,62 @@
+"""
+Side effects deferred to the job queue (see jobs.py).
+
+Order placement and the contact form only enqueue these, so mail server
+latency and outages never reach the request. Each handler reloads what
+it needs by id and does nothing if the row is gone.
+
+A notification is sent first and ``notified_at`` is stamped only after
+the mail server accepted it, so a failure or a crash anywhere before the
+stamp leaves the job to be retried, never a notification lost. The job's
+lease keeps any other worker from running it meanwhile. The one
+remaining duplicate, a crash between sending and stamping, resends a
+mail with the same ``Message-ID`` (derived from the row), which mail
+clients collapse into one. The reads and the stamp run in autocommit: no
+transaction, and so no SQLite write lock, is held while the mail server
+is slow.
+"""
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.mail.utils import DNS_NAME
+from django.utils import timezone
+
+from .jobs import handler
+from .models import ContactMessage, Order
+
+
+def message_id(model, pk):
+    return f'<{model._meta.model_name}-{pk}@{DNS_NAME}>'
+
+
+def _notify(model, pk, subject, body, to):
+    """Mail ``body`` about row ``pk`` of ``model``, then record that it went out."""
+    EmailMessage(
+        subject, body, settings.DEFAULT_FROM_EMAIL, to, headers={'Message-ID': message_id(model, pk)},
+    ).send()
+    model.objects.filter(id=pk, notified_at__isnull=True).update(notified_at=timezone.now())
+
+
+@handler('order_placed')
+def order_placed(order_id):
+    order = Order.objects.filter(id=order_id).prefetch_related('items').first()
+    if order is None or not order.customer_email or order.notified_at:
+        return
+    lines = '\n'.join(f'  {item.medicine_name} x {item.quantity} @ {item.price}' for item in order.items.all())
+    _notify(
+        Order, order.id, f'MedStore order #{order.id} confirmed',
+        f'Hi {order.customer_name},\n\nWe have received your order #{order.id}:\n\n{lines}\n\n'
+        f'Total: {order.total_amount}\n',
+        [order.customer_email],
+    )
+
+
+@handler('contact_received')
+def contact_received(message_id):
+    msg = ContactMessage.objects.filter(id=message_id).first()
+    if msg is None or msg.notified_at:
+        return
+    _notify(
+        ContactMessage, msg.id, f'New contact message from {msg.name}',
+        f'{msg.name} <{msg.email}> wrote:\n\n{msg.message}\n',
+        [settings.MEDSTORE_ADMIN_NOTIFY_EMAIL],
+    )
@@ -1,3 +1,1468 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command, CommandError
+from django.db import connection, transaction, OperationalError
+from django.db.migrations.state import ProjectState
+from django.db.models import F
+from django.db.utils import ConnectionHandler
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from medstore_pro.db import REPLICA, PrimaryReplicaRouter, sqlite_databases
+
+from . import metrics, rollups, viewcache
+from .bench import async_views, seed_store, compare_to_baseline
+from .catalog import CSRF_PLACEHOLDER, card_key, catalog_version, get_cards, page_ids, parse_page_args
+from .images import pending_images, process_images
+from .importer import CatalogImporter
+from .history import decode_cursor
+from .inbox import inbox_page, mark_read, archive_messages, archived_rows
+from .jobs import HANDLERS, enqueue, claim, run_jobs, retry_delay, queue_stats
+from .inventory import HoldRejected, set_holds, release_expired, low_stock
+from .models import (
+    User, Category, CatalogVersion, Medicine, ProductImage, Order, OrderItem, StockHold, ContactMessage, Job,
+    DailySales, DailyMedicineSales, DailyCategorySales, MessageArchive,
+)
+from .orders import place_order, checkout, placement_stats, OrderRejected, OutOfStock
+from .reports import order_report
+from .search import search_medicines
+from .stats import dashboard_stats, expected_stats, stats_drift, write_stats
+from .tasks import message_id
+from .users import USER_COOKIE, set_user_cookie, sign_user_token, user_cache, find_user, signup_conflict
+from .viewcache import view_cache_stats
+from .views import ADMIN_EMAIL
+
+_seq = itertools.count()
+
+
+def login_as(client, user):
+    client.cookies[USER_COOKIE] = sign_user_token(user)
+
+
+def seed_orders(count, items_per_order=3):
+    """Bulk-create ``count`` orders with a few lines each, spread over a handful of users."""
+    batch = next(_seq)
+    cat = Category.objects.create(name='General')
+    meds = Medicine.objects.bulk_create([
+        Medicine(name=f'Med {i}', price=Decimal('10.00'), stock=100, category=cat) for i in range(5)
+    ])
+    users = User.objects.bulk_create([
+        User(username=f'user{batch}-{i}', email=f'user{batch}-{i}@example.com', password='x')
+        for i in range(5)
+    ])
+    orders = Order.objects.bulk_create([
+        Order(user=users[i % len(users)], total_amount=Decimal('30.00'), status='placed',
+              customer_name=users[i % len(users)].username, customer_email=users[i % len(users)].email)
+        for i in range(count)
+    ])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=o, medicine=meds[j % len(meds)], quantity=1, price=Decimal('10.00'),
+                  medicine_name=meds[j % len(meds)].name, category_name=cat.name)
+        for o in orders for j in range(items_per_order)
+    ])
+    return orders
+
+
+class OrderReportQueryCountTests(TestCase):
+
+    def walk(self, orders):
+        # Touch everything the admin template touches.
+        for o in orders:
+            str(o), o.customer_email
+            for it in o.items.all():
+                str(it), it.category_name
+
+    def assert_constant_queries(self, count):
+        seed_orders(count)
+        with self.assertNumQueries(2):
+            orders, _ = order_report(size=None)
+            self.walk(orders)
+        self.assertEqual(len(orders), count)
+
+    def test_ten_orders(self):
+        self.assert_constant_queries(10)
+
+    def test_ten_thousand_orders(self):
+        self.assert_constant_queries(10000)
+
+    def test_report_reads_snapshots_without_joins(self):
+        seed_orders(3)
+        with CaptureQueriesContext(connection) as captured:
+            order_report(size=None)
+        self.assertEqual(len(captured), 2)
+        self.assertFalse([q['sql'] for q in captured if 'JOIN' in q['sql']])
+
+    def test_admin_page_query_count_does_not_grow(self):
+        self.client.cookies['admin_email'] = ADMIN_EMAIL
+        url = reverse('medstore_app:admin_orders')
+        seed_orders(10)
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        seed_orders(200)
+        with self.assertNumQueries(2):
+            resp = self.client.get(url)
+        self.assertEqual(len(resp.context['orders']), 50)
+        self.assertIsNotNone(resp.context['next_cursor'])
+
+    def test_cursor_and_filters(self):
+        orders = seed_orders(7)
+        Order.objects.filter(id=orders[0].id).update(status='delivered')
+        page, cursor = order_report(size=3)
+        self.assertEqual([o.id for o in page], [o.id for o in reversed(orders)][:3])
+        page, _ = order_report(before=cursor, size=3)
+        self.assertEqual(page[0].id, cursor - 1)
+        delivered, _ = order_report(status='delivered', size=None)
+        self.assertEqual([o.id for o in delivered], [orders[0].id])
+
+
+class CatalogPagingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.meds = Medicine.objects.bulk_create([
+            Medicine(name=f'Med {i}', price=Decimal('1.00'), stock=5) for i in range(5)
+        ])
+        self.ids = [m.id for m in self.meds]
+
+    def test_cursor_walks_first_middle_and_last_page(self):
+        self.assertEqual(page_ids(0, 2), (self.ids[:2], self.ids[1]))
+        self.assertEqual(page_ids(self.ids[1], 2), (self.ids[2:4], self.ids[3]))
+        self.assertEqual(page_ids(self.ids[3], 2), (self.ids[4:], None))
+        # A page that ends exactly on the last medicine has no next page.
+        self.assertEqual(page_ids(self.ids[2], 2), (self.ids[3:], None))
+        self.assertEqual(page_ids(self.ids[-1], 2), ([], None))
+
+    def test_bad_page_args_are_clamped(self):
+        default, most = settings.MEDSTORE_CATALOG_PAGE_SIZE, settings.MEDSTORE_CATALOG_MAX_PAGE_SIZE
+        self.assertEqual(parse_page_args({'after': 'x', 'size': 'big'}), (0, default))
+        self.assertEqual(parse_page_args({'after': '-5', 'size': '0'}), (0, 1))
+        self.assertEqual(parse_page_args({'after': '7', 'size': '100000'}), (7, most))
+        resp = self.client.get(reverse('medstore_app:home'), {'after': 'x', 'size': '-1'})
+        self.assertEqual(len(resp.context['cards']), 1)
+
+    def test_saving_a_medicine_moves_the_cards_to_a_new_version(self):
+        version = catalog_version()
+        get_cards(self.ids, version)
+        with self.assertNumQueries(0):
+            get_cards(self.ids, version)
+        med = self.meds[2]
+        med.name = 'Renamed'
+        med.save()
+        self.assertGreater(catalog_version(), version)
+        self.assertIn('Renamed', get_cards([med.id], catalog_version())[0])
+
+    def test_csrf_placeholder_is_filled_per_request(self):
+        pages = []
+        for _ in range(2):
+            client = Client()
+            content = client.get(reverse('medstore_app:home')).content.decode()
+            self.assertNotIn(CSRF_PLACEHOLDER, content)
+            pages.append(set(re.findall(r'name="csrfmiddlewaretoken" value="([^"]+)"', content)))
+        # Every card on a page carries that request's token, and the cache keeps only the placeholder.
+        self.assertEqual([len(tokens) for tokens in pages], [1, 1])
+        self.assertNotEqual(pages[0], pages[1])
+        self.assertIn(CSRF_PLACEHOLDER, cache.get(card_key(self.ids[0], catalog_version())))
+
+
+class OrderPlacementTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='buyer', email='buyer@example.com', password='x')
+        self.med = Medicine.objects.create(name='Aspirin', price=Decimal('2.50'), stock=5)
+
+    def test_places_order_and_decrements_stock(self):
+        order = place_order(self.user, self.med.id, 3)
+        self.med.refresh_from_db()
+        self.assertEqual(self.med.stock, 2)
+        self.assertEqual(order.total_amount, Decimal('7.50'))
+        self.assertEqual(order.items.get().quantity, 3)
+
+    def test_order_snapshots_customer_and_medicine(self):
+        self.med.category = Category.objects.create(name='Painkillers')
+        self.med.save()
+        order = place_order(self.user, self.med.id, 1)
+        Medicine.objects.filter(id=self.med.id).update(name='Renamed')
+        User.objects.filter(id=self.user.id).update(username='renamed')
+        order = Order.objects.get(id=order.id)
+        item = order.items.get()
+        self.assertEqual((order.customer_name, order.customer_email), ('buyer', 'buyer@example.com'))
+        self.assertEqual((item.medicine_name, item.category_name), ('Aspirin', 'Painkillers'))
+        self.assertEqual(str(order), f'Order {order.id} by buyer')
+
+    def test_rejects_when_stock_is_short(self):
+        with self.assertRaises(OutOfStock):
+            place_order(self.user, self.med.id, 6)
+        self.med.refresh_from_db()
+        self.assertEqual(self.med.stock, 5)
+        self.assertFalse(Order.objects.exists())
+
+
+class CheckoutTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='buyer', email='buyer@example.com', password='x')
+        self.meds = Medicine.objects.bulk_create([
+            Medicine(name=f'Med {i}', price=Decimal('3.00'), stock=10) for i in range(25)
+        ])
+
+    def test_statement_count_does_not_grow_with_lines(self):
+        with self.assertNumQueries(13):
+            checkout(self.user, {self.meds[0].id: 1})
+        with self.assertNumQueries(13):
+            order = checkout(self.user, {m.id: 2 for m in self.meds})
+        self.assertEqual(order.total_amount, Decimal('150.00'))
+        self.assertEqual(order.items.count(), 25)
+        self.assertEqual(Medicine.objects.get(id=self.meds[0].id).stock, 7)
+        self.assertEqual(Medicine.objects.get(id=self.meds[1].id).stock, 8)
+
+    def test_short_line_rejects_whole_order(self):
+        lines = {self.meds[0].id: 2, self.meds[1].id: 11}
+        with self.assertRaises(OutOfStock):
+            checkout(self.user, lines)
+        self.assertEqual(Medicine.objects.get(id=self.meds[0].id).stock, 10)
+        self.assertFalse(Order.objects.exists())
+
+    def test_cart_checkout_view(self):
+        login_as(self.client, self.user)
+        self.client.post(reverse('medstore_app:cart_add', args=[self.meds[0].id]), {'quantity': 2})
+        self.client.post(reverse('medstore_app:cart_add', args=[self.meds[1].id]), {'quantity': 1})
+        self.client.post(reverse('medstore_app:cart_add', args=[self.meds[0].id]), {'quantity': 1})
+        resp = self.client.get(reverse('medstore_app:cart'))
+        self.assertEqual(resp.context['total'], Decimal('12.00'))
+        self.client.post(reverse('medstore_app:cart_checkout'))
+        order = Order.objects.get()
+        self.assertEqual(
+            dict(order.items.values_list('medicine_id', 'quantity')),
+            {self.meds[0].id: 3, self.meds[1].id: 1},
+        )
+        self.assertEqual(self.client.get(reverse('medstore_app:cart')).context['rows'], [])
+
+
+class CurrentUserMiddlewareTests(TestCase):
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create(username='ann', email='ann@example.com', password='x')
+
+    def test_resolves_user_from_cache_after_first_request(self):
+        login_as(self.client, self.user)
+        url = reverse('medstore_app:about')
+        with self.assertNumQueries(1):
+            resp = self.client.get(url)
+        self.assertEqual(resp.wsgi_request.medstore_user, self.user)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        self.assertEqual((user_cache.hits, user_cache.misses), (1, 1))
+
+    def test_tampered_token_is_anonymous(self):
+        self.client.cookies[USER_COOKIE] = f'{self.user.id}:forged'
+        resp = self.client.get(reverse('medstore_app:about'))
+        self.assertIsNone(resp.wsgi_request.medstore_user)
+
+    def test_login_cookie_is_read_back(self):
+        response = HttpResponse()
+        set_user_cookie(response, self.user)
+        self.assertTrue(response.cookies[USER_COOKIE]['httponly'])
+        self.client.cookies[USER_COOKIE] = response.cookies[USER_COOKIE].value
+        resp = self.client.get(reverse('medstore_app:about'))
+        self.assertEqual(resp.wsgi_request.medstore_user, self.user)
+
+    def test_user_save_invalidates_entry(self):
+        login_as(self.client, self.user)
+        self.client.get(reverse('medstore_app:about'))
+        self.user.username = 'anne'
+        self.user.save()
+        resp = self.client.get(reverse('medstore_app:about'))
+        self.assertEqual(resp.wsgi_request.medstore_user.username, 'anne')
+
+    @override_settings(DEBUG=True)
+    def test_asgi_stack_is_not_adapted(self):
+        # Django logs every sync/async adaptation it has to make in debug mode.
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    async def test_async_request_resolves_user(self):
+        login_as(self.async_client, self.user)
+        resp = await self.async_client.get(reverse('medstore_app:about'))
+        self.assertEqual(resp.asgi_request.medstore_user, self.user)
+        resp = await self.async_client.get(reverse('medstore_app:about'))
+        self.assertEqual(resp.asgi_request.medstore_user, self.user)
+        self.assertEqual((user_cache.hits, user_cache.misses), (1, 1))
+
+
+class IdentifierLookupTests(TestCase):
+
+    def setUp(self):
+        self.ann = User.objects.create(username='ann', email='ann@example.com', mobile='9876543210', password='x')
+        # Legacy account whose username looks like someone else's email.
+        self.bob = User.objects.create(username='ann@example.org', email='bob@example.com', password='x')
+
+    def test_single_query_for_each_identifier_type(self):
+        for identifier in ('ann@example.com', 'ann', '9876543210'):
+            with self.assertNumQueries(1):
+                self.assertEqual(find_user(identifier), self.ann)
+        self.assertEqual(find_user('ann@example.org'), self.bob)
+        self.assertIsNone(find_user('nobody'))
+
+    def test_signup_conflict_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(signup_conflict('new@example.com', 'ann', '111111'), 'username')
+        self.assertEqual(signup_conflict('ann@example.com', 'ann', '9876543210'), 'email')
+        self.assertEqual(signup_conflict('new@example.com', 'new', '9876543210'), 'mobile')
+        self.assertIsNone(signup_conflict('new@example.com', 'new', '111111'))
+
+
+@override_settings(MEDSTORE_LOW_STOCK_THRESHOLD=5)
+class DashboardStatsTests(TestCase):
+
+    def assert_no_drift(self):
+        self.assertEqual(stats_drift(expected_stats(User, Medicine, Order)), {})
+
+    def test_counters_follow_writes(self):
+        user = User.objects.create(username='ann', email='ann@example.com', password='x')
+        a = Medicine.objects.create(name='A', price=Decimal('4.00'), stock=7)
+        b = Medicine.objects.create(name='B', price=Decimal('1.00'), stock=2)
+        self.assert_no_drift()
+
+        checkout(user, {a.id: 3, b.id: 1})
+        order = place_order(user, a.id, 1)
+        self.assert_no_drift()
+
+        order.status = 'delivered'
+        order.save()
+        a.stock = 50
+        a.save()
+        self.assert_no_drift()
+
+        b.delete()
+        order.delete()
+        user.delete()
+        self.assert_no_drift()
+
+    def test_dashboard_reads_counters_in_one_query(self):
+        user = User.objects.create(username='ann', email='ann@example.com', password='x')
+        med = Medicine.objects.create(name='A', price=Decimal('4.00'), stock=6)
+        place_order(user, med.id, 2)
+        with self.assertNumQueries(1):
+            dash = dashboard_stats()
+        self.assertEqual(
+            (dash['total_users'], dash['total_products'], dash['total_orders'], dash['low_stock']),
+            (1, 1, 1, 1),
+        )
+        self.assertEqual(dash['revenue_today'], Decimal('8.00'))
+        self.assertEqual(dash['orders_by_status'], {'placed': 1})
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.pain = Category.objects.create(name='Painkillers')
+        self.vit = Category.objects.create(name='Vitamins')
+        self.aspirin = Medicine.objects.create(name='Aspirin 500mg', description='For headache', category=self.pain)
+        self.vitc = Medicine.objects.create(name='Vitamin C', description='Not aspirin', category=self.vit)
+
+    def names(self, *args, **kwargs):
+        return [r['name'] for r in search_medicines(*args, **kwargs)]
+
+    def test_prefix_match_ranks_name_first(self):
+        self.assertEqual(self.names('asp'), ['Aspirin 500mg', 'Vitamin C'])
+        self.assertEqual(self.names('asp', category_id=self.vit.id), ['Vitamin C'])
+        self.assertEqual(self.names('painkil'), ['Aspirin 500mg'])
+        self.assertEqual(self.names('"*('), [])
+
+    def test_index_follows_writes(self):
+        self.aspirin.name = 'Disprin'
+        self.aspirin.save()
+        self.pain.name = 'Analgesics'
+        self.pain.save()
+        self.assertEqual(self.names('dispr'), ['Disprin'])
+        self.assertEqual(self.names('analg'), ['Disprin'])
+        self.vitc.delete()
+        self.assertEqual(self.names('vitamin'), [])
+
+    def test_search_endpoint(self):
+        resp = self.client.get(reverse('medstore_app:search'), {'q': 'vita'})
+        self.assertEqual(resp.json()['results'], [
+            {'id': self.vitc.id, 'name': 'Vitamin C', 'price': '0.00', 'category': 'Vitamins'},
+        ])
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.client.cookies['admin_email'] = ADMIN_EMAIL
+
+    def export(self, **params):
+        resp = self.client.get(reverse('medstore_app:admin_export_orders'), params)
+        return resp, b''.join(resp.streaming_content).decode()
+
+    def test_csv_and_jsonl_flatten_order_lines(self):
+        orders = seed_orders(2, items_per_order=2)
+        Order.objects.filter(id=orders[1].id).update(status='delivered')
+        resp, body = self.export(format='csv')
+        self.assertEqual(resp['Content-Type'], 'text/csv')
+        lines = body.splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['order_id', 'datetime', 'status'])
+        self.assertEqual(len(lines), 5)
+        _, body = self.export(format='jsonl', status='delivered')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual({r['order_id'] for r in rows}, {orders[1].id})
+        self.assertEqual(rows[0]['medicine'], 'Med 0')
+
+    def peak_memory(self, orders):
+        seed_orders(orders)
+        tracemalloc.start()
+        try:
+            resp = self.client.get(reverse('medstore_app:admin_export_orders'), {'format': 'jsonl'})
+            lines = sum(chunk.count(b'\n') for chunk in resp.streaming_content)
+            return lines, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_memory_stays_flat_as_export_grows(self):
+        small_lines, small_peak = self.peak_memory(1500)
+        big_lines, big_peak = self.peak_memory(13500)
+        self.assertEqual((small_lines, big_lines), (4500, 45000))
+        # Ten times the rows, (almost) the same peak.
+        self.assertLess(big_peak, small_peak * 1.25)
+
+
+class CatalogImportTests(TestCase):
+
+    def import_file(self, text, suffix='.csv', **options):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w') as fh:
+            fh.write(text)
+        call_command('import_catalog', path, stdout=io.StringIO(), **options)
+
+    def test_csv_upserts_on_sku_and_creates_categories(self):
+        pain = Category.objects.create(name='Painkillers')
+        self.import_file(
+            'sku,name,price,stock,category\n'
+            'A1,Aspirin,5.50,10,Painkillers\n'
+            'B2,Vitamin C,3,0,Vitamins\n'
+            'C3,,1,1,Vitamins\n'
+            'D4,Bad price,abc,1,\n'
+        )
+        self.assertEqual(Medicine.objects.count(), 2)
+        self.assertEqual(Medicine.objects.get(sku='A1').category, pain)
+        self.assertEqual(Category.objects.filter(name='Vitamins').count(), 1)
+
+        self.import_file('{"sku": "A1", "name": "Aspirin 500mg", "price": "6", "stock": 2}\nnot json\n',
+                         suffix='.jsonl')
+        med = Medicine.objects.get(sku='A1')
+        # Fields the row leaves out (here the category) are kept.
+        self.assertEqual((med.name, med.price, med.stock, med.category), ('Aspirin 500mg', Decimal('6.00'), 2, pain))
+        self.assertEqual(Medicine.objects.count(), 2)
+
+        # A stock-only feed touches nothing but stock (and the required name).
+        Medicine.objects.filter(sku='B2').update(description='Chewable')
+        self.import_file('sku,name,stock\nA1,Aspirin 500mg,40\nB2,Vitamin C,7\n')
+        self.assertEqual(
+            list(Medicine.objects.order_by('sku').values_list('sku', 'price', 'stock', 'description', 'category__name')),
+            [('A1', Decimal('6.00'), 40, None, 'Painkillers'), ('B2', Decimal('3.00'), 7, 'Chewable', 'Vitamins')],
+        )
+        self.import_file('sku,name,category\nA1,Aspirin 500mg,\n')
+        self.assertIsNone(Medicine.objects.get(sku='A1').category)
+        # Bulk writes skip signals, so the importer refreshes what depends on them.
+        self.assertEqual([r['name'] for r in search_medicines('aspir')], ['Aspirin 500mg'])
+        self.assertEqual(dashboard_stats()['total_products'], 2)
+
+    def test_rejects_are_reported_without_aborting(self):
+        rejected = []
+        rows = [(1, {'sku': 'X', 'name': 'Ok'}), (2, {'sku': 'Y', 'name': 'Neg', 'stock': '-1'}),
+                (3, {'sku': 'Z', 'name': 'Other', 'category': 'Nope'})]
+        importer = CatalogImporter(batch_size=2, create_categories=False,
+                                   on_reject=lambda n, reason: rejected.append(n)).run(rows)
+        self.assertEqual((importer.imported, importer.rejected), (1, 2))
+        self.assertEqual(rejected, [2, 3])
+
+    def test_long_category_names_are_rejected_not_truncated(self):
+        rejected = []
+        prefix = 'C' * 100
+        rows = [(1, {'sku': 'L1', 'name': 'One', 'category': prefix + 'a'}),
+                (2, {'sku': 'L2', 'name': 'Two', 'category': prefix + 'b'}),
+                (3, {'sku': 'L3', 'name': 'Three', 'category': prefix})]
+        importer = CatalogImporter(on_reject=lambda n, reason: rejected.append((n, reason))).run(rows)
+        self.assertEqual(rejected, [(1, 'category longer than 100 characters'),
+                                    (2, 'category longer than 100 characters')])
+        self.assertEqual(importer.imported, 1)
+        self.assertEqual(list(Category.objects.values_list('name', flat=True)), [prefix])
+
+
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        metrics.clear()
+
+    def test_view_histograms_are_exposed_to_admins_only(self):
+        seed_orders(3)
+        self.client.get(reverse('medstore_app:home'))
+        resp = self.client.get(reverse('medstore_app:admin_metrics'))
+        self.assertEqual(resp.status_code, 302)
+        self.client.cookies['admin_email'] = ADMIN_EMAIL
+        body = self.client.get(reverse('medstore_app:admin_metrics')).content.decode()
+        self.assertIn('medstore_request_seconds_count{view="medstore_app:home"} 1', body)
+        self.assertIn('medstore_request_queries_bucket{view="medstore_app:home",le="+Inf"} 1', body)
+        self.assertIn('medstore_response_bytes_count{view="medstore_app:home"} 1', body)
+        self.assertIn('medstore_user_cache{stat="hits"}', body)
+
+    @override_settings(MEDSTORE_SLOW_REQUEST_SECONDS=0)
+    def test_slow_requests_log_repeated_sql(self):
+        cat = Category.objects.create(name='General')
+        with self.assertLogs('medstore.slow_requests', 'WARNING') as logs:
+            self.client.get(reverse('medstore_app:search'), {'q': 'x', 'category': cat.id})
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry['view'], entry['status']), ('medstore_app:search', 200))
+        self.assertGreaterEqual(entry['queries'], 1)
+        self.assertEqual(entry['duplicate_sql'], [])
+
+        self.client.cookies['admin_email'] = ADMIN_EMAIL
+        with self.assertLogs('medstore.slow_requests', 'WARNING') as logs:
+            self.client.get(reverse('medstore_app:admin_dashboard'))
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertGreater(entry['template_ms'], 0)
+
+    def test_same_statement_with_other_params_counts_as_duplicate(self):
+        recorded = metrics.RequestMetrics()
+        token = metrics._current.set(recorded)
+        try:
+            for med_id in (1, 2, 3):
+                Medicine.objects.filter(id=med_id).exists()
+        finally:
+            metrics._current.reset(token)
+        self.assertEqual(recorded.queries, 3)
+        self.assertEqual([d['count'] for d in recorded.duplicates()], [3])
+
+
+class BenchmarkSuiteTests(TestCase):
+
+    @override_settings(PASSWORD_HASHERS=['medstore_app.tests.FastPBKDF2PasswordHasher'])
+    def test_seed_store_is_consistent(self):
+        seed_store(users=5, categories=2, medicines=10, orders=30, items_per_order=2)
+        self.assertEqual(Order.objects.count(), 30)
+        self.assertEqual(OrderItem.objects.count(), 60)
+        self.assertEqual(stats_drift(expected_stats(User, Medicine, Order)), {})
+        self.assertEqual(find_user('user3').email, 'user3@example.com')
+
+    def test_compare_to_baseline(self):
+        baseline = {'home': {'p50': 10.0, 'p99': 20.0, 'queries': 2}, 'load': {'rps': 100.0}}
+        ok = {'home': {'p50': 14.0, 'p99': 90.0, 'queries': 2}, 'load': {'rps': 60.0}, 'new': {'p50': 1.0}}
+        self.assertEqual(compare_to_baseline(baseline, ok, tolerance=0.5), [])
+        worse = {'home': {'p50': 16.0, 'queries': 3}, 'load': {'rps': 30.0}}
+        self.assertEqual(compare_to_baseline(baseline, worse, tolerance=0.5), [
+            'home.p50: 16 vs baseline 10', 'home.queries: 3 vs baseline 2', 'load.rps: 30 vs baseline 100',
+        ])
+        self.assertEqual(compare_to_baseline(baseline, worse, tolerance=0.6, query_tolerance=1), [
+            'load.rps: 30 vs baseline 100',
+        ])
+
+    def test_run_benchmarks_exits_non_zero_on_regression(self):
+        from .management.commands.run_benchmarks import Command
+
+        def run(argv, results):
+            with mock.patch.object(Command, 'measure', return_value=results), \
+                    mock.patch('sys.stdout', new_callable=io.StringIO), \
+                    mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+                try:
+                    Command().run_from_argv(['manage.py', 'run_benchmarks'] + argv)
+                except SystemExit as exc:
+                    return exc.code, stderr.getvalue()
+            return 0, ''
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'baseline.json')
+            self.assertEqual(run(['--baseline', path], {})[0], 1)
+            self.assertEqual(run(['--baseline', path, '--update-baseline'], {'home': {'p50': 1.0}}), (0, ''))
+            self.assertEqual(run(['--baseline', path], {'home': {'p50': 1.2}}), (0, ''))
+            code, err = run(['--baseline', path], {'home': {'p50': 5.0}})
+        self.assertEqual(code, 1)
+        self.assertIn('home.p50: 5 vs baseline 1', err)
+
+
+class OrderHistoryTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='buyer', email='buyer@example.com', password='x')
+        self.other = User.objects.create(username='other', email='other@example.com', password='x')
+        med = Medicine.objects.create(name='Aspirin', price=Decimal('2.00'), stock=10)
+        orders = Order.objects.bulk_create([
+            Order(user=self.user if i % 3 else self.other, total_amount=Decimal('2.00'), status='placed')
+            for i in range(60)
+        ])
+        # Same timestamp for many orders: the cursor must still split them by id.
+        Order.objects.filter(id__in=[o.id for o in orders[:30]]).update(datetime=orders[0].datetime)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=o, medicine=med, quantity=1, price=Decimal('2.00'), medicine_name='Aspirin')
+            for o in orders
+        ])
+        login_as(self.client, self.user)
+
+    def test_pages_cover_history_once_in_constant_queries(self):
+        url = reverse('medstore_app:my_orders')
+        self.client.get(url)  # warm the customer cache
+        seen, params = [], {'size': 7}
+        while True:
+            with self.assertNumQueries(2):
+                resp = self.client.get(url, params)
+            seen += [o.id for o in resp.context['orders']]
+            if not resp.context['next_cursor']:
+                break
+            params['before'] = resp.context['next_cursor']
+        expected = list(Order.objects.filter(user=self.user).order_by('-datetime', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertContains(resp, 'Aspirin')
+
+    def test_history_query_uses_the_index(self):
+        qs = Order.objects.filter(user=self.user).order_by('-datetime', '-id')[:20]
+        plan = qs.explain()
+        self.assertIn('order_user_datetime_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_requires_login(self):
+        self.client.cookies.clear()
+        resp = self.client.get(reverse('medstore_app:my_orders'))
+        self.assertRedirects(resp, reverse('medstore_app:login'))
+
+
+class InventoryHoldTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='buyer', email='buyer@example.com', password='x')
+        self.meds = Medicine.objects.bulk_create([
+            Medicine(name=f'Med {i}', price=Decimal('1.00'), stock=5) for i in range(50)
+        ])
+        self.med = self.meds[0]
+
+    def reserved(self, med):
+        return Medicine.objects.get(id=med.id).reserved
+
+    def test_holds_limit_what_others_can_take(self):
+        set_holds('cart-a', {self.med.id: 3})
+        with self.assertRaises(HoldRejected):
+            set_holds('cart-b', {self.med.id: 3})
+        set_holds('cart-b', {self.med.id: 2})
+        set_holds('cart-a', {self.med.id: 1})
+        self.assertEqual(self.reserved(self.med), 3)
+        with self.assertRaises(OutOfStock):
+            place_order(self.user, self.med.id, 3)
+        set_holds('cart-a', {self.med.id: 0})
+        self.assertEqual(self.reserved(self.med), 2)
+        self.assertFalse(StockHold.objects.filter(holder='cart-a').exists())
+
+    def test_checkout_consumes_own_holds(self):
+        set_holds('cart-a', {self.med.id: 4})
+        with self.assertRaises(OutOfStock):
+            place_order(self.user, self.med.id, 4)
+        checkout(self.user, {self.med.id: 4}, holder='cart-a')
+        med = Medicine.objects.get(id=self.med.id)
+        self.assertEqual((med.stock, med.reserved), (1, 0))
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_expired_holds_are_swept_in_constant_queries(self):
+        Medicine.objects.update(stock=50)
+        for n in range(20):
+            set_holds(f'cart-{n}', {m.id: 1 for m in self.meds[:10 + n]})
+        StockHold.objects.filter(holder__in=['cart-0', 'cart-1']).update(expires_at=timezone.now())
+        # Savepoint, lock, one UPDATE of reserved, one DELETE, release.
+        with self.assertNumQueries(5):
+            released = release_expired()
+        self.assertEqual(released, 10 + 11)
+        self.assertEqual(self.reserved(self.meds[0]), 18)
+        self.assertEqual(self.reserved(self.meds[10]), 18)
+        self.assertEqual(self.reserved(self.meds[11]), 18)
+        self.assertEqual(self.reserved(self.meds[12]), 17)
+
+    def test_expired_holds_stop_counting_without_the_sweep(self):
+        set_holds('cart-a', {self.med.id: 5})
+        set_holds('cart-b', {self.meds[1].id: 5})
+        StockHold.objects.update(expires_at=timezone.now())
+        set_holds('cart-c', {self.med.id: 2})
+        checkout(self.user, {self.meds[1].id: 5})
+        self.assertEqual(list(StockHold.objects.values_list('holder', flat=True)), ['cart-c'])
+        self.assertEqual((self.reserved(self.med), self.reserved(self.meds[1])), (2, 0))
+
+    def test_cart_views_hold_and_release(self):
+        self.client.post(reverse('medstore_app:cart_add', args=[self.med.id]), {'quantity': 4})
+        self.assertEqual(self.reserved(self.med), 4)
+        resp = self.client.post(reverse('medstore_app:cart_add', args=[self.med.id]), {'quantity': 2}, follow=True)
+        self.assertContains(resp, 'Not enough stock available.')
+        self.assertEqual(self.reserved(self.med), 4)
+        self.client.post(reverse('medstore_app:cart_update', args=[self.med.id]), {'quantity': 1})
+        self.assertEqual(self.reserved(self.med), 1)
+        login_as(self.client, self.user)
+        self.client.post(reverse('medstore_app:cart_checkout'))
+        med = Medicine.objects.get(id=self.med.id)
+        self.assertEqual((med.stock, med.reserved), (4, 0))
+
+    def test_order_now_may_take_units_held_by_own_cart(self):
+        self.client.post(reverse('medstore_app:cart_add', args=[self.med.id]), {'quantity': 5})
+        set_holds('cart-b', {self.meds[1].id: 5})
+        login_as(self.client, self.user)
+        resp = self.client.post(reverse('medstore_app:create_order', args=[self.med.id]), {'quantity': 5}, follow=True)
+        self.assertContains(resp, 'Order placed')
+        med = Medicine.objects.get(id=self.med.id)
+        self.assertEqual((med.stock, med.reserved), (0, 0))
+        # Somebody else's hold still blocks.
+        resp = self.client.post(reverse('medstore_app:create_order', args=[self.meds[1].id]), {'quantity': 1}, follow=True)
+        self.assertContains(resp, 'Not enough stock available.')
+        self.assertEqual(self.reserved(self.meds[1]), 5)
+
+    def test_low_stock_listing(self):
+        Medicine.objects.filter(id=self.meds[1].id).update(stock=50)
+        Medicine.objects.filter(id=self.meds[2].id).update(stock=0)
+        rows = low_stock(threshold=10, limit=3)
+        self.assertEqual([r['id'] for r in rows], [self.meds[2].id, self.meds[0].id, self.meds[3].id])
+        plan = Medicine.objects.filter(stock__lte=10).order_by('stock', 'id').explain()
+        self.assertIn('medicine_stock_idx', plan)
+        self.client.cookies['admin_email'] = ADMIN_EMAIL
+        self.assertContains(self.client.get(reverse('medstore_app:admin_low_stock')), 'Med 2')
+
+
+class AsyncReadViewTests(TestCase):
+
+    def setUp(self):
+        seed_orders(30)
+        ContactMessage.objects.bulk_create([
+            ContactMessage(name=f'Visitor {i}', email=f'v{i}@example.com', message='Hello') for i in range(8)
+        ])
+        write_stats(expected_stats(User, Medicine, Order))
+        self.client.cookies['admin_email'] = ADMIN_EMAIL
+        self.async_client.cookies['admin_email'] = ADMIN_EMAIL
+
+    async def get_both(self, name, query=''):
+        url = reverse(f'medstore_app:{name}') + query
+        with async_views(False):
+            sync = await sync_to_async(self.client.get)(url)
+        with async_views(True):
+            resp = await self.async_client.get(url)
+        self.assertEqual((sync.status_code, resp.status_code), (200, 200))
+        return sync.context, resp.context
+
+    async def test_async_views_render_what_the_sync_views_do(self):
+        sync, resp = await self.get_both('home', '?size=2')
+        self.assertEqual(len(resp['cards']), 2)
+        self.assertEqual(resp['next_cursor'], sync['next_cursor'])
+        sync, resp = await self.get_both('admin_dashboard')
+        for key in ('total_users', 'total_products', 'total_orders', 'orders_by_status'):
+            self.assertEqual(resp[key], sync[key])
+        self.assertEqual([m.id for m in resp['recent_messages']], [m.id for m in sync['recent_messages']])
+        sync, resp = await self.get_both('admin_messages')
+        self.assertEqual([m.id for m in resp['messages']], [m.id for m in sync['messages']])
+        sync, resp = await self.get_both('admin_orders', '?size=10')
+        self.assertEqual([o.id for o in resp['orders']], [o.id for o in sync['orders']])
+        self.assertEqual([len(o.items.all()) for o in resp['orders']], [3] * 10)
+        self.assertEqual(resp['next_cursor'], sync['next_cursor'])
+
+    async def test_async_admin_views_require_the_admin_cookie(self):
+        self.async_client.cookies.pop('admin_email')
+        with async_views(True):
+            resp = await self.async_client.get(reverse('medstore_app:admin_dashboard'))
+        self.assertRedirects(resp, reverse('medstore_app:admin_login'), fetch_redirect_response=False)
+
+
+class CatalogConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.med = Medicine.objects.create(name='Paracetamol', price=Decimal('2.00'), stock=10)
+        self.url = reverse('medstore_app:home')
+        self.client.get(self.url)  # picks up the CSRF cookie the page depends on
+
+    def test_revalidation_is_answered_with_one_query(self):
+        resp = self.client.get(self.url)
+        self.assertTrue(resp['ETag'].startswith('W/"'))
+        self.assertIn('Last-Modified', resp)
+        with self.assertNumQueries(1):
+            again = self.client.get(self.url, headers={'If-None-Match': resp['ETag']})
+        self.assertEqual(again.status_code, 304)
+        again = self.client.get(self.url, headers={'If-Modified-Since': resp['Last-Modified']})
+        self.assertEqual(again.status_code, 304)
+
+    def test_catalog_writes_change_the_version(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Pain relief')
+        resp = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+        etag = resp['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.med.price = Decimal('2.50')
+            self.med.save()
+        resp = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertContains(resp, '2.50')
+
+    def test_version_is_shared_between_processes(self):
+        etag = self.client.get(self.url)['ETag']
+        cache.clear()
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 304)
+        # A write committed by another worker moves the row this process reads.
+        CatalogVersion.objects.update(version=F('version') + 1)
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_validators_depend_on_the_visitor(self):
+        anonymous = self.client.get(self.url)
+        login_as(self.client, User.objects.create(username='ann', email='ann@example.com', password='x'))
+        resp = self.client.get(self.url, headers={'If-None-Match': anonymous['ETag']})
+        self.assertContains(resp, 'Welcome, <strong>ann</strong>')
+        self.assertNotIn('Last-Modified', resp)
+        again = self.client.get(self.url, headers={'If-None-Match': resp['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+    async def test_async_home_page_is_conditional(self):
+        await self.async_client.get(self.url)
+        etag = (await self.async_client.get(self.url))['ETag']
+        with async_views(True):
+            resp = await self.async_client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+
+
+class CatalogApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.cat = Category.objects.create(name='Vitamins')
+        self.meds = Medicine.objects.bulk_create([
+            Medicine(name=f'Vitamin {i}', price=Decimal('3.50'), category=self.cat if i % 2 else None)
+            for i in range(12)
+        ])
+        # The second upload of each medicine is still waiting to be processed.
+        ProductImage.objects.bulk_create([
+            ProductImage(
+                medicine=med, image_path=f'img/{med.id}-{n}.jpg', digest='' if n else f'{med.id:064x}',
+                variants={} if n else {
+                    'card': {'path': f'ab/{med.id}.jpg', 'width': 480, 'height': 480},
+                    'card_webp': {'path': f'ab/{med.id}.webp', 'width': 480, 'height': 480},
+                },
+            )
+            for med in self.meds[:6] for n in range(2)
+        ])
+        self.url = reverse('medstore_app:api_medicines')
+
+    def picture(self, med):
+        url = settings.MEDSTORE_IMAGE_URL + f'ab/{med.id}'
+        return {
+            'src': f'{url}.jpg', 'width': 480, 'height': 480,
+            'srcset': f'{url}.jpg 480w', 'webp_srcset': f'{url}.webp 480w',
+        }
+
+    def test_pages_with_sparse_fields_in_two_queries(self):
+        # Plus the catalog version read for the validators.
+        with self.assertNumQueries(3):
+            resp = self.client.get(self.url, {'fields': 'name,category,images', 'size': 5})
+        data = resp.json()
+        self.assertEqual(data['results'][1], {
+            'name': 'Vitamin 1', 'category': 'Vitamins',
+            'images': [self.picture(self.meds[1])],
+        })
+        self.assertEqual(data['next'], self.meds[4].id)
+        with self.assertNumQueries(2):
+            rest = self.client.get(self.url, {'fields': 'id,price', 'after': data['next']}).json()
+        self.assertEqual(rest['results'][0], {'id': self.meds[5].id, 'price': '3.50'})
+        self.assertEqual(len(rest['results']), 7)
+        self.assertIsNone(rest['next'])
+
+    def test_batched_lookup_keeps_the_requested_order(self):
+        ids = [self.meds[3].id, 999999, self.meds[0].id]
+        with self.assertNumQueries(3):
+            data = self.client.get(self.url, {'ids': ','.join(map(str, ids))}).json()
+        self.assertEqual([row['id'] for row in data['results']], ids[::2])
+        self.assertEqual(data['missing'], [999999])
+        self.assertEqual(data['results'][1]['images'], [self.picture(self.meds[0])])
+        self.assertEqual(data['results'][0]['images'], [self.picture(self.meds[3])])
+
+    def test_bad_queries_are_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'fields': 'name,stock'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'ids': '1,x'}).status_code, 400)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+    def test_responses_revalidate_against_the_catalog_version(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 304)
+        categories = self.client.get(reverse('medstore_app:api_categories'), {'fields': 'name'})
+        self.assertEqual(categories.json(), {'results': [{'name': 'Vitamins'}]})
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(medicine=self.meds[7], image_path='img/new.jpg')
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 200)
+
+
+try:
+    import PIL
+except ImportError:
+    PIL = None
+
+
+@skipUnless(PIL, "Pillow is not installed")
+class ImagePipelineTests(TestCase):
+
+    def setUp(self):
+        from PIL import Image
+
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.uploads, self.root = os.path.join(tmp.name, 'uploads'), os.path.join(tmp.name, 'products')
+        os.makedirs(self.uploads)
+        Image.new('RGB', (800, 600), (200, 30, 30)).save(os.path.join(self.uploads, 'red.png'))
+        with open(os.path.join(self.uploads, 'broken.jpg'), 'wb') as fh:
+            fh.write(b'not an image')
+        self.med = Medicine.objects.create(name='Bandage', price=Decimal('1.00'), stock=5)
+        self.red = ProductImage.objects.create(medicine=self.med, image_path='red.png')
+        self.broken = ProductImage.objects.create(medicine=self.med, image_path='broken.jpg')
+        overrides = override_settings(
+            MEDSTORE_IMAGE_UPLOAD_ROOT=self.uploads, MEDSTORE_IMAGE_ROOT=self.root,
+            MEDSTORE_IMAGE_SIZES={'thumb': (100, 100), 'card': (300, 200)},
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_variants_are_content_addressed_and_recorded(self):
+        errors = []
+        self.assertEqual(process_images(pending_images(), workers=2, on_error=lambda *e: errors.append(e)), (1, 1))
+        self.assertEqual(errors[0][0], self.broken.id)
+        self.red.refresh_from_db()
+        self.assertEqual((self.red.width, self.red.height), (800, 600))
+        self.assertEqual(set(self.red.variants), {'thumb', 'thumb_webp', 'card', 'card_webp'})
+        card = self.red.variants['card_webp']
+        self.assertEqual((card['width'], card['height']), (300, 200))
+        with open(os.path.join(self.root, card['path']), 'rb') as fh:
+            data = fh.read()
+        self.assertEqual(data[8:12], b'WEBP')
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(card['path'], f'{digest[:2]}/{digest}.webp')
+        # Only the broken upload is still pending.
+        self.assertEqual(list(pending_images()), [self.broken])
+
+    def test_storefront_shows_the_processed_image(self):
+        resp = self.client.get(reverse('medstore_app:home'))
+        self.assertNotContains(resp, '<picture>')
+        call_command('process_images', workers=1, stdout=io.StringIO(), stderr=io.StringIO())
+        resp = self.client.get(reverse('medstore_app:home'))
+        self.red.refresh_from_db()
+        self.assertContains(resp, f"/media/products/{self.red.variants['thumb']['path']} 100w")
+        self.assertContains(resp, 'width="100" height="100"')
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='buyer', email='buyer@example.com', password='x')
+        self.med = Medicine.objects.create(name='Paracetamol', price=Decimal('2.00'), stock=3)
+        self.calls = []
+        HANDLERS['test_flaky'] = self.flaky
+        self.addCleanup(HANDLERS.pop, 'test_flaky')
+
+    def flaky(self, fail_times):
+        self.calls.append(fail_times)
+        if len(self.calls) <= fail_times:
+            raise RuntimeError('smtp down')
+
+    def test_side_effects_are_queued_with_the_change(self):
+        order = place_order(self.user, self.med.id, 1)
+        with self.assertRaises(OutOfStock):
+            place_order(self.user, self.med.id, 5)
+        self.client.post(reverse('medstore_app:contact'), {'name': 'Ann', 'email': 'ann@example.com', 'message': 'Hi'})
+        self.assertEqual(
+            list(Job.objects.order_by('id').values_list('kind', 'payload')),
+            [('order_placed', {'order_id': order.id}),
+             ('contact_received', {'message_id': ContactMessage.objects.get().id})],
+        )
+        self.assertEqual(mail.outbox, [])
+        out = io.StringIO()
+        call_command('run_worker', once=True, stdout=out)
+        self.assertIn('2 jobs done, 0 failed', out.getvalue())
+        self.assertEqual([m.to for m in mail.outbox], [['buyer@example.com'], [settings.MEDSTORE_ADMIN_NOTIFY_EMAIL]])
+        self.assertIn('Paracetamol x 1', mail.outbox[0].body)
+
+    def test_claims_do_not_overlap_and_expired_leases_are_taken_over(self):
+        for _ in range(5):
+            enqueue('test_flaky', fail_times=0)
+        first = claim('w1', batch_size=3)
+        second = claim('w2', batch_size=3)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse(claim('w3'))
+        later = timezone.now() + datetime.timedelta(seconds=settings.MEDSTORE_JOB_LEASE_SECONDS + 1)
+        taken = claim('w3', now=later)
+        self.assertEqual(sorted(j.id for j in taken), sorted(j.id for j in first + second))
+        # w1 lost its lease: it leaves the jobs to their new owner.
+        self.assertEqual(run_jobs('w1', first), ([], []))
+        self.assertEqual(self.calls, [])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 0)
+        run_jobs('w3', taken)
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 5)
+
+    def test_each_job_is_marked_done_as_soon_as_it_finishes(self):
+        seen = []
+        HANDLERS['test_peek'] = lambda: seen.append(
+            list(Job.objects.order_by('id').values_list('status', flat=True)))
+        self.addCleanup(HANDLERS.pop, 'test_peek')
+        for _ in range(3):
+            enqueue('test_peek')
+        run_jobs('w', claim('w'))
+        self.assertEqual(seen, [
+            [Job.RUNNING, Job.RUNNING, Job.RUNNING],
+            [Job.DONE, Job.RUNNING, Job.RUNNING],
+            [Job.DONE, Job.DONE, Job.RUNNING],
+        ])
+
+    def test_notifications_are_sent_once(self):
+        order = place_order(self.user, self.med.id, 1)
+        HANDLERS['order_placed'](order_id=order.id)
+        HANDLERS['order_placed'](order_id=order.id)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIsNotNone(Order.objects.get(id=order.id).notified_at)
+
+        msg = ContactMessage.objects.create(name='Ann', email='ann@example.com', message='Hi')
+        with mock.patch.object(EmailMessage, 'send', side_effect=OSError('smtp down')):
+            with self.assertRaises(OSError):
+                HANDLERS['contact_received'](message_id=msg.id)
+        # The failed attempt left no stamp, so the retry sends.
+        HANDLERS['contact_received'](message_id=msg.id)
+        HANDLERS['contact_received'](message_id=msg.id)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[1].extra_headers['Message-ID'], message_id(ContactMessage, msg.id))
+
+    def test_failed_send_is_retried_by_the_queue(self):
+        order = place_order(self.user, self.med.id, 1)
+        job = Job.objects.get(kind='order_placed')
+        with mock.patch.object(EmailMessage, 'send', side_effect=OSError('smtp down')):
+            self.assertEqual(run_jobs('w', claim('w')), ([], [job.id]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), (Job.QUEUED, 'OSError: smtp down'))
+        self.assertIsNone(Order.objects.get(id=order.id).notified_at)
+        self.assertEqual(mail.outbox, [])
+
+        later = timezone.now() + datetime.timedelta(seconds=retry_delay(1) + 1)
+        self.assertEqual(run_jobs('w', claim('w', now=later)), ([job.id], []))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].extra_headers['Message-ID'], message_id(Order, order.id))
+        self.assertIsNotNone(Order.objects.get(id=order.id).notified_at)
+        self.assertEqual(Job.objects.get(id=job.id).status, Job.DONE)
+
+    def test_failures_back_off_then_give_up(self):
+        job = enqueue('test_flaky', fail_times=99)
+        now = timezone.now()
+        for attempt in range(1, settings.MEDSTORE_JOB_MAX_ATTEMPTS + 1):
+            now += datetime.timedelta(seconds=settings.MEDSTORE_JOB_RETRY_MAX + 1)
+            run_jobs('w', claim('w', now=now))
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.last_error, 'RuntimeError: smtp down')
+        self.assertEqual([retry_delay(n) for n in (1, 2, 3)], [10, 20, 40])
+
+    def test_queue_metrics(self):
+        enqueue('test_flaky', fail_times=0)
+        enqueue('test_flaky', fail_times=0, delay=3600)
+        run_jobs('w', claim('w', batch_size=1))
+        Job.objects.create(kind='test_flaky', payload={'fail_times': 0},
+                           run_after=timezone.now() - datetime.timedelta(seconds=30))
+        stats = queue_stats()
+        self.assertEqual(stats['counts'], {'queued': 2, 'running': 0, 'done': 1, 'failed': 0})
+        self.assertGreaterEqual(stats['lag'], 30)
+        self.assertEqual(stats['finished'], 1)
+        self.client.cookies['admin_email'] = ADMIN_EMAIL
+        body = self.client.get(reverse('medstore_app:admin_metrics')).content.decode()
+        self.assertIn('medstore_jobs{status="queued"} 2', body)
+        self.assertIn('medstore_jobs_finished_recent 1', body)
+
+
+class SalesRollupTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='buyer', email='buyer@example.com', password='x')
+        self.cats = Category.objects.bulk_create([Category(name='Pain'), Category(name='Cold')])
+        self.meds = Medicine.objects.bulk_create([
+            Medicine(name=f'Med {i}', price=Decimal('4.00'), stock=100, category=self.cats[i % 2])
+            for i in range(4)
+        ])
+
+    def snapshot(self):
+        return (
+            sorted(DailySales.objects.values_list('day', 'units', 'revenue', 'orders')),
+            sorted(DailyMedicineSales.objects.values_list('day', 'medicine_id', 'medicine_name',
+                                                          'units', 'revenue', 'orders')),
+            sorted(DailyCategorySales.objects.values_list('day', 'category_name', 'units', 'revenue', 'orders')),
+        )
+
+    def test_checkout_matches_a_rebuild(self):
+        checkout(self.user, {self.meds[0].id: 2, self.meds[1].id: 1, self.meds[2].id: 3})
+        checkout(self.user, {self.meds[0].id: 1})
+        today = timezone.localdate()
+        self.assertEqual(DailySales.objects.get(day=today).revenue, Decimal('28.00'))
+        self.assertEqual(DailySales.objects.get(day=today).orders, 2)
+        pain = DailyCategorySales.objects.get(day=today, category_name='Pain')
+        self.assertEqual((pain.units, pain.orders), (6, 2))
+
+        incremental = self.snapshot()
+        rollups.rebuild(today, today)
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_rebuild_is_chunked_and_idempotent(self):
+        orders = seed_orders(20)
+        today = timezone.localdate()
+        for n, order in enumerate(orders):
+            Order.objects.filter(id=order.id).update(datetime=timezone.now() - datetime.timedelta(days=n % 10))
+        start = today - datetime.timedelta(days=9)
+
+        self.assertEqual(rollups.rebuild(start, today, chunk_days=3), 4)
+        first = self.snapshot()
+        self.assertEqual(len(first[0]), 10)
+        self.assertEqual(sum(row[3] for row in first[0]), 20)
+        self.assertEqual(sum(row[2] for row in first[0]), Decimal('600.00'))
+
+        rollups.rebuild(start, today, chunk_days=7)
+        self.assertEqual(self.snapshot(), first)
+
+    def test_analytics_page_reads_only_rollups(self):
+        seed_orders(12)
+        rollups.rebuild(timezone.localdate(), timezone.localdate())
+        self.client.cookies['admin_email'] = ADMIN_EMAIL
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('medstore_app:admin_analytics'))
+        self.assertContains(response, 'Med 0')
+        self.assertContains(response, 'General')
+        self.assertEqual(len(response.context['series']), 365)
+        self.assertEqual(response.context['totals']['orders'], 12)
+        for query in ctx.captured_queries:
+            self.assertIn('daily', query['sql'])
+        self.assertLessEqual(len(ctx.captured_queries), 3)
+
+    def test_rebuild_command(self):
+        seed_orders(5)
+        DailySales.objects.create(day=timezone.localdate(), units=1, revenue=Decimal('1.00'), orders=1)
+        out = io.StringIO()
+        call_command('rebuild_rollups', stdout=out)
+        self.assertIn('Rebuilt 1 days', out.getvalue())
+        self.assertEqual(DailySales.objects.get().orders, 5)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', since='2026-02-01', until='2026-01-01', stdout=io.StringIO())
+
+
+class ViewCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        view_cache_stats.reset()
+        self.cat = Category.objects.create(name='Vitamins')
+        Medicine.objects.create(name='Vitamin C', price=Decimal('2.00'), stock=5, category=self.cat)
+
+    def search(self, **kwargs):
+        return self.client.get(reverse('medstore_app:search'), {'q': 'vitamin'}, **kwargs)
+
+    def test_search_is_served_from_cache_until_a_medicine_changes(self):
+        first = self.search()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search().content, first.content)
+        with self.captureOnCommitCallbacks(execute=True):
+            Medicine.objects.create(name='Vitamin D', price=Decimal('3.00'), stock=5, category=self.cat)
+        self.assertEqual(len(self.search().json()['results']), 2)
+        self.assertEqual(view_cache_stats.snapshot()['hit'], 1)
+        self.assertEqual(view_cache_stats.snapshot()['miss'], 2)
+
+    def test_hits_replay_the_headers_of_the_stored_response(self):
+        @viewcache.cached_view('test_headers')
+        def view(request):
+            response = HttpResponse('{}', content_type='application/json')
+            response['Cache-Control'] = 'max-age=60'
+            response['Vary'] = 'Accept-Language'
+            return response
+
+        request = RequestFactory().get('/test/')
+        request.medstore_user = None
+        with mock.patch.dict(viewcache.POLICIES, {'test_headers': viewcache.Policy(ttl=60)}):
+            miss, hit = view(request), view(request)
+        self.assertEqual(view_cache_stats.snapshot()['hit'], 1)
+        self.assertEqual(dict(hit.headers), dict(miss.headers))
+        self.assertEqual(hit['Vary'], 'Accept-Language')
+        self.assertEqual(hit.content, miss.content)
+
+    def test_anonymous_policy_skips_logged_in_visitors(self):
+        self.search()
+        login_as(self.client, User.objects.create(username='c', email='c@example.com', password='x'))
+        self.search()
+        self.assertEqual(view_cache_stats.snapshot()['bypass'], 1)
+
+    @override_settings(MESSAGE_STORAGE='django.contrib.messages.storage.session.SessionStorage')
+    def test_only_html_policies_look_at_flash_messages(self):
+        self.client.post(reverse('medstore_app:cart_add', args=[Medicine.objects.get().id]))
+        resp = self.client.get(reverse('medstore_app:api_categories'))
+        self.assertFalse(resp.wsgi_request.session.accessed)
+        self.assertNotIn('Cookie', resp.get('Vary', ''))
+        self.assertEqual(view_cache_stats.snapshot()['bypass'], 0)
+        # The message is still pending, so the about page is not served from the cache.
+        self.client.get(reverse('medstore_app:about'))
+        self.assertEqual(view_cache_stats.snapshot()['bypass'], 1)
+
+    def test_user_policy_keeps_a_copy_per_visitor(self):
+        request = RequestFactory().get('/admin-panel/analytics/')
+        request.medstore_user = None
+        request.COOKIES['admin_email'] = ADMIN_EMAIL
+        policy = viewcache.POLICIES['admin_analytics']
+        admin_key = viewcache.response_key(request, 'admin_analytics', policy)
+        request.COOKIES['admin_email'] = 'other@example.com'
+        self.assertNotEqual(viewcache.response_key(request, 'admin_analytics', policy), admin_key)
+        viewcache.invalidate_tags('order')
+        request.COOKIES['admin_email'] = ADMIN_EMAIL
+        self.assertNotEqual(viewcache.response_key(request, 'admin_analytics', policy), admin_key)
+
+    def test_expiry_under_load_recomputes_once(self):
+        calls = []
+        started = threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return len(calls), True
+
+        def fetch(results):
+            results.append(viewcache.get_or_compute('medstore:test', 60, compute))
+
+        results = []
+        threads = [threading.Thread(target=fetch, args=(results,)) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [1] * 10)
+
+        # Stale: one caller recomputes, the others get the old value meanwhile.
+        cache.set('medstore:test', (time.time() - 1, 'old'), 60)
+        started.clear()
+        results = []
+        winner = threading.Thread(target=fetch, args=(results,))
+        winner.start()
+        started.wait(5)
+        self.assertEqual(viewcache.get_or_compute('medstore:test', 60, compute), 'old')
+        winner.join()
+        self.assertEqual(results, [2])
+        self.assertEqual(viewcache.get_or_compute('medstore:test', 60, compute), 2)
+
+
+class InboxTests(TestCase):
+
+    def setUp(self):
+        self.now = now = timezone.now()
+        ContactMessage.objects.bulk_create([
+            ContactMessage(name=f'Visitor {i}', email='spam@example.com' if i % 3 else 'real@example.com',
+                           message='Hello', is_read=i % 2 == 0)
+            for i in range(30)
+        ])
+        # Spread them one hour apart, message 0 the oldest.
+        for n, msg_id in enumerate(ContactMessage.objects.order_by('id').values_list('id', flat=True)):
+            ContactMessage.objects.filter(id=msg_id).update(created_at=now - datetime.timedelta(hours=30 - n))
+        self.client.cookies['admin_email'] = ADMIN_EMAIL
+
+    def walk(self, **filters):
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page, cursor = inbox_page(before=decode_cursor(cursor), size=4, **filters)
+            seen += [m.name for m in page]
+            if not cursor:
+                return seen
+
+    def test_cursor_pages_cover_every_message_newest_first(self):
+        self.assertEqual(self.walk(), [f'Visitor {i}' for i in reversed(range(30))])
+        self.assertEqual(self.walk(email='real@example.com'), [f'Visitor {i}' for i in reversed(range(0, 30, 3))])
+        self.assertEqual(self.walk(state='unread'), [f'Visitor {i}' for i in reversed(range(1, 30, 2))])
+        plan = ContactMessage.objects.filter(is_read=False).order_by('-created_at', '-id')[:5].explain()
+        self.assertIn('message_unread_idx', plan)
+
+    def test_page_and_bulk_mark_read(self):
+        resp = self.client.get(reverse('medstore_app:admin_messages'), {'state': 'unread', 'size': 5})
+        self.assertEqual(len(resp.context['messages']), 5)
+        self.assertTrue(resp.context['next_cursor'])
+        self.assertContains(resp, f"?before={resp.context['next_cursor']}&size=5&state=unread")
+        self.assertContains(resp, '?format=csv&state=unread')
+        export = self.client.get(reverse('medstore_app:admin_export_messages'),
+                                 {'format': 'csv', 'email': 'real@example.com', 'state': 'unread'})
+        self.assertEqual(b''.join(export.streaming_content).decode().count('real@example.com'), 5)
+        ids = [m.id for m in resp.context['messages']]
+        with self.assertNumQueries(1):
+            self.assertEqual(mark_read(ids + ids), 5)
+        resp = self.client.post(reverse('medstore_app:admin_mark_messages_read'),
+                                {'ids': [str(i) for i in ContactMessage.objects.values_list('id', flat=True)],
+                                 'query': 'state=unread'})
+        self.assertRedirects(resp, reverse('medstore_app:admin_messages') + '?state=unread',
+                             fetch_redirect_response=False)
+        self.assertFalse(ContactMessage.objects.filter(is_read=False).exists())
+
+    def test_archive_moves_old_messages_in_batches(self):
+        batches = []
+        moved = archive_messages(older_than_days=0.5, batch_size=7, now=self.now, on_batch=lambda n, last: batches.append(n))
+        self.assertEqual(moved, 18)
+        self.assertEqual(batches, [7, 7, 4])
+        self.assertEqual(ContactMessage.objects.count(), 12)
+        archived = [row for a in MessageArchive.objects.order_by('first_created_at') for row in archived_rows(a)]
+        self.assertEqual([row['name'] for row in archived], [f'Visitor {i}' for i in range(18)])
+        self.assertEqual(archive_messages(older_than_days=0.5, now=self.now), 0)
+
+        out = io.StringIO()
+        call_command('archive_messages', days=0, stdout=out)
+        self.assertIn('Archived 12 message(s)', out.getvalue())
+        self.assertFalse(ContactMessage.objects.exists())
+
+
+class DatabaseProfileTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def test_catalog_reads_go_to_the_replica(self):
+        self.assertEqual(self.router.db_for_read(Medicine), REPLICA)
+        self.assertEqual(Medicine.objects.all().db, REPLICA)
+        self.assertIsNone(self.router.db_for_read(User))
+        self.assertEqual(self.router.db_for_write(Medicine), 'default')
+
+    def test_reads_inside_a_transaction_stay_on_default(self):
+        with transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Medicine), 'default')
+        self.assertEqual(self.router.db_for_read(Medicine), REPLICA)
+
+    def test_historical_models_are_not_routed(self):
+        historical = ProjectState.from_apps(django_apps).apps.get_model('medstore_app', 'Medicine')
+        self.assertEqual(historical.__module__, '__fake__')
+        self.assertIsNone(self.router.db_for_read(historical))
+
+    def test_only_default_is_migrated(self):
+        self.assertTrue(self.router.allow_migrate('default', 'medstore_app', 'medicine'))
+        self.assertFalse(self.router.allow_migrate(REPLICA, 'medstore_app', 'medicine'))
+
+    def test_new_connections_get_the_pragmas(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            handler = ConnectionHandler(sqlite_databases(os.path.join(tmp, 'db.sqlite3')))
+            try:
+                for alias in ('default', REPLICA):
+                    with handler[alias].cursor() as cursor:
+                        values = {}
+                        for name in ('synchronous', 'mmap_size', 'cache_size', 'temp_store', 'query_only'):
+                            cursor.execute(f'PRAGMA {name}')
+                            values[name] = cursor.fetchone()[0]
+                    self.assertEqual(values, {
+                        'synchronous': 1, 'mmap_size': 256 * 1024 * 1024, 'cache_size': -64 * 1024,
+                        'temp_store': 2, 'query_only': int(alias == REPLICA),
+                    })
+                with self.assertRaises(OperationalError), handler[REPLICA].cursor() as cursor:
+                    cursor.execute('CREATE TABLE scratch (id INTEGER)')
+            finally:
+                handler.close_all()
+
+
+class FastPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    iterations = 1000
+
+
+@override_settings(PASSWORD_HASHERS=['medstore_app.tests.FastPBKDF2PasswordHasher'])
+class LoginTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username='ann', email='ann@example.com', mobile='9876543210', password=make_password('secret')
+        )
+
+    def test_login_sets_user_token(self):
+        resp = self.client.post(reverse('medstore_app:login'), {'identifier': 'ann', 'password': 'secret'})
+        self.assertRedirects(resp, reverse('medstore_app:home'), fetch_redirect_response=False)
+        self.assertIn(USER_COOKIE, resp.cookies)
+
+    def test_wrong_password(self):
+        resp = self.client.post(reverse('medstore_app:login'), {'identifier': 'ann', 'password': 'nope'})
+        self.assertEqual(resp.context['error'], 'Invalid login details')
+
+    def test_outdated_hash_is_upgraded_on_login(self):
+        hasher = FastPBKDF2PasswordHasher()
+        old = hasher.encode('secret', hasher.salt(), iterations=500)
+        User.objects.filter(id=self.user.id).update(password=old)
+        self.client.post(reverse('medstore_app:login'), {'identifier': 'ann', 'password': 'secret'})
+        self.user.refresh_from_db()
+        self.assertNotEqual(self.user.password, old)
+        self.assertEqual(hasher.decode(self.user.password)['iterations'], 1000)
+
+    async def test_async_login_view(self):
+        with async_views(True):
+            resp = await self.async_client.post(
+                reverse('medstore_app:login'), {'identifier': 'ann@example.com', 'password': 'secret'}
+            )
+            self.assertEqual(resp.status_code, 302)
+            self.assertIn(USER_COOKIE, resp.cookies)
+            resp = await self.async_client.post(
+                reverse('medstore_app:login'), {'identifier': 'ann', 'password': 'nope'}
+            )
+            self.assertEqual(resp.context['error'], 'Invalid login details')
+
+
+# The test database is SQLite's shared-cache in-memory mode, which reports
+# lock conflicts immediately instead of waiting on busy_timeout, so every
+# buyer leans on the retry loop far harder than against a real file.
+@override_settings(MEDSTORE_ORDER_MAX_ATTEMPTS=200, MEDSTORE_ORDER_BACKOFF_MAX=0.05)
+class ConcurrentOrderPlacementTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+    BUYERS = 300
+    STOCK = 120
+
+    def test_no_oversell_under_concurrent_buyers(self):
+        med = Medicine.objects.create(name='Paracetamol', price=Decimal('1.00'), stock=self.STOCK)
+        users = User.objects.bulk_create([
+            User(username=f'b{i}', email=f'b{i}@example.com', password='x') for i in range(self.BUYERS)
+        ])
+        placement_stats.reset()
+        start = threading.Barrier(self.BUYERS)
+        outcomes = []
+
+        def buy(user):
+            try:
+                start.wait()
+                place_order(user, med.id, 1)
+                outcomes.append('placed')
+            except OrderRejected:
+                outcomes.append('rejected')
+            except OperationalError:
+                outcomes.append('failed')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(u,)) for u in users]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        med.refresh_from_db()
+        sold = OrderItem.objects.filter(medicine=med).count()
+        self.assertEqual(outcomes.count('failed'), 0)
+        self.assertEqual(outcomes.count('placed'), self.STOCK)
+        self.assertEqual(outcomes.count('rejected'), self.BUYERS - self.STOCK)
+        self.assertEqual(sold, self.STOCK)
+        self.assertEqual(med.stock, 0)
+        stats = placement_stats.snapshot()
+        self.assertEqual((stats['placed'], stats['rejected']), (self.STOCK, self.BUYERS - self.STOCK))
@@ -1,23 +1,41 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
+
+# Under ASGI the async variants take over the routes they exist for.
+active_views = async_views if settings.MEDSTORE_ASYNC_VIEWS else views
 
 app_name = 'medstore_app'
 
 urlpatterns = [
-    path('', views.show_home_page, name='home'),
-    path('login/', views.show_login_page, name='login'),
+    path('', active_views.show_home_page, name='home'),
+    path('login/', active_views.show_login_page, name='login'),
     path('signup/', views.show_signup_page, name='signup'),
     path('logout/', views.logout_view, name='logout'),
+    path('search/', views.search, name='search'),
+    path('api/medicines/', views.api_medicines, name='api_medicines'),
+    path('api/categories/', views.api_categories, name='api_categories'),
     path('about/', views.show_about_page, name='about'),
     path('contact/', views.show_contact_page, name='contact'),
     path('admin-panel/login/', views.admin_login_page, name='admin_login'),
-    path('admin-panel/dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('admin-panel/dashboard/', active_views.admin_dashboard, name='admin_dashboard'),
     path('admin-panel/add-category/', views.admin_add_category, name='admin_add_category'),
     path('admin-panel/add-medicine/', views.admin_add_medicine, name='admin_add_medicine'),
-    path('admin-panel/messages/', views.admin_view_messages, name='admin_messages'),
-    path('admin-panel/orders/', views.admin_view_orders, name='admin_orders'),
+    path('admin-panel/messages/', active_views.admin_view_messages, name='admin_messages'),
+    path('admin-panel/messages/mark-read/', views.admin_mark_messages_read, name='admin_mark_messages_read'),
+    path('admin-panel/orders/', active_views.admin_view_orders, name='admin_orders'),
+    path('admin-panel/orders/export/', views.admin_export_orders, name='admin_export_orders'),
+    path('admin-panel/messages/export/', views.admin_export_messages, name='admin_export_messages'),
+    path('admin-panel/low-stock/', views.admin_low_stock, name='admin_low_stock'),
+    path('admin-panel/analytics/', views.admin_analytics, name='admin_analytics'),
+    path('admin-panel/metrics/', views.admin_metrics, name='admin_metrics'),
     path('admin-panel/logout/', views.admin_logout, name='admin_logout'),
     path('order/<int:med_id>/', views.create_order, name='create_order'),
+    path('cart/', views.cart_view, name='cart'),
+    path('cart/add/<int:med_id>/', views.cart_add, name='cart_add'),
+    path('cart/update/<int:med_id>/', views.cart_update, name='cart_update'),
+    path('cart/checkout/', views.cart_checkout, name='cart_checkout'),
+    path('my-orders/', views.my_orders, name='my_orders'),
 
 ]
 
@@ -0,0 +1,221 @@
+"""
+Storefront customer identity.
+
+Login identifiers (email, username or mobile) resolve to a ``User`` in one
+indexed query. A logged-in customer carries a signed ``user_token`` cookie holding their
+user id. ``CurrentUserMiddleware`` turns it into ``request.medstore_user``
+through ``user_cache``, a per-process LRU with a TTL, so most page views do
+not touch the ``User`` table at all. Saving or deleting a user drops them from
+this process's cache; other processes catch up within the TTL.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponse
+
+from .models import User
+
+USER_COOKIE = 'user_token'
+USER_COOKIE_SALT = 'medstore.user'
+USER_COOKIE_AGE = 7 * 24 * 60 * 60
+
+MOBILE_RE = re.compile(r'\+?\d{6,15}')
+
+IDENTIFIER_FIELDS = ('email', 'username', 'mobile')
+
+
+# -------------------------
+# Identifier lookup
+# -------------------------
+def identifier_type(identifier):
+    """Guess whether a login identifier is an ``email``, ``mobile`` or ``username``."""
+    if '@' in identifier:
+        return 'email'
+    if MOBILE_RE.fullmatch(identifier):
+        return 'mobile'
+    return 'username'
+
+
+def _identifier_query(identifier):
+    match = Q()
+    for field in IDENTIFIER_FIELDS:
+        match |= Q(**{field: identifier})
+    return User.objects.filter(match)[:len(IDENTIFIER_FIELDS)]
+
+
+def _pick_user(candidates, identifier):
+    first = identifier_type(identifier)
+    for field in (first,) + tuple(f for f in IDENTIFIER_FIELDS if f != first):
+        for user in candidates:
+            if getattr(user, field) == identifier:
+                return user
+    return None
+
+
+def find_user(identifier):
+    """
+    Resolve a login identifier to a ``User`` in one query.
+
+    All three columns carry unique indexes, so the OR is answered by three
+    index probes in a single statement. Accounts created before usernames
+    were restricted may still have an email- or phone-shaped username,
+    so the other columns are matched too; the detected type wins a tie.
+    """
+    identifier = identifier.strip()
+    if not identifier:
+        return None
+    return _pick_user(list(_identifier_query(identifier)), identifier)
+
+
+async def afind_user(identifier):
+    identifier = identifier.strip()
+    if not identifier:
+        return None
+    return _pick_user([u async for u in _identifier_query(identifier)], identifier)
+
+
+def signup_conflict(email, username, mobile):
+    """
+    The first of ``email``/``username``/``mobile`` already taken, or ``None``,
+    checked against all three unique indexes in one query.
+    """
+    wanted = {'email': email, 'username': username, 'mobile': mobile}
+    match = Q()
+    for field, value in wanted.items():
+        match |= Q(**{field: value})
+    rows = User.objects.filter(match).values_list(*IDENTIFIER_FIELDS)[:len(IDENTIFIER_FIELDS)]
+    taken = {field for row in rows for field, value in zip(IDENTIFIER_FIELDS, row) if value == wanted[field]}
+    return next((field for field in IDENTIFIER_FIELDS if field in taken), None)
+
+
+# -------------------------
+# Per-request user cache
+# -------------------------
+class UserCache:
+    """Thread-safe LRU of ``User`` rows keyed by id, with per-entry expiry."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, user_id):
+        """The cached entry ``(True, user)``, or ``(False, None)`` on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return True, entry[1]
+            self.misses += 1
+        return False, None
+
+    def get(self, user_id):
+        found, user = self._lookup(user_id)
+        if not found:
+            user = User.objects.filter(id=user_id).first()
+            if user is not None:
+                self.put(user)
+        return user
+
+    async def aget(self, user_id):
+        """``get`` with the miss answered by the async ORM."""
+        found, user = self._lookup(user_id)
+        if not found:
+            user = await User.objects.filter(id=user_id).afirst()
+            if user is not None:
+                self.put(user)
+        return user
+
+    def put(self, user):
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+user_cache = UserCache(settings.MEDSTORE_USER_CACHE_SIZE, settings.MEDSTORE_USER_CACHE_TTL)
+
+
+def _sign_into(response, user):
+    response.set_signed_cookie(
+        USER_COOKIE, str(user.id), salt=USER_COOKIE_SALT, max_age=USER_COOKIE_AGE, httponly=True
+    )
+
+
+def set_user_cookie(response, user):
+    _sign_into(response, user)
+    user_cache.put(user)
+
+
+def sign_user_token(user):
+    """The ``user_token`` value for ``user``, for test and benchmark clients that set cookies themselves."""
+    response = HttpResponse()
+    _sign_into(response, user)
+    return response.cookies[USER_COOKIE].value
+
+
+class CurrentUserMiddleware:
+    """
+    Set ``request.medstore_user`` to the logged-in customer, or ``None``.
+
+    Runs natively under both WSGI and ASGI, so Django never has to adapt
+    the chain around it; under ASGI a cache miss goes through the async ORM.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        user_id = self.user_id(request)
+        request.medstore_user = user_cache.get(user_id) if user_id else None
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        user_id = self.user_id(request)
+        request.medstore_user = await user_cache.aget(user_id) if user_id else None
+        return await self.get_response(request)
+
+    def user_id(self, request):
+        user_id = request.get_signed_cookie(
+            USER_COOKIE, default=None, salt=USER_COOKIE_SALT, max_age=USER_COOKIE_AGE
+        )
+        if not user_id or not user_id.isdigit():
+            return None
+        return int(user_id)
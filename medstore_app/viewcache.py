@@ -0,0 +1,220 @@
+"""
+Whole-response caching for views.
+
+Every cached view has its policy in ``POLICIES``, keyed by the name passed
+to ``@cached_view``:
+
+    ttl     seconds a stored response is served as fresh
+    vary    ``USER`` keeps one copy per customer (or admin). ``ANONYMOUS``
+            shares one copy between visitors who are not logged in, and
+            logged-in requests skip the cache. ``None`` shares one copy
+            with everybody
+    tags    what the response is built from: ``medicine``, ``category`` or
+            ``order``
+    html    the view renders a page, which may show the visitor's flash
+            messages. Such a page is never stored or served while messages
+            are pending. JSON views set it false, so their cached hits never
+            load the session (or add ``Vary: Cookie``)
+
+Each tag has a version in the cache, and a response's key includes the
+versions of its tags. Saving or deleting a ``Medicine``, ``Category`` or
+``Order`` moves its tag forward on commit (see ``signals.py``), and bulk
+writers call ``invalidate_tags`` themselves. Every key built from the old
+version is then unreachable and ages out. Nothing has to be deleted.
+
+Stampedes are avoided with a single flight per key. The first request
+after a response goes stale takes a short lock with ``cache.add`` and
+recomputes it. Until it is done, other requests get the stale copy, which
+is kept ``MEDSTORE_VIEW_CACHE_STALE_SECONDS`` past its TTL for this. With
+no copy at all, they wait up to ``MEDSTORE_VIEW_CACHE_WAIT_SECONDS`` for
+the winner's result. The lock only covers processes that share the cache
+backend, so the per-process local-memory default gives one recompute per
+process.
+"""
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+
+TAG_KEY = 'medstore:tag:%s'
+VIEW_KEY = 'medstore:view:%s:%s'
+
+USER = 'user'
+ANONYMOUS = 'anonymous'
+
+
+class Policy:
+
+    def __init__(self, ttl, vary=None, tags=(), html=True):
+        self.ttl = ttl
+        self.vary = vary
+        self.tags = tuple(tags)
+        self.html = html
+
+
+POLICIES = {
+    'about': Policy(ttl=60 * 60, vary=ANONYMOUS),
+    'search': Policy(ttl=5 * 60, vary=ANONYMOUS, tags=('medicine', 'category'), html=False),
+    'api_medicines': Policy(ttl=10 * 60, tags=('medicine', 'category'), html=False),
+    'api_categories': Policy(ttl=10 * 60, tags=('category',), html=False),
+    'admin_analytics': Policy(ttl=5 * 60, vary=USER, tags=('order',)),
+}
+
+
+class ViewCacheStats:
+    """Process-wide counters for cached views."""
+
+    FIELDS = ('hit', 'stale', 'miss', 'wait', 'bypass')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def incr(self, field, n=1):
+        with self._lock:
+            self._counts[field] += n
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+view_cache_stats = ViewCacheStats()
+
+
+# -------------------------
+# Tags
+# -------------------------
+def _new_version():
+    return time.time_ns() // 1000
+
+
+def tag_versions(tags):
+    """The current version of each tag; a tag the cache lost starts again now."""
+    keys = {tag: TAG_KEY % tag for tag in tags}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for tag, key in keys.items():
+        if key not in found:
+            version = _new_version()
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            found[key] = version
+        versions[tag] = found[key]
+    return versions
+
+
+def invalidate_tags(*tags):
+    now = _new_version()
+    current = cache.get_many([TAG_KEY % tag for tag in tags])
+    cache.set_many({
+        TAG_KEY % tag: max(now, current.get(TAG_KEY % tag, 0) + 1) for tag in tags
+    }, None)
+
+
+# -------------------------
+# Single flight
+# -------------------------
+def get_or_compute(key, ttl, compute):
+    """
+    The value cached under ``key``, calling ``compute()`` at most once per
+    expiry across everyone sharing the cache. ``compute`` returns
+    ``(value, store)``, and a value with ``store`` false is returned
+    without being cached.
+    """
+    entry = cache.get(key)
+    if entry is not None and entry[0] > time.time():
+        view_cache_stats.incr('hit')
+        return entry[1]
+    lock = key + ':lock'
+    if cache.add(lock, 1, settings.MEDSTORE_VIEW_CACHE_LOCK_SECONDS):
+        view_cache_stats.incr('miss')
+        try:
+            value, store = compute()
+            if store:
+                cache.set(key, (time.time() + ttl, value), ttl + settings.MEDSTORE_VIEW_CACHE_STALE_SECONDS)
+            return value
+        finally:
+            cache.delete(lock)
+    if entry is not None:
+        view_cache_stats.incr('stale')
+        return entry[1]
+    view_cache_stats.incr('wait')
+    deadline = time.monotonic() + settings.MEDSTORE_VIEW_CACHE_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(0.01)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[1]
+        if cache.get(lock) is None:
+            break
+    # The winner stored nothing, died or is too slow; do the work here.
+    return compute()[0]
+
+
+# -------------------------
+# Views
+# -------------------------
+def _visitor(request):
+    user = getattr(request, 'medstore_user', None)
+    if user:
+        return f'u{user.pk}'
+    return f"a:{request.COOKIES['admin_email']}" if request.COOKIES.get('admin_email') else ''
+
+
+def response_key(request, name, policy):
+    visitor = _visitor(request) if policy.vary == USER else ''
+    versions = tag_versions(policy.tags)
+    raw = '|'.join([visitor, request.method, request.get_full_path()] + [
+        f'{tag}={versions[tag]}' for tag in policy.tags
+    ])
+    return VIEW_KEY % (name, hashlib.blake2b(raw.encode(), digest_size=16).hexdigest())
+
+
+def _cacheable(request, policy):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if policy.vary == ANONYMOUS and _visitor(request):
+        return False
+    # Flash messages are shown once, so a page carrying them is never stored or served.
+    return not (policy.html and len(messages.get_messages(request)))
+
+
+def cached_view(name):
+    """Serve the view through the cache according to ``POLICIES[name]``."""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            policy = POLICIES[name]
+            if not _cacheable(request, policy):
+                view_cache_stats.incr('bypass')
+                return view_func(request, *args, **kwargs)
+
+            def compute():
+                response = view_func(request, *args, **kwargs)
+                # Only plain 200s that hand out no cookie (or CSRF token) can be replayed.
+                if (response.status_code != 200 or response.streaming or response.cookies
+                        or request.META.get('CSRF_COOKIE_NEEDS_UPDATE')):
+                    return response, False
+                return (response.status_code, list(response.headers.items()), response.content), True
+
+            result = get_or_compute(response_key(request, name, policy), policy.ttl, compute)
+            return result if isinstance(result, HttpResponse) else _replay(result)
+        return wrapper
+    return decorator
+
+
+def _replay(entry):
+    # Cookies are never stored (see ``compute``), so every header the view
+    # set can be replayed as is, Vary and Content-Type included.
+    status, headers, content = entry
+    return HttpResponse(content, status=status, headers=dict(headers))
@@ -1,18 +1,54 @@
+import logging
 from functools import wraps
+from asgiref.sync import iscoroutinefunction
 from django.shortcuts import render, redirect
+from django.urls import reverse
 from django.contrib import messages
-from django.contrib.auth.hashers import make_password, check_password
-from django.db import transaction
-
-from .models import User, Category, Medicine, Order, OrderItem, ContactMessage
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest
+from django.views.decorators.http import require_GET
+
+from .cart import Cart
+from .catalog import parse_page_args, page_ids, get_cards, assemble_cards, conditional_catalog
+from . import api, metrics, rollups
+from .history import parse_history_args, customer_orders
+from .inbox import parse_inbox_args, inbox_page, mark_read
+from .inventory import HoldRejected, set_holds, low_stock
+from .jobs import enqueue
+from .exports import ENCODERS, ORDER_COLUMNS, MESSAGE_COLUMNS, order_rows, message_rows, export_response
+from .passwords import verify_password, hash_password, PasswordCheckBusy
+from .orders import place_order, checkout, OrderRejected
+from .search import search_medicines
+from .stats import dashboard_stats
+from .reports import parse_report_args, order_report
+from .users import USER_COOKIE, set_user_cookie, find_user, identifier_type, signup_conflict
+from .viewcache import cached_view
+from .models import User, Category, Medicine, ContactMessage
+
+logger = logging.getLogger(__name__)
 
 ADMIN_EMAIL = "admin@medstore.com"
 
+SIGNUP_CONFLICT_ERRORS = {
+    'email': "Email already exists",
+    'username': "Username taken",
+    'mobile': "Mobile already used",
+}
+
 
 # -------------------------
 # Helper / decorator
 # -------------------------
 def admin_required(view_func):
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            if request.COOKIES.get('admin_email') != ADMIN_EMAIL:
+                return redirect('medstore_app:admin_login')
+            return await view_func(request, *args, **kwargs)
+        return async_wrapper
+
     @wraps(view_func)
     def wrapper(request, *args, **kwargs):
         if request.COOKIES.get('admin_email') != ADMIN_EMAIL:
@@ -24,25 +60,29 @@ def admin_required(view_func):
 # -------------------------
 # Public pages / auth
 # -------------------------
+@conditional_catalog()
 def show_home_page(request):
-    products = Medicine.objects.all()
-    user_email = request.COOKIES.get('user_email')
-    user = User.objects.filter(email=user_email).first()
-    return render(request, 'medstore_app/home.html', {'products': products, 'user': user})
+    after, size = parse_page_args(request.GET)
+    ids, next_cursor = page_ids(after, size)
+    cards = assemble_cards(request, get_cards(ids, request.catalog_version))
+    return render(request, 'medstore_app/home.html', {
+        'cards': cards,
+        'next_cursor': next_cursor,
+        'page_size': size if request.GET.get('size') else None,
+        'user': request.medstore_user,
+    })
 
 
 def show_login_page(request):
     if request.method == "GET":
-        if request.COOKIES.get('user_email'):
+        if request.medstore_user:
             return redirect('medstore_app:home')
         return render(request, 'medstore_app/login.html')
     return login(request)
 
 
 def login(request):
-    # optional debug prints (remove after testing)
-    print("DEBUG: login called, method=", request.method)
-    print("DEBUG POST:", dict(request.POST))
+    logger.debug("login called, method=%s, fields=%s", request.method, sorted(request.POST))
 
     identifier = request.POST.get('identifier')
     password = request.POST.get('password')
@@ -50,26 +90,31 @@ def login(request):
     if not identifier or not password:
         return render(request, 'medstore_app/login.html', {"error": "All fields are required"})
 
-    user = User.objects.filter(email=identifier).first() \
-           or User.objects.filter(username=identifier).first() \
-           or User.objects.filter(mobile=identifier).first()
+    user = find_user(identifier)
 
     if not user:
         return render(request, 'medstore_app/login.html', {"error": "User not found. Please signup."})
 
-    if not check_password(password, user.password):
-        return render(request, 'medstore_app/login.html', {"error": "Invalid login details"})
+    try:
+        if not verify_password(user, password):
+            return render(request, 'medstore_app/login.html', {"error": "Invalid login details"})
+    except PasswordCheckBusy as exc:
+        return render(request, 'medstore_app/login.html', {"error": str(exc)})
+
+    return login_success(request, user)
 
+
+def login_success(request, user):
     # SUCCESS: set cookie and remove admin cookie (so header shows user-nav)
     response = redirect('medstore_app:home')
-    response.set_cookie('user_email', user.email, max_age=7 * 24 * 60 * 60)
+    set_user_cookie(response, user)
     response.delete_cookie('admin_email')
     messages.success(request, f"Welcome {user.username}!")
     return response
 
 
 def show_signup_page(request):
-    if request.method == "GET" and request.COOKIES.get('user_email'):
+    if request.method == "GET" and request.medstore_user:
         return redirect('medstore_app:home')
     if request.method == "GET":
         return render(request, 'medstore_app/signup.html')
@@ -87,19 +132,25 @@ def signup(request):
         return render(request, 'medstore_app/signup.html', {"error": "All fields are required"})
     if password != confirm:
         return render(request, 'medstore_app/signup.html', {"error": "Passwords do not match"})
-    if User.objects.filter(email=email).exists():
-        return render(request, 'medstore_app/signup.html', {"error": "Email already exists"})
-    if User.objects.filter(username=username).exists():
-        return render(request, 'medstore_app/signup.html', {"error": "Username taken"})
-    if User.objects.filter(mobile=mobile).exists():
-        return render(request, 'medstore_app/signup.html', {"error": "Mobile already used"})
+    if identifier_type(username) != 'username':
+        return render(request, 'medstore_app/signup.html', {"error": "Username cannot be an email or mobile number"})
+    conflict = signup_conflict(email, username, mobile)
+    if conflict:
+        return render(request, 'medstore_app/signup.html', {"error": SIGNUP_CONFLICT_ERRORS[conflict]})
 
-    hashed_password = make_password(password)
-    user = User.objects.create(username=username, mobile=mobile, email=email, password=hashed_password)
+    try:
+        hashed_password = hash_password(password)
+    except PasswordCheckBusy as exc:
+        return render(request, 'medstore_app/signup.html', {"error": str(exc)})
+    try:
+        user = User.objects.create(username=username, mobile=mobile, email=email, password=hashed_password)
+    except IntegrityError:
+        # Lost a race with another signup for the same email/username/mobile.
+        return render(request, 'medstore_app/signup.html', {"error": "Account already exists"})
 
     # auto-login after signup
     resp = redirect('medstore_app:home')
-    resp.set_cookie('user_email', user.email, max_age=7*24*60*60)
+    set_user_cookie(resp, user)
     resp.delete_cookie('admin_email')
     messages.success(request, "Account created and logged in! Welcome.")
     return resp
@@ -109,11 +160,45 @@ from django.contrib import messages
 
 def logout_view(request):
     resp = redirect('medstore_app:home')
-    resp.delete_cookie('user_email')
+    resp.delete_cookie(USER_COOKIE)
     messages.info(request, "You have been logged out.")
     return resp
 
 
+@cached_view('search')
+def search(request):
+    text = (request.GET.get('q') or '').strip()
+    try:
+        category_id = int(request.GET.get('category') or 0) or None
+        limit = min(max(1, int(request.GET.get('limit') or settings.MEDSTORE_SEARCH_LIMIT)), 100)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid category or limit'}, status=400)
+    return JsonResponse({'query': text, 'results': search_medicines(text, category_id, limit)})
+
+
+@require_GET
+@conditional_catalog(personal=False)
+@cached_view('api_medicines')
+def api_medicines(request):
+    try:
+        if request.GET.get('ids'):
+            return JsonResponse(api.medicines_by_id(request.GET))
+        return JsonResponse(api.medicine_page(request.GET))
+    except api.BadQuery as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+
+@require_GET
+@conditional_catalog(personal=False)
+@cached_view('api_categories')
+def api_categories(request):
+    try:
+        return JsonResponse(api.categories(request.GET))
+    except api.BadQuery as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+
+@cached_view('about')
 def show_about_page(request):
     return render(request, 'medstore_app/about.html')
 
@@ -125,11 +210,26 @@ def show_contact_page(request):
         message_text = request.POST.get('message')
         if not (name and email and message_text):
             return render(request, 'medstore_app/contact.html', {"error": "Please fill all fields"})
-        ContactMessage.objects.create(name=name, email=email, message=message_text)
+        with transaction.atomic():
+            msg = ContactMessage.objects.create(name=name, email=email, message=message_text)
+            enqueue('contact_received', message_id=msg.id)
         return render(request, 'medstore_app/contact.html', {"success": "Message sent successfully!"})
     return render(request, 'medstore_app/contact.html')
 
 
+def my_orders(request):
+    user = request.medstore_user
+    if not user:
+        messages.error(request, 'Please login to see your orders.')
+        return redirect('medstore_app:login')
+    before, size = parse_history_args(request.GET)
+    orders, next_cursor = customer_orders(user, before, size)
+    return render(request, 'medstore_app/my_orders.html', {
+        'orders': orders,
+        'next_cursor': next_cursor,
+    })
+
+
 # -------------------------
 # Admin auth + pages
 # -------------------------
@@ -146,12 +246,15 @@ def admin_login_page(request):
         return render(request, 'medstore_app/admin_login.html', {'error': 'Please fill both fields.'})
 
     user = User.objects.filter(email=email).first()
-    if not user or email != ADMIN_EMAIL or not check_password(password, user.password):
-        return render(request, 'medstore_app/admin_login.html', {'error': 'Invalid admin login'})
+    try:
+        if not user or email != ADMIN_EMAIL or not verify_password(user, password):
+            return render(request, 'medstore_app/admin_login.html', {'error': 'Invalid admin login'})
+    except PasswordCheckBusy as exc:
+        return render(request, 'medstore_app/admin_login.html', {'error': str(exc)})
 
     resp = redirect('medstore_app:admin_dashboard')
     resp.set_cookie('admin_email', user.email, max_age=7*24*60*60)
-    resp.delete_cookie('user_email')
+    resp.delete_cookie(USER_COOKIE)
     return resp
 
 
@@ -163,23 +266,81 @@ def admin_logout(request):
 
 @admin_required
 def admin_dashboard(request):
-    total_users = User.objects.count()
-    total_products = Medicine.objects.count()
-    total_orders = Order.objects.count()
-    # NOTE: if model uses 'date' instead of 'created_at', change below to '-date'
     recent_messages = ContactMessage.objects.all().order_by('-created_at')[:5]
     return render(request, 'medstore_app/admin_dashboard.html', {
-        'total_users': total_users,
-        'total_products': total_products,
-        'total_orders': total_orders,
+        **dashboard_stats(),
         'recent_messages': recent_messages
     })
 
 
 @admin_required
 def admin_view_messages(request):
-    msgs = ContactMessage.objects.all().order_by('-created_at')
-    return render(request, 'medstore_app/admin_view_messages.html', {'messages': msgs})
+    args = parse_inbox_args(request.GET)
+    msgs, next_cursor = inbox_page(**args)
+    return render(request, 'medstore_app/admin_view_messages.html', {
+        'messages': msgs,
+        'next_cursor': next_cursor,
+        'filters': args,
+    })
+
+
+@admin_required
+def admin_mark_messages_read(request):
+    if request.method == "POST":
+        ids = [int(value) for value in request.POST.getlist('ids') if value.isdigit()]
+        if ids:
+            mark_read(ids)
+    query = request.POST.get('query') or ''
+    return redirect(reverse('medstore_app:admin_messages') + (f'?{query}' if query else ''))
+
+
+@admin_required
+def admin_low_stock(request):
+    return render(request, 'medstore_app/admin_low_stock.html', {
+        'medicines': low_stock(),
+        'threshold': settings.MEDSTORE_LOW_STOCK_THRESHOLD,
+    })
+
+
+@admin_required
+@cached_view('admin_analytics')
+def admin_analytics(request):
+    date_from, date_to = rollups.parse_range(request.GET)
+    series = rollups.daily_series(date_from, date_to)
+    return render(request, 'medstore_app/admin_analytics.html', {
+        'date_from': date_from,
+        'date_to': date_to,
+        'series': series,
+        'points': rollups.chart_points([row['revenue'] for row in series]),
+        'totals': {
+            'revenue': sum(row['revenue'] for row in series),
+            'units': sum(row['units'] for row in series),
+            'orders': sum(row['orders'] for row in series),
+        },
+        'top_medicines': rollups.top_medicines(date_from, date_to),
+        'top_categories': rollups.top_categories(date_from, date_to),
+    })
+
+
+@admin_required
+def admin_metrics(request):
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _export_format(request):
+    fmt = request.GET.get('format') or 'csv'
+    return fmt if fmt in ENCODERS else None
+
+
+@admin_required
+def admin_export_messages(request):
+    fmt = _export_format(request)
+    if not fmt:
+        return HttpResponseBadRequest('Unknown export format')
+    args = parse_report_args(request.GET)
+    inbox = parse_inbox_args(request.GET)
+    rows = message_rows(args['date_from'], args['date_to'], inbox['email'], inbox['state'])
+    return export_response('messages', fmt, MESSAGE_COLUMNS, rows)
 
 
 @admin_required
@@ -232,27 +393,23 @@ def admin_add_medicine(request):
 
 @admin_required
 def admin_view_orders(request):
-    try:
-        orders = Order.objects.all().order_by('-created_at')
-    except Exception:
-        try:
-            orders = Order.objects.all().order_by('-datetime')
-        except Exception:
-            orders = Order.objects.all().order_by('-id')
-
+    args = parse_report_args(request.GET)
+    orders, next_cursor = order_report(**args)
     return render(request, 'medstore_app/admin_view_orders.html', {
-        'orders': orders
+        'orders': orders,
+        'next_cursor': next_cursor,
+        'filters': args,
     })
 
 
 @admin_required
-def admin_view_orders(request):
-    # duplicate safe guard — keep only one definition; if you see this twice remove one
-    try:
-        orders = Order.objects.all().order_by('-created_at')
-    except Exception:
-        orders = Order.objects.all().order_by('-id')
-    return render(request, 'medstore_app/admin_view_orders.html', {'orders': orders})
+def admin_export_orders(request):
+    fmt = _export_format(request)
+    if not fmt:
+        return HttpResponseBadRequest('Unknown export format')
+    args = parse_report_args(request.GET)
+    rows = order_rows(args['status'], args['date_from'], args['date_to'])
+    return export_response('orders', fmt, ORDER_COLUMNS, rows)
 
 
 def create_order(request, med_id):
@@ -260,21 +417,11 @@ def create_order(request, med_id):
         messages.error(request, 'Invalid request method for ordering.')
         return redirect('medstore_app:home')
 
-    user_email = request.COOKIES.get('user_email')
-    if not user_email:
-        messages.error(request, 'Please login to place order.')
-        return redirect('medstore_app:login')
-
-    user = User.objects.filter(email=user_email).first()
+    user = request.medstore_user
     if not user:
-        messages.error(request, 'User not found. Please login again.')
+        messages.error(request, 'Please login to place order.')
         return redirect('medstore_app:login')
 
-    med = Medicine.objects.filter(id=med_id).first()
-    if not med:
-        messages.error(request, 'Medicine not found.')
-        return redirect('medstore_app:home')
-
     try:
         qty = int(request.POST.get('quantity', '1'))
         if qty < 1:
@@ -282,23 +429,106 @@ def create_order(request, med_id):
     except ValueError:
         qty = 1
 
-    if med.stock is not None and med.stock < qty:
-        messages.error(request, 'Not enough stock available.')
+    try:
+        # Units this visitor's cart holds count as available to them here too.
+        order = place_order(user, med_id, qty, holder=request.session.session_key)
+    except OrderRejected as exc:
+        messages.error(request, str(exc))
+        return redirect('medstore_app:home')
+    except Exception:
+        messages.error(request, 'Could not place order. Try again.')
         return redirect('medstore_app:home')
 
+    messages.success(request, f'Order placed (ID: {order.id}). Admin will process it.')
+    return redirect('medstore_app:home')
+
+
+# -------------------------
+# Cart + checkout
+# -------------------------
+def _posted_quantity(request):
     try:
-        with transaction.atomic():
-            order = Order.objects.create(user=user, total_amount=0.0, status='placed')
-            item_price = med.price
-            OrderItem.objects.create(order=order, medicine=med, quantity=qty, price=item_price)
-            order.total_amount = item_price * qty
-            order.save()
-            if med.stock is not None:
-                med.stock = max(0, med.stock - qty)
-                med.save()
+        return max(1, int(request.POST.get('quantity', '1')))
+    except ValueError:
+        return 1
+
+
+def cart_view(request):
+    cart = Cart(request.session)
+    lines = cart.lines()
+    meds = Medicine.objects.in_bulk(list(lines))
+    rows = [
+        {'medicine': meds[med_id], 'quantity': qty, 'subtotal': meds[med_id].price * qty}
+        for med_id, qty in lines.items() if med_id in meds
+    ]
+    return render(request, 'medstore_app/cart.html', {
+        'rows': rows,
+        'total': sum(r['subtotal'] for r in rows),
+    })
+
+
+def _cart_holder(request):
+    # Stock holds are keyed by session; make sure this one has a key.
+    if not request.session.session_key:
+        request.session.save()
+    return request.session.session_key
+
+
+def _hold_cart_line(request, cart, med_id, previous):
+    """Hold stock for the line's new quantity; put the line back if there is not enough."""
+    try:
+        set_holds(_cart_holder(request), {med_id: cart.lines().get(med_id, 0)})
+    except HoldRejected as exc:
+        cart.set(med_id, previous)
+        messages.error(request, str(exc))
+        return False
+    return True
+
+
+def cart_add(request, med_id):
+    if request.method != 'POST':
+        return redirect('medstore_app:cart')
+    cart = Cart(request.session)
+    previous = cart.lines().get(med_id, 0)
+    if not cart.add(med_id, _posted_quantity(request)):
+        messages.error(request, 'Your cart is full.')
+    elif _hold_cart_line(request, cart, med_id, previous):
+        messages.success(request, 'Added to cart.')
+    return redirect('medstore_app:home')
+
+
+def cart_update(request, med_id):
+    if request.method == 'POST':
+        try:
+            qty = int(request.POST.get('quantity', '0'))
+        except ValueError:
+            qty = 0
+        cart = Cart(request.session)
+        previous = cart.lines().get(med_id, 0)
+        if cart.set(med_id, qty):
+            _hold_cart_line(request, cart, med_id, previous)
+    return redirect('medstore_app:cart')
+
+
+def cart_checkout(request):
+    if request.method != 'POST':
+        return redirect('medstore_app:cart')
+
+    user = request.medstore_user
+    if not user:
+        messages.error(request, 'Please login to place order.')
+        return redirect('medstore_app:login')
+
+    cart = Cart(request.session)
+    try:
+        order = checkout(user, cart.lines(), holder=_cart_holder(request))
+    except OrderRejected as exc:
+        messages.error(request, str(exc))
+        return redirect('medstore_app:cart')
     except Exception:
         messages.error(request, 'Could not place order. Try again.')
-        return redirect('medstore_app:home')
+        return redirect('medstore_app:cart')
 
+    cart.clear()
     messages.success(request, f'Order placed (ID: {order.id}). Admin will process it.')
     return redirect('medstore_app:home')
@@ -0,0 +1,134 @@
+"""
+Database profiles.
+
+``databases()`` builds ``DATABASES`` from the environment:
+
+* SQLite (the default) runs in WAL mode, so readers never wait on the order
+  writer. WAL is a property of the database file, so the migration
+  ``0016_sqlite_wal`` switches it on once. The per-connection pragmas below
+  only tune the connection and never write to the file, so read-only
+  commands leave the database untouched. The ``replica`` alias is a second
+  connection to the same file with ``query_only`` set. Catalog and report
+  reads go there, and checkout writes keep ``default`` to themselves.
+* PostgreSQL (``MEDSTORE_DB_ENGINE=postgresql``) keeps connections open for
+  ``MEDSTORE_DB_CONN_MAX_AGE`` seconds with health checks. It gets a
+  ``replica`` alias only when ``MEDSTORE_DB_REPLICA_HOST`` is set.
+
+In tests the replica is a ``TEST['MIRROR']`` of ``default``.
+``PrimaryReplicaRouter`` sends the read-mostly models to ``replica``. Reads
+inside a transaction on ``default`` stay on ``default``, so a transaction
+always sees its own writes.
+"""
+import os
+
+REPLICA = 'replica'
+
+# Models whose reads may be served by the replica.
+REPLICA_MODELS = {
+    ('medstore_app', 'category'),
+    ('medstore_app', 'medicine'),
+    ('medstore_app', 'order'),
+    ('medstore_app', 'orderitem'),
+    ('medstore_app', 'contactmessage'),
+    ('medstore_app', 'storestat'),
+    ('medstore_app', 'dailysales'),
+    ('medstore_app', 'dailymedicinesales'),
+    ('medstore_app', 'dailycategorysales'),
+}
+
+SQLITE_PRAGMAS = {
+    # With WAL, NORMAL only risks the last transactions on power loss, never corruption.
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative: KiB rather than pages.
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def _pragmas(extra=None):
+    pragmas = dict(SQLITE_PRAGMAS, **(extra or {}))
+    return ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items())
+
+
+def sqlite_databases(path, timeout=20):
+    default = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'OPTIONS': {
+            # Take the write lock when a transaction starts so concurrent
+            # checkouts queue on the busy timeout instead of failing to upgrade.
+            'transaction_mode': 'IMMEDIATE',
+            # Seconds; this is SQLite's busy_timeout.
+            'timeout': timeout,
+            'init_command': _pragmas(),
+        },
+    }
+    replica = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'OPTIONS': {
+            'timeout': timeout,
+            'init_command': _pragmas({'query_only': 'ON'}),
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+    return {'default': default, REPLICA: replica}
+
+
+def postgresql_databases(env):
+    default = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': env.get('MEDSTORE_DB_NAME', 'medstore'),
+        'USER': env.get('MEDSTORE_DB_USER', ''),
+        'PASSWORD': env.get('MEDSTORE_DB_PASSWORD', ''),
+        'HOST': env.get('MEDSTORE_DB_HOST', ''),
+        'PORT': env.get('MEDSTORE_DB_PORT', ''),
+        'CONN_MAX_AGE': int(env.get('MEDSTORE_DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+    databases = {'default': default}
+    if env.get('MEDSTORE_DB_REPLICA_HOST'):
+        databases[REPLICA] = dict(
+            default,
+            HOST=env['MEDSTORE_DB_REPLICA_HOST'],
+            PORT=env.get('MEDSTORE_DB_REPLICA_PORT', default['PORT']),
+            OPTIONS={'options': '-c default_transaction_read_only=on'},
+            TEST={'MIRROR': 'default'},
+        )
+    return databases
+
+
+def databases(base_dir, env=os.environ):
+    if env.get('MEDSTORE_DB_ENGINE', 'sqlite') == 'postgresql':
+        return postgresql_databases(env)
+    return sqlite_databases(env.get('MEDSTORE_DB_NAME') or base_dir / 'db.sqlite3')
+
+
+class PrimaryReplicaRouter:
+    """Serve catalog and report reads from ``replica`` when it is configured."""
+
+    def db_for_read(self, model, **hints):
+        from django.conf import settings
+        from django.db import connections
+
+        if REPLICA not in settings.DATABASES:
+            return None
+        if model.__module__ == '__fake__':
+            # Historical models in migrations read the database being migrated.
+            return None
+        if (model._meta.app_label, model._meta.model_name) not in REPLICA_MODELS:
+            return None
+        if connections['default'].in_atomic_block:
+            return 'default'
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .db import databases
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,12 +44,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'medstore_app.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'medstore_app.users.CurrentUserMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -54,7 +59,8 @@ ROOT_URLCONF = 'medstore_pro.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render time recorded per request.
+        'BACKEND': 'medstore_app.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -72,11 +78,32 @@ WSGI_APPLICATION = 'medstore_pro.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# SQLite in WAL mode by default, PostgreSQL via MEDSTORE_DB_* (see medstore_pro/db.py).
+
+DATABASES = databases(BASE_DIR)
+
+DATABASE_ROUTERS = ['medstore_pro.db.PrimaryReplicaRouter']
+
+
+# Cache
+# Local memory (per process) by default. Set MEDSTORE_CACHE_BACKEND to "file"
+# or "memcached" to share one cache between processes; MEDSTORE_CACHE_LOCATION
+# is then a directory or "host:port[,host:port]". memcached needs pymemcache.
 
-DATABASES = {
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'medstore'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache')),
+    'memcached': ('django.core.cache.backends.memcached.PyMemcacheCache', '127.0.0.1:11211'),
+}
+
+_cache_backend, _cache_location = CACHE_BACKENDS[os.environ.get('MEDSTORE_CACHE_BACKEND', 'locmem')]
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': _cache_backend,
+        'LOCATION': os.environ.get('MEDSTORE_CACHE_LOCATION', _cache_location),
+        'TIMEOUT': 300,
+        'OPTIONS': {} if 'memcached' in _cache_backend else {'MAX_ENTRIES': 20000},
     }
 }
 
@@ -122,3 +149,156 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# MedStore storefront
+# Catalog pages are keyset-paginated; rendered product cards are cached
+# until the medicine row changes (see medstore_app/catalog.py).
+
+MEDSTORE_CATALOG_PAGE_SIZE = 24
+
+MEDSTORE_CATALOG_MAX_PAGE_SIZE = 100
+
+MEDSTORE_CARD_CACHE_TIMEOUT = 60 * 60
+
+MEDSTORE_REPORT_PAGE_SIZE = 50
+
+MEDSTORE_REPORT_MAX_PAGE_SIZE = 500
+
+MEDSTORE_HISTORY_PAGE_SIZE = 20
+
+MEDSTORE_HISTORY_MAX_PAGE_SIZE = 100
+
+# Order placement retries the whole transaction when the database is locked,
+# backing off exponentially (seconds) between attempts.
+
+MEDSTORE_ORDER_MAX_ATTEMPTS = 8
+
+MEDSTORE_ORDER_BACKOFF_BASE = 0.005
+
+MEDSTORE_ORDER_BACKOFF_MAX = 0.5
+
+MEDSTORE_CART_MAX_LINES = 100
+
+MEDSTORE_CART_MAX_QUANTITY = 99
+
+# Adding to the cart holds the stock this long (seconds); run
+# `manage.py release_expired_holds` every minute or so to return expired holds.
+
+MEDSTORE_HOLD_SECONDS = 15 * 60
+
+# Logged-in customers are resolved from a signed cookie through an
+# in-process LRU (entries, seconds).
+
+MEDSTORE_USER_CACHE_SIZE = 10000
+
+MEDSTORE_USER_CACHE_TTL = 300
+
+# Password hashing runs on a bounded pool; a request waits at most
+# MEDSTORE_HASH_TIMEOUT seconds for a slot.
+
+MEDSTORE_HASH_WORKERS = 4
+
+MEDSTORE_HASH_TIMEOUT = 10
+
+# Serve the async view variants (set by medstore_pro/asgi.py).
+
+MEDSTORE_ASYNC_VIEWS = os.environ.get('MEDSTORE_ASYNC_VIEWS') == '1'
+
+# Medicines at or below this stock count as low stock on the dashboard.
+
+MEDSTORE_LOW_STOCK_THRESHOLD = 10
+
+# Medicine search (FTS5 on SQLite).
+
+MEDSTORE_SEARCH_LIMIT = 20
+
+MEDSTORE_SEARCH_MAX_TERMS = 8
+
+# Rows fetched from the DB (and encoded per streamed chunk) by admin exports.
+
+MEDSTORE_EXPORT_CHUNK_SIZE = 2000
+
+# Product images (see medstore_app/images.py). Uploads live under
+# MEDSTORE_IMAGE_UPLOAD_ROOT; `manage.py process_images` writes fixed-size
+# JPEG and WebP variants under MEDSTORE_IMAGE_ROOT with content-hash names.
+# Serve that directory at MEDSTORE_IMAGE_URL from the web server with
+# `Cache-Control: public, max-age=31536000, immutable`; a changed image
+# gets a new name. Django only serves it itself when DEBUG is on.
+
+MEDSTORE_IMAGE_UPLOAD_ROOT = BASE_DIR / 'media' / 'uploads'
+
+MEDSTORE_IMAGE_ROOT = BASE_DIR / 'media' / 'products'
+
+MEDSTORE_IMAGE_URL = '/media/products/'
+
+# Variant name -> (width, height); images are cropped to fill the box.
+MEDSTORE_IMAGE_SIZES = {'thumb': (160, 160), 'card': (480, 480)}
+
+MEDSTORE_IMAGE_QUALITY = 82
+
+MEDSTORE_IMAGE_WORKERS = os.cpu_count() or 1
+
+# Background jobs (see medstore_app/jobs.py), run by `manage.py run_worker`.
+# Seconds throughout; finished jobs are kept for MEDSTORE_JOB_RETENTION.
+
+MEDSTORE_JOB_BATCH_SIZE = 50
+
+MEDSTORE_JOB_LEASE_SECONDS = 60
+
+MEDSTORE_JOB_MAX_ATTEMPTS = 5
+
+MEDSTORE_JOB_RETRY_BASE = 10
+
+MEDSTORE_JOB_RETRY_MAX = 15 * 60
+
+MEDSTORE_JOB_POLL_SECONDS = 1
+
+MEDSTORE_JOB_RETENTION = 24 * 60 * 60
+
+# Order confirmations and contact-form notifications are sent by jobs.
+
+EMAIL_BACKEND = os.environ.get('MEDSTORE_EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+
+DEFAULT_FROM_EMAIL = 'MedStore <no-reply@medstore.com>'
+
+MEDSTORE_ADMIN_NOTIFY_EMAIL = 'admin@medstore.com'
+
+# Admin inbox page size, and how many days contact messages stay in the
+# inbox before `manage.py archive_messages` moves them to the archive table.
+
+MEDSTORE_INBOX_PAGE_SIZE = 50
+
+MEDSTORE_INBOX_MAX_PAGE_SIZE = 200
+
+MEDSTORE_MESSAGE_RETENTION_DAYS = 180
+
+# Cached views (see medstore_app/viewcache.py): how long a stale response is
+# kept to serve while one request recomputes it, how long that request may
+# hold the recompute lock, and how long others wait when there is no copy.
+
+MEDSTORE_VIEW_CACHE_STALE_SECONDS = 60
+
+MEDSTORE_VIEW_CACHE_LOCK_SECONDS = 30
+
+MEDSTORE_VIEW_CACHE_WAIT_SECONDS = 5
+
+# Requests slower than this (seconds) are logged to medstore.slow_requests
+# with their repeated SQL (see medstore_app/metrics.py).
+
+MEDSTORE_SLOW_REQUEST_SECONDS = 0.5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '{asctime} {levelname} {name} {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'plain'},
+    },
+    'loggers': {
+        'medstore': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        'medstore_app': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}